@@ -0,0 +1,71 @@
+"""
+Latency of paged ticket listings.
+
+Creates N tickets in a ticket index and measures the first and the
+second page of LIMIT rows for several filters and sort orders,
+including a collection prefix that contains all tickets.
+
+    python benchmarks/listing_pages.py [N]
+"""
+import os
+import sys
+import time
+import itertools
+import threading
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dm_irods.ticket import Ticket  # noqa: E402
+from dm_irods.ticket_index import TicketIndex  # noqa: E402
+from dm_irods.listing import TicketQuery  # noqa: E402
+
+LIMIT = 50
+
+QUERIES = [({}, 'status'),
+           ({'status': ['ERROR']}, 'time'),
+           ({}, 'path'),
+           ({'collection_prefix': '/zone/home/u'}, 'status'),
+           ({'collection_prefix': '/zone/home/u'}, 'time'),
+           ({'collection_prefix': '/zone/home/u/run_0007'}, 'status'),
+           ({'collection_prefix': '/zone/home/u', 'status': ['ERROR'],
+             'mode': 'GET'}, 'status')]
+
+
+def create_index(n):
+    index = TicketIndex()
+    tickets = {}
+    statuses = [Ticket.DONE] * 9 + [Ticket.ERROR]
+    for i in range(n):
+        ticket = Ticket('/scratch/u/file_%08d.dat' % i,
+                        '/zone/home/u/run_%04d/file_%08d.dat' % (i // 1000,
+                                                                 i),
+                        mode=Ticket.GET,
+                        status=statuses[i % 10],
+                        time_created=1539179558.0 + i)
+        tickets[(ticket.local_file, ticket.remote_file)] = ticket
+        index.update(ticket)
+    return index, tickets
+
+
+def page(index, tickets, lock, flt, sort, cursor=None):
+    query = TicketQuery(flt, sort=sort, cursor=cursor)
+    rows = list(itertools.islice(query.tickets(index, tickets, lock),
+                                 LIMIT))
+    return query.cursor(rows[-1])
+
+
+def main(n):
+    index, tickets = create_index(n)
+    lock = threading.RLock()
+    print('tickets: %d, rows per page: %d' % (n, LIMIT))
+    for flt, sort in QUERIES:
+        t0 = time.time()
+        cursor = page(index, tickets, lock, flt, sort)
+        t1 = time.time()
+        page(index, tickets, lock, flt, sort, cursor)
+        t2 = time.time()
+        print('%-6s %-70s %7.1f ms %7.1f ms' % (sort, flt,
+                                                (t1 - t0) * 1000,
+                                                (t2 - t1) * 1000))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
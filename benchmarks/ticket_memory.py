@@ -0,0 +1,76 @@
+"""
+Memory used by the tickets of the daemon.
+
+Creates N tickets as they are loaded from the ticket store and keeps
+them in a dictionary keyed by (local_file, remote_file), once with the
+previous representation (an object with a per-instance __dict__ and a
+string per collection) and once with Ticket (__slots__, interned
+collections and DMF states).
+Prints the number of bytes per ticket (python 3).
+
+    python benchmarks/ticket_memory.py [N]
+"""
+import os
+import sys
+import json
+import time
+import tracemalloc
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dm_irods.ticket import Ticket  # noqa: E402
+
+
+class DictTicket(object):
+    """
+    Attributes of a ticket before __slots__ were introduced
+    """
+    def __init__(self, obj):
+        self.status = Ticket.string_to_status(obj['status'])
+        self.mode = Ticket.string_to_mode(obj['mode'])
+        for f in Ticket.fields:
+            setattr(self, f, obj.get(f, None))
+        self.last_unmig_check = time.time()
+        self.DMF_bfid = 0
+
+
+def ticket_data(n):
+    for i in range(n):
+        coll = '/surf/home/rods/project/run_%04d' % (i // 1000)
+        yield json.dumps({
+            'local_file': '/scratch/rods/data/file_%08d.dat' % i,
+            'remote_file': '%s/file_%08d.dat' % (coll, i),
+            'status': 'DONE',
+            'mode': 'GET',
+            'time_created': 1539179558.0 + i,
+            'retries': 3,
+            'checksum': 'NnVf0m1zCGR0ecp2YeMt9kA0zNpiEtpSBF0a4q3kVsQ=',
+            'transferred': 1048576,
+            'transfer_time': 1.5,
+            'remote_size': 1048576,
+            'errmsg': '',
+            'DMF_state': 'DUL'})
+
+
+def measure(n, create):
+    data = list(ticket_data(n))
+    tracemalloc.start()
+    start = tracemalloc.take_snapshot()
+    tickets = {}
+    for d in data:
+        ticket = create(json.loads(d))
+        tickets[(ticket.local_file, ticket.remote_file)] = ticket
+    loaded = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    return sum(stat.size_diff
+               for stat in loaded.compare_to(start, 'filename')) / float(n)
+
+
+def main(n):
+    before = measure(n, DictTicket)
+    after = measure(n, Ticket.from_json)
+    print('tickets:                   %d' % n)
+    print('bytes per ticket (dict):   %.0f' % before)
+    print('bytes per ticket (slots):  %.0f' % after)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
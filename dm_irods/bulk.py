@@ -0,0 +1,57 @@
+import sys
+import json
+import itertools
+from .socket_server.server import ReturnCode
+from .walk import batches
+from .cprint import print_request_error
+
+# pairs per put_many / get_many request
+REQUEST_BATCH = 10000
+
+
+def read_file_list(filename):
+    """
+    Generator over the lines of a file (- for stdin),
+    empty lines are skipped.
+    """
+    if filename == '-':
+        f = sys.stdin
+    else:
+        f = open(filename)
+    try:
+        for line in f:
+            line = line.rstrip('\n')
+            if line:
+                yield line
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def file_arguments(files, file_list=None):
+    """
+    Iterator over the files followed by the lines of file_list
+    (see read_file_list), the list is read while iterating.
+    Returns None if there are no files.
+    """
+    files = iter(files)
+    if file_list is not None:
+        files = itertools.chain(files, read_file_list(file_list))
+    first = next(files, None)
+    if first is None:
+        return None
+    return itertools.chain([first], files)
+
+
+def request_many(client, op, pairs):
+    """
+    Register [local_file, remote_file] pairs with the daemon
+    (op is put_many or get_many). The pairs are sent in batches of
+    REQUEST_BATCH; generator of the results of the tickets.
+    """
+    for batch in batches(pairs, REQUEST_BATCH):
+        for code, result in client.request_all({op: batch}):
+            if code != ReturnCode.OK:
+                print_request_error(code, result)
+                sys.exit(8)
+            yield json.loads(result)
@@ -0,0 +1,179 @@
+import os
+import json
+import time
+import shutil
+import tarfile
+import logging
+import posixpath
+import threading
+
+
+def _padded(size, block=tarfile.BLOCKSIZE):
+    return (size + block - 1) // block * block
+
+
+class _NullFile(object):
+    def write(self, data):
+        pass
+
+
+class TarSize(object):
+    """
+    Size of a tar container: the header of each member (including the
+    extended headers of long names) and its data padded to a block,
+    two empty blocks at the end and the padding to a full record.
+    """
+    def __init__(self):
+        self.tar = tarfile.open(fileobj=_NullFile(), mode='w|')
+        self.members_size = 0
+
+    def member_size(self, local_file, name):
+        info = self.tar.gettarinfo(local_file, arcname=name)
+        header = info.tobuf(self.tar.format, self.tar.encoding,
+                            self.tar.errors)
+        return len(header) + _padded(info.size)
+
+    def add(self, size):
+        self.members_size += size
+
+    def total(self, extra=0):
+        return _padded(self.members_size + extra + 2 * tarfile.BLOCKSIZE,
+                       tarfile.RECORDSIZE)
+
+
+def tar_size(members):
+    """
+    Size of the container written by write_bundle
+    """
+    size = TarSize()
+    for name, local_file in members:
+        size.add(size.member_size(local_file, name))
+    return size.total()
+
+
+def create_bundles(files, coll, bundle_size):
+    """
+    Pack files into tar containers of up to bundle_size bytes.
+
+    The members are named by their path relative to the common directory
+    of the files, they are stored below coll in the member index.
+
+    Returns a generator of (local_file, remote_file, members) where
+    members is a list of [member_name, file]. local_file is the
+    container in the common directory, it is not written to disk: the
+    daemon streams the members to the object (see write_bundle).
+    """
+    files = [os.path.abspath(f) for f in files]
+    if not files:
+        return
+    base_dir = os.path.dirname(os.path.commonprefix(files))
+    prefix = 'bundle_%s_%d' % (time.strftime('%Y%m%d%H%M%S'), os.getpid())
+    index = 0
+    size = None
+    members = []
+    for f in files:
+        name = os.path.relpath(f, base_dir).replace(os.sep, '/')
+        if size is None:
+            size = TarSize()
+        member_size = size.member_size(f, name)
+        if members and size.total(member_size) > bundle_size:
+            index += 1
+            yield _bundle(base_dir, coll, prefix, index, members)
+            size = TarSize()
+            members = []
+        size.add(member_size)
+        members.append([name, f])
+    if members:
+        index += 1
+        yield _bundle(base_dir, coll, prefix, index, members)
+
+
+def _bundle(base_dir, coll, prefix, index, members):
+    name = '%s_%04d.tar' % (prefix, index)
+    return (os.path.join(base_dir, name), posixpath.join(coll, name),
+            members)
+
+
+def write_bundle(members, fileobj, bufsize=tarfile.RECORDSIZE):
+    """
+    Write a tar container of members (list of [member_name, file])
+    to a file object in blocks of bufsize bytes.
+    """
+    with tarfile.open(fileobj=fileobj, mode='w|', bufsize=bufsize) as tar:
+        for name, local_file in members:
+            tar.add(local_file, arcname=name, recursive=False)
+
+
+class BundleIndex(object):
+    """
+    Index of the members of uploaded bundles.
+
+    Each container is described by a json file in index_dir:
+    {"container": "/zone/home/user/bundle_....tar",
+     "members": {"/zone/home/user/dir/file.dat": "dir/file.dat", ...}}
+    Retrieved containers are stored in cache_dir until the
+    requested members have been extracted.
+    """
+    def __init__(self, bundle_dir, logger=logging.getLogger("DmIRodsServer")):
+        self.index_dir = os.path.join(bundle_dir, 'index')
+        self.cache_dir = os.path.join(bundle_dir, 'cache')
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.members = {}
+        for d in [self.index_dir, self.cache_dir]:
+            if not os.path.exists(d):
+                os.makedirs(d)
+        for f in os.listdir(self.index_dir):
+            if f.endswith('.json'):
+                try:
+                    with open(os.path.join(self.index_dir, f)) as fp:
+                        self._load(json.load(fp))
+                except Exception as e:
+                    self.logger.error('failed to read bundle index %s: %s',
+                                      f, str(e))
+
+    def _load(self, data):
+        container = str(data['container'])
+        for remote_file, name in data['members'].items():
+            self.members[str(remote_file)] = (container, str(name))
+
+    def add(self, container, members):
+        """
+        Add a container with its members (list of [member_name, file]),
+        the members are stored in the collection of the container.
+        """
+        coll = posixpath.dirname(container)
+        data = {'container': container,
+                'members': {posixpath.join(coll, name): name
+                            for name, local_file in members}}
+        index_file = os.path.join(self.index_dir,
+                                  os.path.basename(container) + '.json')
+        with self.lock:
+            with open(index_file, 'w') as fp:
+                json.dump(data, fp)
+            self._load(data)
+
+    def lookup(self, remote_file):
+        """
+        Returns (container, member_name) or None
+        """
+        with self.lock:
+            return self.members.get(remote_file, None)
+
+    def cache_file(self, container):
+        return os.path.join(self.cache_dir, os.path.basename(container))
+
+    def extract(self, tar_file, members):
+        """
+        Extract members (list of [member_name, local_file])
+        """
+        with tarfile.open(tar_file, 'r') as tar:
+            for name, local_file in members:
+                self.logger.info('extract %s:%s -> %s',
+                                 tar_file, name, local_file)
+                src = tar.extractfile(name)
+                if src is None:
+                    raise IOError('%s is not a file in %s' % (name,
+                                                              tar_file))
+                with open(local_file, 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
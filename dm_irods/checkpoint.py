@@ -0,0 +1,234 @@
+import io
+import base64
+import hashlib
+import threading
+
+
+class Checkpoint(object):
+    """
+    Progress of a transfer stored in ticket.block_hashes.
+
+    The file is divided into blocks of BLOCK_SIZE bytes. When a block
+    has been transferred its SHA-256 hash is stored at the position of
+    the block (unfinished blocks are None). After a retry or restart,
+    the recorded blocks are compared with the local file and only the
+    remaining byte ranges are transferred.
+
+    While verifying, the leading verified blocks are fed into
+    prefix_hasher, so that a sequential transfer can continue the
+    checksum of the whole file without reading the file again.
+
+    Uploads of a file with a known identity (the key of the checksum
+    cache, stored in ticket.block_key) don't hash the blocks: they are
+    recorded as UNHASHED and trusted as long as the key does not change.
+    """
+    BLOCK_SIZE = 64 * 1024 * 1024
+    READ_SIZE = 1024 * io.DEFAULT_BUFFER_SIZE
+    UNHASHED = '-'
+
+    def __init__(self, ticket, callback=None):
+        self.ticket = ticket
+        self.callback = callback
+        self.lock = threading.Lock()
+        self.prefix = 0
+        self.prefix_hasher = hashlib.sha256()
+        if ticket.block_hashes is None:
+            ticket.block_hashes = []
+
+    @staticmethod
+    def digest(hasher):
+        return base64.b64encode(hasher.digest()).decode()
+
+    def reset(self):
+        with self.lock:
+            self.ticket.block_hashes = []
+            self.ticket.block_key = None
+            self.prefix = 0
+            self.prefix_hasher = hashlib.sha256()
+
+    def num_blocks(self, size):
+        return (size + Checkpoint.BLOCK_SIZE - 1) // Checkpoint.BLOCK_SIZE
+
+    def block_range(self, index, size):
+        start = index * Checkpoint.BLOCK_SIZE
+        return start, min(start + Checkpoint.BLOCK_SIZE, size)
+
+    def is_done(self, index):
+        hashes = self.ticket.block_hashes
+        return index < len(hashes) and hashes[index] is not None
+
+    def verify(self, filename, size, key=None):
+        """
+        Compare the recorded blocks with the contents of filename.
+        Blocks that don't match are dropped.
+        If key (see ChecksumCache.stat) is given and equal to the key of
+        the recorded blocks, the file is not read.
+        Returns the number of bytes that don't need to be transferred.
+        """
+        hashes = self.ticket.block_hashes[:self.num_blocks(size)]
+        if key is not None:
+            key = list(key)
+            if self.ticket.block_key == key:
+                verified = 0
+                for index, value in enumerate(hashes):
+                    if value is not None:
+                        start, end = self.block_range(index, size)
+                        verified += end - start
+                with self.lock:
+                    self.ticket.block_hashes = hashes
+                    self.prefix = 0
+                    self.prefix_hasher = hashlib.sha256()
+                return verified
+        verified = 0
+        prefix = 0
+        prefix_hasher = hashlib.sha256()
+        if any(h is not None for h in hashes):
+            try:
+                with open(filename, 'rb') as f:
+                    for index, expected in enumerate(hashes):
+                        if expected == Checkpoint.UNHASHED:
+                            # recorded for a different file
+                            hashes[index] = None
+                        if hashes[index] is None:
+                            continue
+                        start, end = self.block_range(index, size)
+                        if start == prefix:
+                            backup = prefix_hasher.copy()
+                            value = self.hash_range(f, start, end,
+                                                    prefix_hasher)
+                        else:
+                            value = self.hash_range(f, start, end)
+                        if value == expected:
+                            verified += end - start
+                            if start == prefix:
+                                prefix = end
+                        else:
+                            hashes[index] = None
+                            if start == prefix:
+                                prefix_hasher = backup
+            except IOError:
+                hashes = []
+                verified = 0
+                prefix = 0
+                prefix_hasher = hashlib.sha256()
+        with self.lock:
+            self.ticket.block_hashes = hashes
+            self.ticket.block_key = key
+            self.prefix = prefix
+            self.prefix_hasher = prefix_hasher
+        return verified
+
+    def hash_range(self, f, start, end, file_hasher=None):
+        hasher = hashlib.sha256()
+        f.seek(start)
+        pos = start
+        while pos < end:
+            chunk = f.read(min(Checkpoint.READ_SIZE, end - pos))
+            if not chunk:
+                return None
+            hasher.update(chunk)
+            if file_hasher is not None:
+                file_hasher.update(chunk)
+            pos += len(chunk)
+        return Checkpoint.digest(hasher)
+
+    def file_hasher(self, ranges, size):
+        """
+        Hasher for the checksum of the whole file if the rest of the file
+        is transferred sequentially after the verified prefix,
+        None otherwise.
+        """
+        if ranges == [(self.prefix, size)] or (not ranges and
+                                                self.prefix == size):
+            return self.prefix_hasher
+        else:
+            return None
+
+    def extent(self, size):
+        """
+        End of the last recorded block
+        """
+        hashes = self.ticket.block_hashes
+        for index in range(len(hashes) - 1, -1, -1):
+            if hashes[index] is not None:
+                return self.block_range(index, size)[1]
+        return 0
+
+    def pending_ranges(self, stripes):
+        """
+        Remove the recorded blocks at the beginning of each stripe.
+        Stripes must be aligned to BLOCK_SIZE.
+        """
+        ret = []
+        for start, end in stripes:
+            while start < end and self.is_done(start //
+                                               Checkpoint.BLOCK_SIZE):
+                start += Checkpoint.BLOCK_SIZE
+            if start < end:
+                ret.append((start, end))
+        return ret
+
+    def block_hasher(self, start, flush=None):
+        return BlockHasher(self, start, flush)
+
+    def commit(self, index, value):
+        with self.lock:
+            hashes = self.ticket.block_hashes
+            if len(hashes) <= index:
+                hashes.extend([None] * (index + 1 - len(hashes)))
+            hashes[index] = value
+            if self.callback is not None:
+                self.callback()
+
+
+class BlockHasher(object):
+    """
+    Hashes the bytes of one stream starting at a block boundary and
+    commits each completed block to the checkpoint.
+    flush is called before a block is committed.
+    """
+    def __init__(self, checkpoint, start, flush=None):
+        if start % Checkpoint.BLOCK_SIZE != 0:
+            raise ValueError('stream does not start at block boundary')
+        self.checkpoint = checkpoint
+        self.index = start // Checkpoint.BLOCK_SIZE
+        self.flush = flush
+        if checkpoint.ticket.block_key is None:
+            self.hasher = hashlib.sha256()
+        else:
+            self.hasher = None
+        self.filled = 0
+
+    def update(self, chunk):
+        pos = 0
+        while pos < len(chunk):
+            n = min(len(chunk) - pos, Checkpoint.BLOCK_SIZE - self.filled)
+            if self.hasher is None:
+                pass
+            elif n == len(chunk):
+                self.hasher.update(chunk)
+            else:
+                self.hasher.update(chunk[pos:pos + n])
+            self.filled += n
+            pos += n
+            if self.filled == Checkpoint.BLOCK_SIZE:
+                self.commit()
+
+    def finish(self):
+        """
+        Commit the last (incomplete) block at the end of the file
+        """
+        if self.filled > 0:
+            self.commit()
+
+    def commit(self):
+        if self.flush is not None:
+            self.flush()
+        if self.hasher is None:
+            self.checkpoint.commit(self.index, Checkpoint.UNHASHED)
+        else:
+            self.checkpoint.commit(self.index,
+                                   Checkpoint.digest(self.hasher))
+            self.hasher = hashlib.sha256()
+        self.index += 1
+        self.filled = 0
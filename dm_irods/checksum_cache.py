@@ -0,0 +1,104 @@
+import os
+import json
+import logging
+import threading
+
+
+class ChecksumCache(object):
+    """
+    Persistent cache of local file checksums.
+
+    Entries are keyed by (device, inode) and are only valid while size
+    and modification time (ns) of the file are unchanged. The cache is
+    stored as an append-only log of json lines
+    [dev, ino, size, mtime_ns, checksum]; the last line of an inode
+    wins. The log is compacted at startup when it contains more than
+    twice as many lines as entries.
+    """
+    def __init__(self, cache_file, logger=logging.getLogger("DmIRodsServer")):
+        self.cache_file = cache_file
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.entries = {}
+        lines = 0
+        if os.path.isfile(cache_file):
+            try:
+                with open(cache_file) as fp:
+                    for line in fp:
+                        lines += 1
+                        try:
+                            dev, ino, size, mtime, checksum = json.loads(line)
+                        except ValueError:
+                            # incomplete last line
+                            continue
+                        self.entries[(dev, ino)] = (size, mtime,
+                                                    str(checksum))
+            except Exception as e:
+                self.logger.warning('cannot read checksum cache %s: %s',
+                                    cache_file, str(e))
+        if lines > 2 * len(self.entries):
+            self.compact()
+
+    @staticmethod
+    def stat(filename):
+        """
+        Returns the cache key (dev, ino, size, mtime_ns) of a file
+        """
+        st = os.stat(filename)
+        mtime = getattr(st, 'st_mtime_ns', None)
+        if mtime is None:
+            mtime = int(st.st_mtime * 1000000000)
+        return (st.st_dev, st.st_ino, st.st_size, mtime)
+
+    def lookup(self, filename):
+        """
+        Returns the checksum of an unchanged file or None
+        """
+        try:
+            dev, ino, size, mtime = ChecksumCache.stat(filename)
+        except OSError:
+            return None
+        with self.lock:
+            entry = self.entries.get((dev, ino), None)
+        if entry is not None and entry[0] == size and entry[1] == mtime:
+            return entry[2]
+        return None
+
+    def add(self, filename, checksum, key=None):
+        """
+        Store the checksum of a file. key is the result of stat()
+        before the file has been read: if the file has been modified
+        since then, the checksum is not stored.
+        """
+        try:
+            current = ChecksumCache.stat(filename)
+        except OSError:
+            return
+        if key is not None and tuple(key) != current:
+            self.logger.info('%s has been modified while hashing', filename)
+            return
+        dev, ino, size, mtime = current
+        with self.lock:
+            if self.entries.get((dev, ino)) == (size, mtime, checksum):
+                return
+            self.entries[(dev, ino)] = (size, mtime, checksum)
+            try:
+                with open(self.cache_file, 'a') as fp:
+                    fp.write(json.dumps([dev, ino, size, mtime,
+                                         checksum]) + '\n')
+            except Exception as e:
+                self.logger.warning('cannot write checksum cache %s: %s',
+                                    self.cache_file, str(e))
+
+    def compact(self):
+        tmp_file = self.cache_file + '.tmp'
+        with self.lock:
+            try:
+                with open(tmp_file, 'w') as fp:
+                    for (dev, ino), entry in self.entries.items():
+                        fp.write(json.dumps([dev, ino] + list(entry)) +
+                                 '\n')
+                os.rename(tmp_file, self.cache_file)
+            except Exception as e:
+                self.logger.warning('cannot write checksum cache %s: %s',
+                                    self.cache_file, str(e))
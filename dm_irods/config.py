@@ -67,6 +67,16 @@ class DmIRodsConfig(object):
     Configuration of the dmf-irods-client.
     Load configuration from ~/.DmIRodServer/config.json
     """
+    # tuning parameters that are not asked interactively
+    OPTIONAL_KEYS = ['get_workers',
+                     'put_workers',
+                     'stripe_streams',
+                     'stripe_threshold',
+                     'auto_tune',
+                     'session_pool_size',
+                     'max_sessions',
+                     'hash_workers',
+                     'dmf_cache_ttl']
 
     def __init__(self, logger=logging.getLogger('dm_iclient')):
         home_dir = os.path.expanduser("~")
@@ -154,6 +164,11 @@ class DmIRodsConfig(object):
                    'resource_name': _get_resource_name(config),
                    'housekeeping': _get_housekeeping(config),
                    'stop_timeout': _get_stop_timeout(config)}
+            for k in DmIRodsConfig.OPTIONAL_KEYS:
+                if config.get(k, None) is not None:
+                    cfg[k] = config[k]
+                elif k in self.config:
+                    cfg[k] = self.config[k]
             dirname = os.path.dirname(self.config_file)
             if not os.path.exists(dirname):
                 self.logger.info('mkdir %s', dirname)
@@ -231,6 +246,46 @@ def dm_iconfig(argv=sys.argv[1:]):
                                   help=('remove old jobs after this time ' +
                                         '(hours, default=24)'),
                                   type=int)
+    cfg_transfer_group = parser.add_argument_group('Transfer configuration')
+    cfg_transfer_group.add_argument('--get_workers', type=int,
+                                    help=('number of concurrent downloads ' +
+                                          '(default 4)'))
+    cfg_transfer_group.add_argument('--put_workers', type=int,
+                                    help=('number of concurrent uploads ' +
+                                          '(default 2)'))
+    cfg_transfer_group.add_argument('--stripe_streams', type=int,
+                                    help=('number of parallel streams for ' +
+                                          'large objects (default 4, ' +
+                                          '1 = no striping)'))
+    cfg_transfer_group.add_argument('--stripe_threshold', type=int,
+                                    help=('minimal object size for ' +
+                                          'striped transfer ' +
+                                          '(MB, default 1024)'))
+    auto_tune_group = cfg_transfer_group.add_mutually_exclusive_group()
+    auto_tune_group.add_argument('--auto_tune', action='store_true',
+                                 default=None,
+                                 help=('adapt block size and number of ' +
+                                       'streams to the measured ' +
+                                       'throughput'))
+    auto_tune_group.add_argument('--no-auto_tune', action='store_false',
+                                 dest='auto_tune', default=None,
+                                 help='use fixed block size and streams')
+    cfg_transfer_group.add_argument('--session_pool_size', type=int,
+                                    help=('number of idle iRODS sessions ' +
+                                          'kept by the daemon (default 8)'))
+    cfg_transfer_group.add_argument('--max_sessions', type=int,
+                                    help=('maximal number of iRODS ' +
+                                          'sessions used by the daemon ' +
+                                          'at the same time (default 32)'))
+    cfg_transfer_group.add_argument('--hash_workers', type=int,
+                                    help=('number of threads that ' +
+                                          'precompute checksums of queued ' +
+                                          'striped uploads ' +
+                                          '(default 2, 0 = off)'))
+    cfg_transfer_group.add_argument('--dmf_cache_ttl', type=int,
+                                    help=('seconds the DMF state of an ' +
+                                          'object is cached by the daemon ' +
+                                          '(default 60)'))
 
     args = parser.parse_args(argv)
     config = DmIRodsConfig(logger=init_logger())
@@ -245,7 +300,8 @@ def dm_iconfig(argv=sys.argv[1:]):
                                                'housekeeping',
                                                'resource_name',
                                                'connection_timeout',
-                                               'stop_timeout']
+                                               'stop_timeout'] +
+                                     DmIRodsConfig.OPTIONAL_KEYS
                                      if getattr(args, k) is not None})
 
 
@@ -0,0 +1,254 @@
+import time
+import logging
+import threading
+import itertools
+import collections
+from .walk import batches
+
+
+class _Flight(object):
+    """
+    A rule query in progress for a set of objects
+    """
+    def __init__(self, remote_files):
+        self.done = threading.Event()
+        self.remote_files = remote_files
+        self.remaining = set(remote_files)
+        self.results = {}
+        self.error = None
+        self.stale = set()
+
+
+class _Chunk(object):
+    """
+    Up to BATCH items of a listing with the sources of their results
+    """
+    def __init__(self, items):
+        self.items = items
+        # cached results
+        self.results = {}
+        # remote_file -> _Flight of another chunk or listing
+        self.waiting = {}
+        # objects queried by this chunk
+        self.flight = None
+
+    def lookup(self, remote_file):
+        if remote_file in self.results:
+            return self.results[remote_file]
+        flight = self.waiting.get(remote_file, self.flight)
+        if flight.error is not None:
+            raise flight.error
+        return flight.results.get(remote_file, None)
+
+
+class _Listing(object):
+    """
+    The query of the objects of one process_all call that are not
+    cached. The items are split into chunks while the query reads its
+    input, the rows of the query complete the flights of the chunks.
+    """
+    def __init__(self, cache, items, query):
+        self.cache = cache
+        self.chunks = collections.deque()
+        # remote_file -> _Flight of this listing without a row yet
+        self.owner = {}
+        self.requests = self._requests(items)
+        self.query = query
+        # the query is started with the first object that is not cached
+        self.rows = None
+        self.exhausted = False
+
+    def _requests(self, items):
+        for batch in batches(items, DmfCache.BATCH):
+            chunk = self.cache._claim(batch)
+            self.chunks.append(chunk)
+            if chunk.flight is not None:
+                for remote_file in sorted(chunk.flight.remote_files):
+                    self.owner[remote_file] = chunk.flight
+                    yield {'remote_file': remote_file}
+
+    def pull(self):
+        """
+        Read the next row of the query, returns False at the end
+        """
+        if self.exhausted:
+            return False
+        try:
+            if self.rows is None:
+                first = next(self.requests)
+                self.rows = iter(self.query(itertools.chain([first],
+                                                            self.requests)))
+            row = next(self.rows)
+        except StopIteration:
+            self.exhausted = True
+            # chunks that the query did not read
+            for request in self.requests:
+                pass
+            # objects without a row have no DMF data
+            self.finish_all()
+            return False
+        remote_file = row.get('remote_file')
+        flight = self.owner.pop(remote_file, None)
+        if flight is not None:
+            flight.results[remote_file] = row
+            flight.remaining.discard(remote_file)
+            if not flight.remaining:
+                self.cache._finish(flight)
+        return True
+
+    def wait(self, flight):
+        # the rows of this listing are read while waiting: the other
+        # listing may wait for a flight of this listing
+        while not flight.done.is_set():
+            if not self.pull():
+                flight.done.wait()
+
+    def finish_all(self, error=None, store=True):
+        for flight in set(self.owner.values()):
+            self.cache._finish(flight, error, store)
+        self.owner = {}
+
+    def close(self):
+        if self.rows is not None and hasattr(self.rows, 'close'):
+            self.rows.close()
+
+
+class DmfCache(object):
+    """
+    Cache of the DMF state of objects, keyed by remote path.
+
+    The DMF state changes slowly compared to the refresh rate of
+    dm_ilist --watch, so the results of the rule are kept for ttl seconds.
+    Objects that are not in the cache are queried with one query call
+    per listing, its rows are returned while the query continues. If an
+    object is being queried by another request at the same
+    time, the request waits for that result instead of querying the same
+    object again (single flight).
+
+    Entries are invalidated when the daemon has transferred an object.
+    """
+    TTL = 60
+    BATCH = 1000
+
+    def __init__(self, ttl=None, logger=logging.getLogger("DmIRodsServer")):
+        if ttl is None:
+            ttl = DmfCache.TTL
+        self.ttl = ttl
+        self.logger = logger
+        self.lock = threading.Lock()
+        # remote_file -> (time fetched, rule result)
+        self.entries = {}
+        # remote_file -> _Flight
+        self.inflight = {}
+
+    def invalidate(self, remote_file):
+        with self.lock:
+            self.entries.pop(remote_file, None)
+            flight = self.inflight.get(remote_file, None)
+            if flight is not None:
+                # the state may have changed while the rule was running
+                flight.stale.add(remote_file)
+
+    def evict_expired(self, now=None):
+        if now is None:
+            now = time.time()
+        with self.lock:
+            expired = [remote_file
+                       for remote_file, (t, data) in self.entries.items()
+                       if now - t >= self.ttl]
+            for remote_file in expired:
+                del self.entries[remote_file]
+        return len(expired)
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+    def process_all(self, items, query):
+        """
+        Generator over the items updated with their DMF state
+        (same order as items).
+
+        items -- dicts with remote_file
+        query -- function that queries an iterable of items and
+                 returns them in the same order (a generator),
+                 e.g. GetDmfObject(irods).process_all
+
+        The items are handled in chunks of BATCH items. The objects of
+        all chunks that are not cached are passed to a single query
+        call, so that the query can run the next rules while the rows
+        of the first ones are returned.
+        """
+        listing = _Listing(self, items, query)
+        try:
+            while True:
+                if not listing.chunks:
+                    if not listing.pull() and not listing.chunks:
+                        return
+                    continue
+                chunk = listing.chunks[0]
+                if chunk.flight is not None:
+                    listing.wait(chunk.flight)
+                for flight in chunk.waiting.values():
+                    listing.wait(flight)
+                listing.chunks.popleft()
+                for item in chunk.items:
+                    data = chunk.lookup(item.get('remote_file'))
+                    if data is not None:
+                        item.update(data)
+                    yield item
+        except GeneratorExit:
+            # nothing is cached for the objects of an abandoned query
+            listing.finish_all(store=False)
+            raise
+        except Exception as e:
+            listing.finish_all(error=e)
+            raise
+        finally:
+            listing.close()
+
+    def _claim(self, items):
+        """
+        Chunk of items with the cached results, the flights of other
+        queries and a new flight for the remaining objects
+        """
+        chunk = _Chunk(items)
+        own = set()
+        now = time.time()
+        with self.lock:
+            for item in items:
+                remote_file = item.get('remote_file')
+                if (remote_file in chunk.results or
+                        remote_file in chunk.waiting or
+                        remote_file in own):
+                    continue
+                entry = self.entries.get(remote_file, None)
+                if entry is not None and now - entry[0] < self.ttl:
+                    chunk.results[remote_file] = entry[1]
+                elif remote_file in self.inflight:
+                    chunk.waiting[remote_file] = self.inflight[remote_file]
+                else:
+                    own.add(remote_file)
+            if own:
+                chunk.flight = _Flight(own)
+                for remote_file in own:
+                    self.inflight[remote_file] = chunk.flight
+        return chunk
+
+    def _finish(self, flight, error=None, store=True):
+        """
+        Store the results of a flight and wake up its waiters
+        """
+        if flight.done.is_set():
+            return
+        now = time.time()
+        with self.lock:
+            for remote_file in flight.remote_files:
+                if self.inflight.get(remote_file, None) is flight:
+                    del self.inflight[remote_file]
+                if (store and error is None and
+                        remote_file not in flight.stale):
+                    self.entries[remote_file] = (
+                        now, flight.results.get(remote_file, {}))
+        flight.error = error
+        flight.done.set()
@@ -6,29 +6,48 @@ from .server import ensure_daemon_is_running
 from .server import DmIRodsServer
 from .socket_server.client import Client
 from .socket_server.server import ReturnCode
+from .bulk import file_arguments
+from .bulk import request_many
 from .cprint import print_request_error
 
 
 def dm_iget(argv=sys.argv[1:]):
     parser = ArgumentParser(description='Get files from archive.')
-    parser.add_argument('files', type=str, nargs='+', help='files')
+    parser.add_argument('files', type=str, nargs='*', help='files')
+    parser.add_argument('--from', type=str, dest='file_list',
+                        help='read the files from a file (- for stdin)')
     parser.add_argument('--dir', type=str, default=os.getcwd(),
                         help='target directory (default cwd)')
+    parser.add_argument('-r', '--recursive', action='store_true',
+                        help=('get collections and their contents ' +
+                              '(files are interpreted as collections)'))
     args = parser.parse_args(argv)
+    files = file_arguments(args.files, args.file_list)
+    if files is None:
+        parser.error('no files given')
     ensure_daemon_is_running()
     client = Client(DmIRodsServer.get_socket_file())
-    lst = []
-    for f in args.files:
-        local_file = os.path.join(args.dir, os.path.basename(f))
-        code, result = client.request({"get": f,
-                                       "local_file": local_file})
-        if code != ReturnCode.OK:
-            print_request_error(code, result)
-            sys.exit(8)
-        lst += [json.loads(result)]
     fmt = '{0: <20}{1: <40}'
     print(fmt.format("STATUS", "FILE"))
-    for item in lst:
+    if args.recursive:
+        # the collections are enumerated by the daemon
+        for f in files:
+            local_dir = os.path.join(os.path.abspath(args.dir),
+                                     os.path.basename(f.rstrip('/')))
+            for code, result in client.request_all({"get": f,
+                                                    "local_file": local_dir,
+                                                    "recursive": True}):
+                if code != ReturnCode.OK:
+                    print_request_error(code, result)
+                    sys.exit(8)
+                item = json.loads(result)
+                print(fmt.format(item.get('msg', ''),
+                                 item.get('file', '')))
+        return
+    local_dir = os.path.abspath(args.dir)
+    pairs = ([os.path.join(local_dir, os.path.basename(f)), f]
+             for f in files)
+    for item in request_many(client, 'get_many', pairs):
         print(fmt.format(item.get('msg', ''),
                          item.get('file', '')))
 
@@ -0,0 +1,120 @@
+import sys
+import logging
+import threading
+from .ticket import sha256_checksum
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+
+def _hash_file(filename):
+    """
+    Returns (checksum, None) or (None, error message)
+    """
+    try:
+        checksum = sha256_checksum(filename)
+    except Exception as e:
+        return None, str(e)
+    if sys.version_info[0] == 2:
+        return checksum, None
+    else:
+        return checksum.decode(), None
+
+
+class HashingPool(object):
+    """
+    Precompute checksums of local files in a pool of threads.
+
+    The results are stored in the checksum cache, where the transfer
+    picks them up. hashlib releases the GIL while hashing, so the
+    threads do not need processes (which would be forked from the
+    multithreaded daemon). At most `workers` files are read and hashed
+    at the same time. Up to max_queue files can be waiting or in
+    progress; submit returns False when the queue is full. The threads
+    are started with the first submit.
+    """
+    WORKERS = 2
+    MAX_QUEUE = 64
+
+    def __init__(self, checksum_cache, workers=None, max_queue=None,
+                 logger=logging.getLogger("DmIRodsServer")):
+        if workers is None:
+            workers = HashingPool.WORKERS
+        if max_queue is None:
+            max_queue = HashingPool.MAX_QUEUE
+        self.checksum_cache = checksum_cache
+        self.workers = max(1, int(workers))
+        self.max_queue = max(1, int(max_queue))
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.queue = queue.Queue()
+        self.threads = []
+        self.hash_file = _hash_file
+
+    def submit(self, filename):
+        """
+        Queue a file for hashing unless it is queued already or its
+        checksum is cached. Returns False if the queue is full.
+        """
+        with self.lock:
+            if filename in self.pending:
+                return True
+            if len(self.pending) >= self.max_queue:
+                return False
+        if self.checksum_cache.lookup(filename) is not None:
+            return True
+        try:
+            key = self.checksum_cache.stat(filename)
+        except OSError:
+            return True
+        with self.lock:
+            if not self.threads:
+                for i in range(self.workers):
+                    t = threading.Thread(target=self._run)
+                    t.daemon = True
+                    t.start()
+                    self.threads.append(t)
+            self.pending.add(filename)
+        self.queue.put((filename, key))
+        return True
+
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            filename, key = job
+            with self.lock:
+                if filename not in self.pending:
+                    # dropped by shutdown
+                    continue
+            checksum, errmsg = self.hash_file(filename)
+            self._done(filename, key, checksum, errmsg)
+
+    def _done(self, filename, key, checksum, errmsg):
+        if checksum is None:
+            self.logger.warning('failed to hash %s: %s', filename, errmsg)
+        else:
+            self.checksum_cache.add(filename, checksum, key)
+        with self.lock:
+            self.pending.discard(filename)
+
+    def num_pending(self):
+        with self.lock:
+            return len(self.pending)
+
+    def shutdown(self):
+        """
+        Drop the queued files and stop the threads after the files that
+        are being hashed.
+        """
+        with self.lock:
+            threads = self.threads
+            self.threads = []
+            self.pending = set()
+        for t in threads:
+            self.queue.put(None)
+        for t in threads:
+            t.join()
@@ -6,27 +6,56 @@ import hashlib
 import datetime
 import time
 import json
+import threading
+import collections
 from irods.session import iRODSSession
 from irods.models import Collection
 from irods.models import DataObject
 from irods.models import Resource
 from irods.rule import Rule
+from irods.column import Like
+from irods.column import Criterion
 from irods import keywords as kw
+from irods.exception import NetworkException
+from .checkpoint import Checkpoint
+from .pipeline import Pipeline
+from .rule_batch import RuleBatchSize
+from .rule_batch import isolate_failures
+from .rule_batch import process_batches
+from .rule_batch import split_batches
+from .listing import object_criteria
 
 
 PUT_BLOCK_SIZE = 1024 * io.DEFAULT_BUFFER_SIZE
 GET_BLOCK_SIZE = 1024 * io.DEFAULT_BUFFER_SIZE
 
+# objects larger than STRIPE_THRESHOLD are transferred
+# with STRIPE_STREAMS parallel streams
+STRIPE_STREAMS = 4
+STRIPE_THRESHOLD = 1024 * 1024 * 1024
+
+# rows per GenQuery round trip of list_objects
+LIST_PAGE_SIZE = 1000
+
 
 class GetDmfObject(object):
     MAX_RULE_SIZE = 20000
 
+    # rule calls in flight at the same time
+    PARALLEL = 4
+
+    # shared by all rule calls of the daemon
+    batch_size = RuleBatchSize(MAX_RULE_SIZE)
+
     """
     Rule executer for query the DMF state
     """
-    def __init__(self, irods):
+    def __init__(self, irods, parallel=None):
+        if parallel is None:
+            parallel = GetDmfObject.PARALLEL
         self.irods = irods
         self.logger = irods.logger
+        self.parallel = max(1, parallel)
         if irods.is_resource_server:
             self.msi_name = "msiGetDmfObject"
         else:
@@ -73,9 +102,18 @@ class GetDmfObject(object):
 
         items -- A list of dicts with irods paths
 
+        The objects are queried in batches of up to MAX_RULE_SIZE
+        bytes (adapted to latency and failures by batch_size). Up to
+        `parallel` batches are executed at the same time, each with a
+        session borrowed from the (bounded) session pool, while the rows
+        of the first batch are returned. Batches for which no session is
+        available are executed with the main session. Objects that make
+        the rule fail get a DMF_error instead of the DMF state.
+
         Returns:
 
-        A list of dictionaries with mixed DMF and iRODS information.
+        A generator over the items (in the same order) updated with
+        mixed DMF and iRODS information.
 
         Example:
         [{'DMF_bfid': '0',
@@ -88,53 +126,94 @@ class GetDmfObject(object):
           ...},
         ...]
         """
+        return process_batches(self.batches(items), self.query,
+                               self.irods.session,
+                               lambda: self.irods.acquire_session(
+                                   block=False),
+                               self.irods.release_session,
+                               self.parallel)
+
+    def batches(self, items):
+        """
+        Split the items into lists whose rule argument has about
+        batch_size bytes
+        """
+        return split_batches(items, GetDmfObject.batch_size.size)
 
-        irods_object_list = ''
-        buff = {}
-        for item in items:
-            if irods_object_list == '':
-                irods_object_list = 'list('
-            else:
-                irods_object_list += ','
-            obj_path = item.get('remote_file')
-            p = (obj_path, item.get('local_file'))
-            buff[p] = item
-            irods_object_list += '"{0}"'.format(obj_path)
-            if len(irods_object_list) >= GetDmfObject.MAX_RULE_SIZE:
-                irods_object_list += ')'
-                for item2 in self.flush(irods_object_list, buff):
-                    yield item2
-                irods_object_list = ''
-                buff = {}
-        if irods_object_list != '':
-            irods_object_list += ')'
-            for item2 in self.flush(irods_object_list, buff):
-                yield item2
-
-    def flush(self, irods_object_list, buff):
+    def query(self, batch, session):
+        """
+        Execute the rule for a batch. If the rule fails, the batch is
+        split to isolate the failing items, which get a DMF_error.
+        Failures that do not depend on the items are raised.
+        """
+        nbytes = sum(len(item.get('remote_file')) + 3 for item in batch)
+        t0 = time.time()
+        try:
+            failures = isolate_failures(
+                batch, lambda part: self.flush(part, session),
+                fatal=(NetworkException,))
+        except NetworkException:
+            GetDmfObject.batch_size.report(nbytes, time.time() - t0,
+                                           failed=True)
+            raise
+        if failures:
+            self.logger.warning('DMF rule failed for %d of %d objects',
+                                len(failures), len(batch))
+            for item, e in failures:
+                self.logger.error('failed to get DMF state of %s: %s',
+                                  item.get('remote_file'), str(e))
+                item['DMF_error'] = str(e)
+        else:
+            GetDmfObject.batch_size.report(nbytes, time.time() - t0)
+        return batch
+
+    def flush(self, batch, session):
+        """
+        Execute the rule for a list of items and update the items
+        with the results
+        """
+        irods_object_list = ('list(' +
+                             ','.join('"{0}"'.format(item.get('remote_file'))
+                                      for item in batch) +
+                             ')')
         rule_code = ("getDmf {\n" +
                      " *lst=" + irods_object_list + ";\n" +
                      " *res=\"\";\n" +
                      " " + self.msi_name + "(*lst, *res);\n" +
                      "}\n")
-        myrule = Rule(self.irods.session,
+        myrule = Rule(session,
                       body=rule_code,
                       output="*res")
         try:
             res = myrule.execute()
-        except Exception as e:
-            self.logger.error(str(e))
+        except Exception:
             for line in rule_code.split('\n'):
-                self.logger.error(line)
-            self.logger.error('*lst: "{0}"'.format(irods_object_list))
+                self.logger.debug(line)
             raise
         dmf_values = {obj['objPath']: obj
                       for obj in json.loads(self.get_rule_return_value(res,
                                                                        0))}
-        for p in buff.keys():
-            if p[0] in dmf_values:
-                buff[p].update(self.transform(dmf_values[p[0]]))
-        return buff.values()
+        for item in batch:
+            obj = dmf_values.get(item.get('remote_file'), None)
+            if obj is not None:
+                item.update(self.transform(obj))
+        return batch
+
+
+class _StreamWriter(object):
+    """
+    File object that writes to an object, feeds a hasher and reports
+    the progress
+    """
+    def __init__(self, fout, hasher, progress):
+        self.fout = fout
+        self.hasher = hasher
+        self.progress = progress
+
+    def write(self, data):
+        self.fout.write(data)
+        self.hasher.update(data)
+        self.progress(len(data))
 
 
 class iRODS(object):
@@ -148,13 +227,23 @@ class iRODS(object):
                  logger=logging.getLogger("DmIRodsServer"),
                  connection_timeout=None,
                  resource_name=None,
-                 is_resource_server=None):
+                 is_resource_server=None,
+                 stripe_streams=None,
+                 stripe_threshold=None,
+                 tuner=None,
+                 tuning_key=None,
+                 session_pool=None,
+                 checksum_cache=None):
         if connection_timeout is None:
             connection_timeout = 10
         if resource_name is None:
             resource_name = 'arcRescSURF01'
         if is_resource_server is None:
             is_resource_server = False
+        if stripe_streams is None:
+            stripe_streams = STRIPE_STREAMS
+        if stripe_threshold is None:
+            stripe_threshold = STRIPE_THRESHOLD
         if logger is None:
             logger = logging.getLogger("DmIRodsServer"),
         self.is_resource_server = is_resource_server
@@ -164,17 +253,72 @@ class iRODS(object):
         self.logger = logger
         self.irods_config_file = irods_config_file
         self.irods_auth_file = irods_auth_file
+        self.stripe_streams = max(1, int(stripe_streams))
+        self.stripe_threshold = int(stripe_threshold)
+        self.tuner = tuner
+        self.tuning_key = tuning_key
+        self.progress_lock = threading.Lock()
+        self.session_pool = session_pool
+        self.checksum_cache = checksum_cache
+        self.session_failed = False
 
     def __enter__(self):
+        self.session = self.acquire_session()
+        self.session_failed = False
+        return self
+
+    def create_session(self):
+        """
+        Create and authenticate a new iRODS session
+        """
         auth_file = self.irods_auth_file
         env_file = self.irods_config_file
-        self.session = iRODSSession(irods_env_file=env_file,
-                                    irods_authentication_file=auth_file)
-        self.session.connection_timeout = self.connection_timeout
-        return self
+        session = iRODSSession(irods_env_file=env_file,
+                               irods_authentication_file=auth_file)
+        session.connection_timeout = self.connection_timeout
+        session.default_resource = self.resource_name
+        return session
+
+    @staticmethod
+    def check_session(session):
+        """
+        Liveness check of a pooled session (one GenQuery round trip)
+        """
+        query = session.query(Collection.name)
+        query = query.filter(Collection.name == '/')
+        list(query.limit(1).get_results())
+
+    def acquire_session(self, block=True):
+        """
+        Borrow a session from the session pool or create a new one.
+        Returns None if block is False and the pool has no session
+        available.
+        """
+        if self.session_pool is None:
+            return self.create_session()
+        return self.session_pool.acquire(block=block)
+
+    def release_session(self, session, discard=False):
+        if self.session_pool is None:
+            session.cleanup()
+        else:
+            self.session_pool.release(session, discard=discard)
+
+    def invalidate(self):
+        """
+        Mark the session as broken (e.g. after a NetworkException),
+        it is closed instead of being returned to the pool.
+        """
+        self.session_failed = True
 
     def __exit__(self, exc_type, exc_value, traceback):
-        self.session.cleanup()
+        # a generator that has been abandoned inside the with block
+        # (GeneratorExit) may have left a query open on the session
+        discard = (self.session_failed or
+                   (exc_type is not None and
+                    issubclass(exc_type, (NetworkException,
+                                          GeneratorExit))))
+        self.release_session(self.session, discard=discard)
 
     def get_rule_return_value(self, res, index):
         """
@@ -195,117 +339,465 @@ class iRODS(object):
                 hasher.update(chunk)
         return base64.b64encode(hasher.digest())
 
-    def list_objects(self, filters={}, limit=-1):
-        session = self.session
-        fields = {
-            'collection': Collection.name,
-            'object': DataObject.name,
-            'resource_value': Resource.name,
-            'remote_replica_number': DataObject.replica_number,
-            'remote_version': DataObject.version,
-            'remote_type': DataObject.type,
-            'remote_size': DataObject.size,
-            'remote_owner_name': DataObject.owner_name,
-            'remote_owner_zone': DataObject.owner_zone,
-            'remote_replica_status': DataObject.replica_status,
-            'remote_status': DataObject.status,
-            'remote_checksum': DataObject.checksum,
-            'remote_expiry': DataObject.expiry,
-            'remote_create_time': DataObject.create_time,
-            'remote_modify_time': DataObject.modify_time
-        }
-        query = session.query(*fields.values())
-        query = query.filter(Resource.name == self.resource_name)
-        for k, value in filters.items():
-            query = query.filter(fields[k] == value)
-        query = query.order_by(Collection.name, DataObject.name)
+    # columns of list_objects
+    OBJECT_FIELDS = [('collection', Collection.name),
+                     ('object', DataObject.name),
+                     ('resource_value', Resource.name),
+                     ('remote_replica_number', DataObject.replica_number),
+                     ('remote_version', DataObject.version),
+                     ('remote_type', DataObject.type),
+                     ('remote_size', DataObject.size),
+                     ('remote_owner_name', DataObject.owner_name),
+                     ('remote_owner_zone', DataObject.owner_zone),
+                     ('remote_replica_status', DataObject.replica_status),
+                     ('remote_status', DataObject.status),
+                     ('remote_checksum', DataObject.checksum),
+                     ('remote_expiry', DataObject.expiry),
+                     ('remote_create_time', DataObject.create_time),
+                     ('remote_modify_time', DataObject.modify_time)]
+    TIME_FIELDS = frozenset(['remote_create_time', 'remote_modify_time'])
+    EPOCH = datetime.datetime(1970, 1, 1)
+
+    @staticmethod
+    def _to_seconds(val):
+        if isinstance(val, datetime.datetime):
+            return (val - iRODS.EPOCH).total_seconds()
+        return val
+
+    def list_objects(self, filters={}, limit=-1, columns=None,
+                     page_size=None, ordered=True):
+        """
+        Generator over the objects of the resource.
+
+        filters -- field (e.g. collection, object): equal to
+                   collection_prefix: collection and its sub-collections
+                   modified_since, modified_before: modify time
+                   (seconds since the epoch)
+        limit -- maximum number of objects (-1: all)
+        columns -- fields to fetch (see OBJECT_FIELDS, default all),
+                   collection and object are always fetched
+        page_size -- rows per GenQuery round trip (LIST_PAGE_SIZE)
+        ordered -- order by collection and object
+        """
+        if page_size is None:
+            page_size = LIST_PAGE_SIZE
         if limit != -1:
-            query = query.limit(limit)
-        for item in query.get_results():
-            res = {}
-            for k, v in fields.items():
-                val = item[v]
-                if isinstance(val, datetime.datetime):
-                    val = (val - datetime.datetime(1970, 1, 1)).total_seconds()
-                res[k] = val
-            res['remote_file'] = os.path.join(res['collection'],
-                                              res['object'])
-            yield res
-
-    def get(self, ticket):
+            page_size = min(page_size, limit)
+        if columns is None:
+            fields = iRODS.OBJECT_FIELDS
+        else:
+            fields = [(k, c) for k, c in iRODS.OBJECT_FIELDS
+                      if k in columns or k in ['collection', 'object']]
+        # (field, column, decoder)
+        decoders = [(k, c,
+                     iRODS._to_seconds if k in iRODS.TIME_FIELDS else None)
+                    for k, c in fields]
+        all_fields = dict(iRODS.OBJECT_FIELDS)
+        criteria = ([Resource.name == self.resource_name] +
+                    object_criteria(filters, all_fields, Criterion))
+        if 'collection_prefix' in filters:
+            # the collection itself, then its sub-collections
+            coll = filters['collection_prefix'].rstrip('/')
+            variants = [Collection.name == coll,
+                        Like(Collection.name, coll + '/%')]
+        else:
+            variants = [None]
+        for variant in variants:
+            query = self.session.query(*[c for k, c, d in decoders])
+            for criterion in criteria:
+                query = query.filter(criterion)
+            if variant is not None:
+                query = query.filter(variant)
+            if ordered:
+                query = query.order_by(Collection.name, DataObject.name)
+            query = query.limit(page_size)
+            # closing the batches closes the statement on the server
+            # when the listing stops early
+            batches = query.get_batches()
+            try:
+                for batch in batches:
+                    for row in batch:
+                        res = {}
+                        for k, c, decode in decoders:
+                            res[k] = (row[c] if decode is None
+                                      else decode(row[c]))
+                        res['remote_file'] = os.path.join(res['collection'],
+                                                          res['object'])
+                        yield res
+                        if limit != -1:
+                            limit -= 1
+                            if limit == 0:
+                                return
+            finally:
+                batches.close()
+
+    def object_exists(self, remote_file):
+        """
+        Check if an object exists on the resource
+        """
+        query = self.session.query(DataObject.id)
+        query = query.filter(Resource.name == self.resource_name)
+        query = query.filter(Collection.name == os.path.dirname(remote_file))
+        query = query.filter(DataObject.name == os.path.basename(remote_file))
+        return len(query.limit(1).all()) > 0
+
+    def walk_collection(self, coll):
+        """
+        Generator over the paths of all objects in a collection and
+        its sub-collections. The results are fetched page by page.
+        """
+        coll = coll.rstrip('/')
+        for criterion in [Collection.name == coll,
+                          Like(Collection.name, coll + '/%')]:
+            query = self.session.query(Collection.name, DataObject.name)
+            query = query.filter(Resource.name == self.resource_name)
+            query = query.filter(criterion)
+            for item in query.get_results():
+                yield '%s/%s' % (item[Collection.name],
+                                 item[DataObject.name])
+
+    def create_collection(self, coll):
+        """
+        Create a collection and its parents if they do not exist
+        """
+        if not self.session.collections.exists(coll):
+            self.session.collections.create(coll)
+
+    def get(self, ticket, checkpoint=None):
         self.logger.info('iget %s -> %s',
                          ticket.remote_file, ticket.local_file)
         remote_file = ticket.remote_file
         obj = self.session.data_objects.get(remote_file)
-        ticket.transferred = 0
+        if checkpoint is None:
+            checkpoint = Checkpoint(ticket)
+        if ticket.remote_size != obj.size:
+            # object has changed since last attempt
+            checkpoint.reset()
         ticket.remote_size = obj.size
-        mb = 1024 * 1024
-        transfer_block_size = 1024 * 1024 * 10
+        ticket.transferred = checkpoint.verify(ticket.local_file, obj.size)
+        if ticket.transferred > 0:
+            self.logger.info('resume %s at %d bytes',
+                             remote_file, ticket.transferred)
+            mode = 'r+b'
+        else:
+            mode = 'wb'
+        with open(ticket.local_file, mode) as fo:
+            fo.truncate(obj.size)
         start_time = time.time()
-        with obj.open('r') as f:
-            with open(ticket.local_file, 'wb') as fo:
-                while True:
-                    chunk = f.read(GET_BLOCK_SIZE)
-                    if chunk:
-                        ticket.transferred += len(chunk)
-                        if ticket.transferred % transfer_block_size == 0:
-                            self.logger.info('retrieved %3.1f MB from %s',
-                                             (ticket.transferred / mb),
-                                             remote_file)
-                            if ticket.transferred >= 1024 * 1024 * 1024:
-                                transfer_block_size = 1024 * 1024 * 1024
-                        fo.write(chunk)
-                    else:
-                        self.logger.info('retrieved file %s',
-                                         ticket.local_file)
-                        break
+        block_size, streams = self.transfer_settings('GET', GET_BLOCK_SIZE)
+        ranges = checkpoint.pending_ranges(self.stripes(obj.size, streams))
+        ticket.transferred = obj.size - sum(end - start
+                                            for start, end in ranges)
+        file_hasher = checkpoint.file_hasher(ranges, obj.size)
+        self.run_stripes(lambda session, start, end:
+                         self.get_range(session, ticket, checkpoint,
+                                        start, end, file_hasher,
+                                        block_size),
+                         ranges)
+        self.logger.info('retrieved file %s', ticket.local_file)
         end_time = time.time()
         ticket.transfer_time = end_time - start_time
-        ticket.update_local_checksum()
+        self.report_settings('GET', block_size, ranges, ticket.transfer_time)
+        # striped transfers are not sequential: read the file again
+        ticket.update_local_checksum(file_hasher, self.checksum_cache)
         self.checksum(ticket, remote_file)
+        checkpoint.reset()
+
+    def get_range(self, session, ticket, checkpoint, start, end,
+                  file_hasher=None, block_size=GET_BLOCK_SIZE):
+        """
+        Download the bytes [start, end) of the object and write them at
+        the same position of the local file.
+        If file_hasher is given, it is fed with the transferred bytes.
+        """
+        obj = session.data_objects.get(ticket.remote_file)
+        with obj.open('r') as f:
+            with io.open(ticket.local_file, 'r+b') as fo:
+                f.seek(start)
+                fo.seek(start)
+                blocks = checkpoint.block_hasher(start, flush=fo.flush)
+                self.copy_range(f, fo, end - start, ticket, blocks,
+                                file_hasher, block_size)
 
-    def put(self, ticket):
+    def put(self, ticket, checkpoint=None):
         target = ticket.remote_file
         self.logger.info('iput %s -> %s', ticket.local_file, target)
         self.session.default_resource = self.resource_name
-        ticket.update_local_checksum()
-        ticket.transferred = 0
-        mb = 1024 * 1024
-        transfer_block_size = 1024 * 1024 * 10
-        self.logger.info('checksum %s', ticket.checksum)
+        if checkpoint is None:
+            checkpoint = Checkpoint(ticket)
+        size = os.path.getsize(ticket.local_file)
+        if self.checksum_cache is not None:
+            cache_key = self.checksum_cache.stat(ticket.local_file)
+            cached = self.checksum_cache.lookup(ticket.local_file)
+        else:
+            cache_key = None
+            cached = None
+        # an unchanged file is neither verified nor hashed per block
+        ticket.transferred = checkpoint.verify(ticket.local_file, size,
+                                               cache_key)
+        if ticket.transferred > 0:
+            try:
+                obj = self.session.data_objects.get(target)
+                if obj.size < checkpoint.extent(size):
+                    checkpoint.reset()
+            except Exception:
+                checkpoint.reset()
+            ticket.transferred = checkpoint.verify(ticket.local_file, size,
+                                                   cache_key)
+        if ticket.transferred > 0:
+            self.logger.info('resume %s at %d bytes',
+                             target, ticket.transferred)
+            mode = 'r+'
+            options = {}
+        else:
+            mode = 'w'
+            options = {kw.OPR_TYPE_KW: 1}  # PUT
         start_time = time.time()
-        options = {kw.REG_CHKSUM_KW: '',
-                   kw.OPR_TYPE_KW: 1}  # PUT
-        with open(ticket.local_file, 'rb') as fin:
-            with self.session.data_objects.open(target, 'w',
-                                                **options) as fout:
-                while True:
-                    chunk = fin.read(PUT_BLOCK_SIZE)
-                    if chunk:
-                        ticket.transferred += len(chunk)
-                        if ticket.transferred % transfer_block_size == 0:
-                            self.logger.info('sent %3.1f MB',
-                                             (ticket.transferred / mb))
-                            if ticket.transferred >= 1024 * 1024 * 1024:
-                                transfer_block_size = 1024 * 1024 * 1024
-                        fout.write(chunk)
-                    else:
-                        self.logger.info('sent file %s', ticket.local_file)
-                        break
+        block_size, streams = self.transfer_settings('PUT', PUT_BLOCK_SIZE)
+        ranges = checkpoint.pending_ranges(self.stripes(size, streams))
+        ticket.transferred = size - sum(end - start
+                                        for start, end in ranges)
+        if cached is None:
+            file_hasher = checkpoint.file_hasher(ranges, size)
+        else:
+            # unchanged file: the checksum is taken from the cache
+            file_hasher = None
+        # the replica is opened once, the stripes of other sessions
+        # join it with its replica token and the replica is finalized
+        # when this descriptor is closed
+        with self.session.data_objects.open(target, mode,
+                                            **options) as fout:
+            replica = self.replica_access_info(fout)
+            self.run_stripes(lambda session, start, end:
+                             self.put_range(session, ticket, checkpoint,
+                                            start, end, file_hasher,
+                                            block_size,
+                                            fout if session is self.session
+                                            else None,
+                                            replica),
+                             ranges)
         end_time = time.time()
+        self.logger.info('sent file %s', ticket.local_file)
         ticket.transfer_time = end_time - start_time
+        self.report_settings('PUT', block_size, ranges, ticket.transfer_time)
         ticket.update_local_attributes()
-        self.checksum(ticket, target)
+        # striped transfers are not sequential: read the file again
+        # unless the checksum is cached
+        ticket.update_local_checksum(file_hasher, self.checksum_cache,
+                                     cache_key)
+        self.logger.info('checksum %s', ticket.checksum)
+        # the server reads the object: corrupted or missing stripes
+        # are detected
+        remote_checksum = self.session.data_objects.get(target).chksum()
+        self.checksum(ticket, target, remote_checksum)
+        checkpoint.reset()
 
-    def checksum(self, ticket, remote_file):
+    def put_stream(self, ticket, write):
+        """
+        Upload data that is generated by write(fileobj, block_size)
+        (e.g. a tar container of small files) without a copy on local
+        disk. The checksum is computed from the written data. A failed
+        transfer is started again from the beginning.
+        """
+        target = ticket.remote_file
+        self.logger.info('iput stream %s -> %s', ticket.local_file, target)
+        self.session.default_resource = self.resource_name
+        ticket.transferred = 0
+        hasher = hashlib.sha256()
+        start_time = time.time()
+        options = {kw.OPR_TYPE_KW: 1}  # PUT
+        with self.session.data_objects.open(target, 'w', **options) as fout:
+            write(_StreamWriter(fout, hasher,
+                                lambda n: self.add_progress(ticket, n)),
+                  PUT_BLOCK_SIZE)
+        end_time = time.time()
+        self.logger.info('sent stream %s', ticket.local_file)
+        ticket.transfer_time = end_time - start_time
+        ticket.update_local_checksum(hasher)
+        self.logger.info('checksum %s', ticket.checksum)
+        remote_checksum = self.session.data_objects.get(target).chksum()
+        self.checksum(ticket, target, remote_checksum)
+
+    def put_range(self, session, ticket, checkpoint, start, end,
+                  file_hasher=None, block_size=PUT_BLOCK_SIZE, fout=None,
+                  replica=None):
+        """
+        Upload the bytes [start, end) of the local file to the same
+        position of the object.
+        If file_hasher is given, it is fed with the transferred bytes.
+        fout is the open object of the session, otherwise the replica
+        (see replica_access_info) is opened with the session.
+        """
+        if fout is None:
+            with self.open_replica(session, ticket.remote_file,
+                                   replica) as fout:
+                self.put_range(session, ticket, checkpoint, start, end,
+                               file_hasher, block_size, fout)
+            return
+        with io.open(ticket.local_file, 'rb') as fin:
+            fin.seek(start)
+            fout.seek(start)
+            blocks = checkpoint.block_hasher(start, flush=fout.flush)
+            self.copy_range(fin, fout, end - start, ticket, blocks,
+                            file_hasher, block_size)
+
+    @staticmethod
+    def replica_access_info(fout):
+        """
+        (replica token, resource hierarchy) of an object opened for
+        writing, None if the client or server does not support
+        parallel access to a replica.
+        """
+        try:
+            return fout.raw.replica_access_info()
+        except (AttributeError, KeyError):
+            return None
+
+    def open_replica(self, session, remote_file, replica):
+        """
+        Open the replica that is being written by another session
+        (stripes of a parallel upload). The replica is not finalized
+        when it is closed.
+        """
+        if replica is None:
+            return session.data_objects.open(remote_file, 'r+')
+        token, hier = replica
+        options = {kw.RESC_HIER_STR_KW: hier,
+                   kw.REPLICA_TOKEN_KW: token}
+        return session.data_objects.open(remote_file, 'r+', create=False,
+                                         finalize_on_close=False,
+                                         **options)
+
+    def copy_range(self, src, dst, length, ticket, blocks, file_hasher,
+                   block_size):
+        """
+        Copy length bytes with an I/O pipeline and feed the
+        checkpoint, the file checksum and the progress of the ticket.
+        """
+        def consume(chunk):
+            blocks.update(chunk)
+            if file_hasher is not None:
+                file_hasher.update(chunk)
+            self.add_progress(ticket, len(chunk))
+
+        Pipeline(block_size).copy(src, dst, length, consume)
+        blocks.finish()
+
+    def transfer_settings(self, mode, block_size):
+        """
+        Returns (block_size, streams) for a transfer. With a tuner,
+        the tuned settings for this host and resource are used.
+        """
+        if self.tuner is None:
+            return block_size, self.stripe_streams
+        else:
+            return self.tuner.settings(self.tuning_key, mode)
+
+    def report_settings(self, mode, block_size, ranges, seconds):
+        """
+        Report the throughput of a finished transfer to the tuner.
+        The tuner ignores transfers that did not use the tuned number
+        of streams (objects below the stripe threshold, resumed
+        transfers).
+        """
+        if self.tuner is not None:
+            self.tuner.report(self.tuning_key, mode, block_size,
+                              len(ranges),
+                              sum(end - start for start, end in ranges),
+                              seconds)
+
+    def is_striped(self, size, streams=None):
+        if streams is None:
+            streams = self.stripe_streams
+        return streams > 1 and size >= self.stripe_threshold
+
+    def stripes(self, size, streams=None):
+        """
+        Split the byte range [0, size) into one range per stream.
+        The ranges are aligned to the checkpoint block size.
+        """
+        if streams is None:
+            streams = self.stripe_streams
+        if self.is_striped(size, streams):
+            n = streams
+        else:
+            n = 1
+        block_size = Checkpoint.BLOCK_SIZE
+        stripe_size = (size + n - 1) // n
+        stripe_size = max(1, ((stripe_size + block_size - 1) //
+                              block_size)) * block_size
+        return [(start, min(start + stripe_size, size))
+                for start in range(0, size, stripe_size)]
+
+    def run_stripes(self, func, stripes):
+        """
+        Run func(session, start, end) for all stripes.
+        A single stripe is transferred with the current session, otherwise
+        the stripes are shared by the current session and the threads
+        of the sessions that the session pool has available without
+        waiting (up to one per stripe).
+        The first exception of a stream is raised again.
+        """
+        if len(stripes) == 1:
+            func(self.session, stripes[0][0], stripes[0][1])
+            return
+        pending = collections.deque(stripes)
+        errors = []
+
+        def run(session):
+            while not errors:
+                try:
+                    start, end = pending.popleft()
+                except IndexError:
+                    return True
+                try:
+                    func(session, start, end)
+                except Exception as e:
+                    self.logger.error('stream %d-%d failed: %s',
+                                      start, end, str(e))
+                    errors.append(e)
+                    return False
+            return True
+
+        def run_borrowed(session):
+            ok = False
+            try:
+                ok = run(session)
+            finally:
+                self.release_session(session, discard=not ok)
+
+        threads = []
+        for i in range(len(stripes) - 1):
+            session = self.acquire_session(block=False)
+            if session is None:
+                break
+            threads.append(threading.Thread(name='stripe-%d' % i,
+                                            target=run_borrowed,
+                                            args=(session,)))
+        for thread in threads:
+            thread.start()
+        run(self.session)
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+
+    def add_progress(self, ticket, n):
+        with self.progress_lock:
+            ticket.transferred += n
+
+    def checksum(self, ticket, remote_file, remote_checksum=None):
         """
         Compare the checksum of local file and object in iRODS
+        (remote_checksum if it has just been computed by the server)
         Raise ValueError if checksums don't match
         """
-        obj = self.session.data_objects.get(remote_file)
-        if obj.checksum is not None:
+        if remote_checksum is None:
+            remote_checksum = self.session.data_objects.get(
+                remote_file).checksum
+        if remote_checksum is not None:
             chcksum = ticket.checksum
-            if obj.checksum != "sha2:{checksum}".format(checksum=chcksum):
-                self.logger.error('obj.checksum  %s', obj.checksum)
+            if remote_checksum != "sha2:{checksum}".format(checksum=chcksum):
+                self.logger.error('obj.checksum  %s', remote_checksum)
                 self.logger.error('file checksum %s', chcksum)
                 raise ValueError('checksum test failed')
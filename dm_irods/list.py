@@ -2,7 +2,9 @@ import sys
 import atexit
 import json
 import time
+import datetime
 from argparse import ArgumentParser
+from argparse import ArgumentTypeError
 from .socket_server.client import Client
 from .socket_server.server import ReturnCode
 from .server import ensure_daemon_is_running
@@ -16,6 +18,41 @@ from .table import get_term_size
 
 WATCH_DEALY = 2
 
+SIZE_UNITS = {'k': 1024,
+              'M': 1024 ** 2,
+              'G': 1024 ** 3,
+              'T': 1024 ** 4}
+
+
+def parse_time(value):
+    """
+    Seconds since the epoch or local time YYYY-mm-dd[ HH:MM[:SS]]
+    """
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    for fmt in ['%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d']:
+        try:
+            t = datetime.datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        return time.mktime(t.timetuple())
+    raise ArgumentTypeError('invalid time %s' % value)
+
+
+def parse_size(value):
+    """
+    Number of bytes with an optional unit k, M, G or T
+    """
+    factor = SIZE_UNITS.get(value[-1:], 1)
+    if factor != 1:
+        value = value[:-1]
+    try:
+        return int(float(value) * factor)
+    except ValueError:
+        raise ArgumentTypeError('invalid size %s' % value)
+
 
 def dm_ilist(argv=sys.argv[1:]):
     parser = ArgumentParser(description='List files in archive.')
@@ -37,7 +74,59 @@ def dm_ilist(argv=sys.argv[1:]):
     parser.add_argument('--active', '-a',
                         action='store_true',
                         help='only active objects')
+    parser.add_argument('--status',
+                        type=str,
+                        help=('only tickets with these states ' +
+                              '(comma separated, e.g. ERROR,RETRY)'))
+    parser.add_argument('--mode',
+                        type=str,
+                        choices=['GET', 'PUT'],
+                        help='only tickets of this mode')
+    parser.add_argument('--collection',
+                        type=str,
+                        help='only objects in this collection and below')
+    parser.add_argument('--glob',
+                        type=str,
+                        help='only objects whose path matches the pattern')
+    parser.add_argument('--since',
+                        type=parse_time,
+                        help=('only tickets created since ' +
+                              'YYYY-mm-dd[ HH:MM[:SS]]'))
+    parser.add_argument('--until',
+                        type=parse_time,
+                        help=('only tickets created until ' +
+                              'YYYY-mm-dd[ HH:MM[:SS]]'))
+    parser.add_argument('--min-size',
+                        type=parse_size,
+                        dest='min_size',
+                        help='only files of at least this size (e.g. 10M)')
+    parser.add_argument('--max-size',
+                        type=parse_size,
+                        dest='max_size',
+                        help='only files of at most this size (e.g. 1G)')
+    parser.add_argument('--sort',
+                        type=str,
+                        choices=['status', 'time', 'path'],
+                        default='status',
+                        help='sort order (default: status)')
+    parser.add_argument('--cursor',
+                        type=str,
+                        help=('continue the listing after this position ' +
+                              '(printed after a page of --limit rows)'))
     args = parser.parse_args(argv)
+    flt = {'active': args.active}
+    if args.status is not None:
+        flt['status'] = [s for s in args.status.split(',') if s]
+    if args.mode is not None:
+        flt['mode'] = args.mode
+    if args.collection is not None:
+        flt['collection_prefix'] = args.collection
+    if args.glob is not None:
+        flt['glob'] = args.glob
+    if args.since is not None or args.until is not None:
+        flt['time_range'] = [args.since, args.until]
+    if args.min_size is not None or args.max_size is not None:
+        flt['size_range'] = [args.min_size, args.max_size]
     ensure_daemon_is_running()
     client = Client(DmIRodsServer.get_socket_file())
     if args.watch:
@@ -48,15 +137,24 @@ def dm_ilist(argv=sys.argv[1:]):
         atexit.register(terminal_erase)
     while True:
         table = Table(format=args.format)
+        rows = 0
+        cursor = None
         for code, result in client.request_all({"list": True,
                                                 "all": True,
-                                                "filter": {"active":
-                                                           args.active},
+                                                "filter": flt,
+                                                "sort": args.sort,
+                                                "cursor": args.cursor,
                                                 "limit": args.limit}):
             if code != ReturnCode.OK:
                 print_request_error(code, result)
                 sys.exit(8)
-            table.print_row(json.loads(result))
+            item = json.loads(result)
+            table.print_row(item)
+            rows += 1
+            cursor = item.get('cursor', None)
+        if (not args.watch and args.limit is not None and
+                rows == args.limit and cursor is not None):
+            sys.stderr.write('next page: --cursor %s\n' % cursor)
         if args.watch:
             time.sleep(WATCH_DEALY)
             terminal_home()
@@ -0,0 +1,279 @@
+import json
+import base64
+import heapq
+import fnmatch
+import datetime
+import posixpath
+from .ticket import Ticket
+
+
+# list_objects filters on the modify time (seconds since the epoch)
+# and their GenQuery operators
+MODIFY_TIME_FILTERS = {'modified_since': '>=',
+                       'modified_before': '<'}
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def object_criteria(filters, fields, criterion):
+    """
+    GenQuery conditions of list_objects filters (except
+    collection_prefix), built by criterion(operator, column, value).
+
+    filters -- field: equal to
+               modified_since, modified_before: modify time
+               (seconds since the epoch)
+    fields -- field -> column (remote_modify_time is the modify time)
+    """
+    ret = []
+    for k, value in sorted(filters.items()):
+        if k == 'collection_prefix':
+            continue
+        elif k in MODIFY_TIME_FILTERS:
+            ret.append(criterion(MODIFY_TIME_FILTERS[k],
+                                 fields['remote_modify_time'],
+                                 EPOCH + datetime.timedelta(seconds=value)))
+        else:
+            ret.append(criterion('=', fields[k], value))
+    return ret
+
+
+class TicketQuery(object):
+    """
+    Filters, sort order and resume position of a ticket listing.
+
+    flt -- active: only active tickets
+           status: list of status names (e.g. ['ERROR', 'RETRY'])
+           mode: GET or PUT
+           collection and object: tickets of a single object
+           collection_prefix: objects in a collection and its
+                              sub-collections
+           glob: shell pattern matched against the remote path
+           time_range: [from, to] of time_created (either may be None)
+           size_range: [min, max] of the file size in bytes
+    sort -- status (Ticket.sorted_codes, then time_created),
+            time (time_created) or path (collection, object)
+    cursor -- opaque position returned with each listed ticket,
+              the listing continues after this ticket
+
+    The sort orders are served from the ticket index, the index is read
+    in chunks of CHUNK entries under the lock of the ticket dictionary.
+    A collection prefix with up to SMALL_PREFIX tickets is read at once
+    and sorted, larger ones are scanned in sort order with the prefix as
+    a filter. Invalid queries raise ValueError.
+    """
+    SORT_KEYS = ['status', 'time', 'path']
+    CHUNK = 1000
+    SMALL_PREFIX = 1000
+
+    def __init__(self, flt={}, sort=None, cursor=None):
+        if sort is None:
+            sort = 'status'
+        if sort not in TicketQuery.SORT_KEYS:
+            raise ValueError('invalid sort key %s' % sort)
+        self.sort = sort
+        string2code = {v: k for k, v in Ticket.code2string.items()}
+        if flt.get('status'):
+            try:
+                codes = set(string2code[s.upper()] for s in flt['status'])
+            except KeyError as e:
+                raise ValueError('invalid status %s' % str(e))
+        else:
+            codes = set(Ticket.sorted_codes)
+        if flt.get('active', False):
+            codes &= set(Ticket.ACTIVE_CODES)
+        self.statuses = [c for c in Ticket.sorted_codes if c in codes]
+        self.mode = None
+        if flt.get('mode'):
+            string2mode = {v: k for k, v in Ticket.mode2string.items()}
+            try:
+                self.mode = string2mode[flt['mode'].upper()]
+            except KeyError:
+                raise ValueError('invalid mode %s' % flt['mode'])
+        self.remote_file = None
+        if 'collection' in flt and 'object' in flt:
+            self.remote_file = '%s/%s' % (flt['collection'], flt['object'])
+        self.prefix = flt.get('collection_prefix', None)
+        self.glob = flt.get('glob', None)
+        self.time_range = TicketQuery._range(flt.get('time_range', None))
+        self.size_range = TicketQuery._range(flt.get('size_range', None))
+        self.after = None
+        if cursor is not None:
+            self.after = self.decode_cursor(cursor)
+        # objects without tickets are listed after the tickets of
+        # unfiltered listings (they have no cursor)
+        self.with_objects = (cursor is None and sort == 'status' and
+                             not flt.get('active', False) and
+                             not any(flt.get(k) for k in ['status',
+                                                          'mode',
+                                                          'collection_prefix',
+                                                          'glob',
+                                                          'time_range',
+                                                          'size_range']))
+
+    @staticmethod
+    def _range(value):
+        if value is None:
+            return None
+        lo, hi = value
+        if lo is None and hi is None:
+            return None
+        return (lo, hi)
+
+    @staticmethod
+    def _in_range(value, rng):
+        if rng is None:
+            return True
+        if value is None:
+            return False
+        return ((rng[0] is None or value >= rng[0]) and
+                (rng[1] is None or value <= rng[1]))
+
+    @staticmethod
+    def size(ticket):
+        if ticket.local_size is not None:
+            return ticket.local_size
+        return ticket.remote_size
+
+    def needs_history(self):
+        return any(c in Ticket.INACTIVE_CODES for c in self.statuses)
+
+    def match(self, ticket):
+        if ticket.status not in self.statuses:
+            return False
+        if self.mode is not None and ticket.mode != self.mode:
+            return False
+        if self.prefix is not None:
+            prefix = self.prefix.rstrip('/') + '/'
+            if not ticket.remote_file.startswith(prefix):
+                return False
+        if (self.glob is not None and
+                not fnmatch.fnmatchcase(ticket.remote_file, self.glob)):
+            return False
+        return (TicketQuery._in_range(ticket.time_created,
+                                      self.time_range) and
+                TicketQuery._in_range(TicketQuery.size(ticket),
+                                      self.size_range))
+
+    def key(self, ticket):
+        """
+        Position of a ticket in the sort order
+        """
+        p = (ticket.local_file, ticket.remote_file)
+        if self.sort == 'status':
+            return (Ticket.sorted_codes.index(ticket.status),
+                    (ticket.time_created, p))
+        elif self.sort == 'time':
+            return (ticket.time_created, p)
+        else:
+            coll, obj = posixpath.split(ticket.remote_file)
+            return ((coll, obj, ticket.local_file), p)
+
+    def cursor(self, ticket):
+        data = json.dumps([self.sort, self.key(ticket)])
+        return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, cursor):
+        try:
+            data = base64.urlsafe_b64decode(str(cursor))
+            sort, key = json.loads(data.decode('utf-8'))
+            if sort == 'status':
+                key = (key[0], (key[1][0], tuple(key[1][1])))
+            elif sort == 'time':
+                key = (key[0], tuple(key[1]))
+            else:
+                key = (tuple(key[0]), tuple(key[1]))
+        except Exception:
+            raise ValueError('invalid cursor')
+        if sort != self.sort:
+            raise ValueError('cursor of sort order %s' % sort)
+        return key
+
+    def tickets(self, index, tickets, lock):
+        """
+        Generator over the matching tickets in sort order
+
+        index -- TicketIndex
+        tickets -- dictionary key -> ticket
+        lock -- lock of the dictionary and the index
+        """
+        if self.remote_file is not None:
+            with lock:
+                keys = index.by_remote_file(self.remote_file)
+                return self._sorted(tickets[p] for p in keys)
+        if self.prefix is not None and self.sort != 'path':
+            with lock:
+                if (index.count_collection(self.prefix) <=
+                        TicketQuery.SMALL_PREFIX):
+                    keys = index.by_collection(self.prefix)
+                    return self._sorted(tickets[p] for p in keys)
+        if self.sort == 'status':
+            return self._by_status(index, tickets, lock)
+        elif self.sort == 'time':
+            return self._by_time(index, tickets, lock)
+        else:
+            return self._by_path(index, tickets, lock)
+
+    def _sorted(self, ticket_list):
+        ret = sorted((self.key(t), t) for t in ticket_list if self.match(t))
+        return [t for k, t in ret if self.after is None or k > self.after]
+
+    def _status_entries(self, index, tickets, lock, status, after):
+        """
+        Generator over ((time_created, key), status, ticket) of a status
+        """
+        if self.time_range is not None and self.time_range[0] is not None:
+            start = (self.time_range[0], ())
+            if after is None or start > after:
+                after = start
+        while True:
+            with lock:
+                entries = [(entry, tickets[entry[1]])
+                           for entry in index.status_slice(
+                               status, after, TicketQuery.CHUNK)]
+            if not entries:
+                return
+            for entry, ticket in entries:
+                if (self.time_range is not None and
+                        self.time_range[1] is not None and
+                        entry[0] > self.time_range[1]):
+                    return
+                yield entry, status, ticket
+            after = entries[-1][0]
+
+    def _by_status(self, index, tickets, lock):
+        for rank, status in enumerate(Ticket.sorted_codes):
+            if status not in self.statuses:
+                continue
+            after = None
+            if self.after is not None:
+                if rank < self.after[0]:
+                    continue
+                elif rank == self.after[0]:
+                    after = self.after[1]
+            for entry, status, ticket in self._status_entries(
+                    index, tickets, lock, status, after):
+                if self.match(ticket):
+                    yield ticket
+
+    def _by_time(self, index, tickets, lock):
+        streams = [self._status_entries(index, tickets, lock,
+                                        status, self.after)
+                   for status in self.statuses]
+        for entry, status, ticket in heapq.merge(*streams):
+            if self.match(ticket):
+                yield ticket
+
+    def _by_path(self, index, tickets, lock):
+        prefix = self.prefix if self.prefix is not None else ''
+        after = self.after
+        while True:
+            with lock:
+                entries = [(entry, tickets[entry[1]])
+                           for entry in index.collection_slice(
+                               prefix, after, TicketQuery.CHUNK)]
+            if not entries:
+                return
+            for entry, ticket in entries:
+                if self.match(ticket):
+                    yield ticket
+            after = entries[-1][0]
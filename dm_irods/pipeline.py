@@ -0,0 +1,85 @@
+import sys
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+class Pipeline(object):
+    """
+    Copy a number of bytes from a source to a destination file.
+
+    A reader thread fills preallocated buffers with readinto while the
+    calling thread writes the previously filled buffer, so that disk and
+    network I/O overlap. The buffers are recycled through a bounded
+    queue: the memory used per transfer is num_buffers * block_size.
+    """
+    NUM_BUFFERS = 2
+
+    def __init__(self, block_size, num_buffers=None):
+        if num_buffers is None:
+            num_buffers = Pipeline.NUM_BUFFERS
+        self.buffers = [bytearray(block_size)
+                        for i in range(max(2, num_buffers))]
+
+    @staticmethod
+    def chunk(buf, n):
+        if sys.version_info[0] == 2:
+            return bytes(buf[:n])
+        else:
+            return memoryview(buf)[:n]
+
+    def copy(self, src, dst, length, callback=None):
+        """
+        Copy length bytes from the current position of src to the
+        current position of dst. callback is called with each chunk
+        after it has been written.
+        """
+        free = queue.Queue()
+        full = queue.Queue()
+        for buf in self.buffers:
+            free.put(buf)
+        stop = threading.Event()
+        reader = threading.Thread(name='pipeline-reader',
+                                  target=self.read,
+                                  args=(src, length, free, full, stop))
+        reader.daemon = True
+        reader.start()
+        try:
+            remaining = length
+            while remaining > 0:
+                item = full.get()
+                if isinstance(item, Exception):
+                    raise item
+                buf, n = item
+                chunk = Pipeline.chunk(buf, n)
+                dst.write(chunk)
+                if callback is not None:
+                    callback(chunk)
+                remaining -= n
+                free.put(buf)
+        finally:
+            stop.set()
+            free.put(None)
+            reader.join()
+
+    def read(self, src, length, free, full, stop):
+        try:
+            remaining = length
+            while remaining > 0:
+                buf = free.get()
+                if buf is None or stop.is_set():
+                    return
+                n = min(len(buf), remaining)
+                if n == len(buf):
+                    got = src.readinto(buf)
+                else:
+                    got = src.readinto(memoryview(buf)[:n])
+                if not got:
+                    raise IOError('unexpected end of file ' +
+                                  '(%d bytes missing)' % remaining)
+                full.put((buf, got))
+                remaining -= got
+        except Exception as e:
+            full.put(e)
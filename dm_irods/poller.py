@@ -0,0 +1,117 @@
+import time
+import logging
+import threading
+from .scheduler import RecallScheduler
+
+
+class DmfPoller(object):
+    """
+    Poll schedule for objects that are being staged from tape.
+
+    Instead of retrying the transfer of an UNMIG ticket at every tick,
+    the DMF state of all tickets that are due is queried in one batch.
+    The interval between two checks of the same object adapts to the
+    observed staging latency (OFL -> DUL): while the expected latency has
+    not elapsed the object is checked halfway to the expected time,
+    afterwards the interval grows with the waiting time.
+    """
+    MIN_INTERVAL = 10
+    MAX_INTERVAL = 600
+
+    # interval relative to the waiting time once the expected
+    # latency has elapsed
+    BACKOFF = 0.25
+
+    # weight of a new sample in the latency estimate
+    ALPHA = 0.2
+
+    def __init__(self, logger=logging.getLogger("DmIRodsServer")):
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.since = {}
+        self.next_poll = {}
+        self.latency = None
+
+    def start(self, remote_file, now=None):
+        """
+        Object has been requested but is not online yet
+        """
+        if now is None:
+            now = time.time()
+        with self.lock:
+            self.since.setdefault(remote_file, now)
+            self.next_poll[remote_file] = now + self._interval(
+                now - self.since[remote_file])
+
+    def forget(self, remote_file):
+        with self.lock:
+            self.since.pop(remote_file, None)
+            self.next_poll.pop(remote_file, None)
+
+    def due(self, tickets, now=None):
+        """
+        Tickets whose DMF state should be checked now
+        """
+        if now is None:
+            now = time.time()
+        with self.lock:
+            for t in tickets:
+                if t.remote_file not in self.since:
+                    # e.g. UNMIG tickets read at startup
+                    self.since[t.remote_file] = now
+                    self.next_poll[t.remote_file] = now
+            return [t for t in tickets
+                    if self.next_poll[t.remote_file] <= now]
+
+    def update(self, remote_file, online, now=None):
+        """
+        Record the result of a check. Returns True if the object is
+        online and can be transferred.
+        """
+        if now is None:
+            now = time.time()
+        with self.lock:
+            since = self.since.get(remote_file, now)
+            if online:
+                self.since.pop(remote_file, None)
+                self.next_poll.pop(remote_file, None)
+                self._add_sample(now - since)
+            else:
+                self.next_poll[remote_file] = now + self._interval(
+                    now - since)
+        return online
+
+    def check(self, tickets, items, now=None):
+        """
+        Record the results of a rule call (a list of items, e.g. from
+        GetDmfObject) for the due tickets. Objects without DMF_state
+        count as online. Returns the set of remote files that are
+        online.
+        """
+        states = {item.get('remote_file'): item.get('DMF_state', None)
+                  for item in items}
+        online = set()
+        for t in tickets:
+            state = states.get(t.remote_file, None)
+            if self.update(t.remote_file,
+                           (state is None or
+                            state in RecallScheduler.ONLINE_STATES),
+                           now=now):
+                online.add(t.remote_file)
+        return online
+
+    def _add_sample(self, latency):
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += DmfPoller.ALPHA * (latency - self.latency)
+        self.logger.debug('staging latency %.1f s (estimate %.1f s)',
+                          latency, self.latency)
+
+    def _interval(self, elapsed):
+        if self.latency is not None and self.latency - elapsed > 0:
+            interval = (self.latency - elapsed) / 2.0
+        else:
+            interval = elapsed * DmfPoller.BACKOFF
+        return min(max(interval, DmfPoller.MIN_INTERVAL),
+                   DmfPoller.MAX_INTERVAL)
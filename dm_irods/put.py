@@ -6,33 +6,92 @@ from .socket_server.client import Client
 from .socket_server.server import ReturnCode
 from .server import ensure_daemon_is_running
 from .server import DmIRodsServer
+from .bundle import create_bundles
+from .bulk import file_arguments
+from .bulk import request_many
 from .cprint import print_request_error
 
 
 def dm_iput(argv=sys.argv[1:]):
     parser = ArgumentParser(description='Put files to archive.')
-    parser.add_argument('files', type=str, nargs='+', help='files')
+    parser.add_argument('files', type=str, nargs='*', help='files')
+    parser.add_argument('--from', type=str, dest='file_list',
+                        help='read the files from a file (- for stdin)')
     parser.add_argument('--coll', type=str,
                         default='/{zone}/home/{user}',
                         help='target collection (default /{zone}/home/{user})')
+    parser.add_argument('-r', '--recursive', action='store_true',
+                        help='put directories and their contents')
+    parser.add_argument('--bundle', action='store_true',
+                        help=('pack small files into tar containers ' +
+                              '(members can be retrieved with dm_iget)'))
+    parser.add_argument('--bundle_size', type=int, default=1024,
+                        help=('maximal size of a container and of the ' +
+                              'files to be packed (MB, default 1024)'))
     args = parser.parse_args(argv)
+    files = file_arguments(args.files, args.file_list)
+    if files is None:
+        parser.error('no files given')
     ensure_daemon_is_running()
     client = Client(DmIRodsServer.get_socket_file())
-    lst = []
-    for f in args.files:
-        remote_file = os.path.join(args.coll, os.path.basename(f))
-        code, result = client.request({"put": os.path.abspath(f),
-                                       "remote_file": remote_file})
+
+    def request(msg):
+        code, result = client.request(msg)
         if code != ReturnCode.OK:
             print_request_error(code, result)
             sys.exit(8)
-        lst += [json.loads(result)]
-    fmt = '{0: <20}{1: <40}'
-    print(fmt.format("STATUS", "FILE"))
-    for item in lst:
+        return json.loads(result)
+
+    def request_all(msg):
+        for code, result in client.request_all(msg):
+            if code != ReturnCode.OK:
+                print_request_error(code, result)
+                sys.exit(8)
+            yield json.loads(result)
+
+    def print_item(item):
         print(fmt.format(item.get('msg', ''),
                          item.get('file', '')))
 
+    fmt = '{0: <20}{1: <40}'
+    print(fmt.format("STATUS", "FILE"))
+    bundle_size = None
+    if args.bundle:
+        bundle_size = args.bundle_size * 1024 * 1024
+    # directories and small files are collected while the other files
+    # are streamed to the daemon
+    dirs = []
+    small_files = []
+
+    def is_single_file(f):
+        if args.recursive and os.path.isdir(f):
+            dirs.append(f)
+            return False
+        if (bundle_size is not None and os.path.isfile(f) and
+                os.path.getsize(f) < bundle_size):
+            small_files.append(f)
+            return False
+        return True
+
+    files = (os.path.abspath(f) for f in files)
+    pairs = ([f, os.path.join(args.coll, os.path.basename(f))]
+             for f in files if is_single_file(f))
+    for item in request_many(client, 'put_many', pairs):
+        print_item(item)
+    for tar_file, remote_file, members in create_bundles(small_files,
+                                                         args.coll,
+                                                         bundle_size):
+        print_item(request({"put": tar_file,
+                            "remote_file": remote_file,
+                            "bundle": members}))
+    # the contents of directories are enumerated by the daemon
+    for d in dirs:
+        remote_coll = os.path.join(args.coll, os.path.basename(d))
+        for item in request_all({"put": d,
+                                 "remote_file": remote_coll,
+                                 "recursive": True}):
+            print_item(item)
+
 
 if __name__ == "__main__":
     dm_iput()
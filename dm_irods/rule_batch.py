@@ -0,0 +1,209 @@
+import sys
+import logging
+import itertools
+import threading
+import collections
+
+if sys.version_info[0] == 2:
+    exec('def _reraise(tp, value, tb):\n'
+         '    raise tp, value, tb\n')
+else:
+    def _reraise(tp, value, tb):
+        raise value.with_traceback(tb)
+
+
+class RuleBatchSize(object):
+    """
+    Adaptive size (bytes of the list argument) of DMF rule batches.
+
+    The size starts at max_size. A batch that fails with a transport
+    error or takes longer than target_latency halves the size, a full
+    batch that is answered faster increases it by STEP up to max_size
+    (AIMD, as the TransferTuner). Failures of single objects do not
+    change the size. The object is shared by all rule calls of the
+    daemon.
+    """
+    MIN_SIZE = 1000
+    STEP = 2000
+    TARGET_LATENCY = 5.0
+
+    def __init__(self, max_size, min_size=None, target_latency=None,
+                 logger=logging.getLogger("DmIRodsServer")):
+        if min_size is None:
+            min_size = RuleBatchSize.MIN_SIZE
+        if target_latency is None:
+            target_latency = RuleBatchSize.TARGET_LATENCY
+        self.max_size = max_size
+        self.min_size = min(min_size, max_size)
+        self.target_latency = target_latency
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.current = max_size
+
+    def size(self):
+        with self.lock:
+            return self.current
+
+    def report(self, nbytes, seconds, failed=False):
+        """
+        Adapt the size to the outcome of a rule call
+        """
+        with self.lock:
+            old = self.current
+            if failed or seconds > self.target_latency:
+                self.current = max(self.min_size, min(old, nbytes) // 2)
+            elif nbytes >= old:
+                self.current = min(self.max_size, old + RuleBatchSize.STEP)
+            if self.current != old:
+                self.logger.debug('DMF rule batch size %d -> %d',
+                                  old, self.current)
+
+
+# rule calls spent on splitting a failed batch
+MAX_BISECT_CALLS = 64
+
+
+def _same_error(e1, e2):
+    return e1.__class__ is e2.__class__ and str(e1) == str(e2)
+
+
+def isolate_failures(batch, run, fatal=(), max_calls=None):
+    """
+    Call run(batch). If it fails, split the batch in halves until the
+    items that make it fail are isolated.
+
+    Returns a list of (item, exception) of the failing items. Exceptions
+    of the types in fatal (e.g. network errors) are raised immediately.
+    The first exception is raised again if the failure does not depend
+    on the items: both halves of the first split fail with the same
+    error, or more than max_calls calls are needed.
+    """
+    if max_calls is None:
+        max_calls = MAX_BISECT_CALLS
+    try:
+        run(batch)
+        return []
+    except fatal:
+        raise
+    except Exception as e:
+        error = e
+    if len(batch) == 1:
+        return [(batch[0], error)]
+    failures = []
+    calls = [0]
+
+    def split(part, part_error, first):
+        half = len(part) // 2
+        failed = []
+        for sub in (part[:half], part[half:]):
+            calls[0] += 1
+            if calls[0] > max_calls:
+                raise error
+            try:
+                run(sub)
+            except fatal:
+                raise
+            except Exception as e:
+                failed.append((sub, e))
+        if (first and len(failed) == 2 and
+                _same_error(failed[0][1], failed[1][1]) and
+                _same_error(failed[0][1], part_error)):
+            # e.g. rule engine or microservice not available
+            raise error
+        for sub, e in failed:
+            if len(sub) == 1:
+                failures.append((sub[0], e))
+            else:
+                split(sub, e, False)
+
+    split(batch, error, True)
+    return failures
+
+
+def split_batches(items, max_bytes, key='remote_file'):
+    """
+    Split the items into lists whose rule argument (the values of key,
+    separated by 3 bytes) has about max_bytes bytes.
+    max_bytes is a function, it is called for each batch.
+    """
+    batch = []
+    size = 0
+    for item in items:
+        batch.append(item)
+        size += len(item.get(key)) + 3
+        if size >= max_bytes():
+            yield batch
+            batch = []
+            size = 0
+    if batch:
+        yield batch
+
+
+def process_batches(batches, query, session, acquire, release, parallel):
+    """
+    Generator over the items of the batches (in order) after
+    query(batch, session) has been executed for each batch.
+
+    A single batch is queried with session. Otherwise up to parallel
+    batches are queried at the same time, each in a thread with a
+    session from acquire(). If acquire() returns None (no session
+    available), the batch is queried with session when its turn comes.
+    Sessions are returned with release(session, discard=...).
+    Errors of a thread are raised again with their traceback. If the
+    generator is closed early, the running threads are joined.
+    """
+    batches = iter(batches)
+    first = next(batches, None)
+    if first is None:
+        return
+    second = next(batches, None)
+    if second is None:
+        for item in query(first, session):
+            yield item
+        return
+    calls = collections.deque()
+    try:
+        for batch in itertools.chain([first, second], batches):
+            calls.append(_start(batch, query, acquire, release))
+            while len(calls) >= parallel:
+                for item in _wait(calls.popleft(), query, session):
+                    yield item
+        while calls:
+            for item in _wait(calls.popleft(), query, session):
+                yield item
+    finally:
+        for call in calls:
+            if call['thread'] is not None:
+                call['thread'].join()
+
+
+def _start(batch, query, acquire, release):
+    call = {'batch': batch, 'thread': None, 'result': None,
+            'exc_info': None}
+    session = acquire()
+    if session is None:
+        return call
+
+    def run():
+        discard = True
+        try:
+            call['result'] = query(batch, session)
+            discard = False
+        except Exception:
+            call['exc_info'] = sys.exc_info()
+        finally:
+            release(session, discard=discard)
+
+    call['thread'] = threading.Thread(name='rule-batch', target=run)
+    call['thread'].daemon = True
+    call['thread'].start()
+    return call
+
+
+def _wait(call, query, session):
+    if call['thread'] is None:
+        return query(call['batch'], session)
+    call['thread'].join()
+    if call['exc_info'] is not None:
+        _reraise(*call['exc_info'])
+    return call['result']
@@ -0,0 +1,159 @@
+import time
+import logging
+import threading
+from .ticket import Ticket
+
+
+class RecallScheduler(object):
+    """
+    Order GET tickets by their location on tape.
+
+    Objects that are not online are recalled by requesting them. The
+    scheduler keeps the DMF data of the requested objects and orders the
+    offline tickets so that all objects of one tape are requested
+    together, in the order of their position on the tape. Tapes are
+    ordered by their oldest ticket.
+
+    The volume and position are taken from the first DMF field that
+    the rule returns from VOLUME_FIELDS and POSITION_FIELDS. Without
+    these fields the bit file id is used, which follows the order in
+    which the files have been migrated.
+
+    The DMF data expires after LOCATION_TTL seconds. Objects whose
+    query returned no DMF state are queried again with an exponential
+    backoff.
+    """
+    VOLUME_FIELDS = ['DMF_vsn', 'DMF_volume', 'DMF_tape']
+    POSITION_FIELDS = ['DMF_position', 'DMF_offset', 'DMF_chunkoffset']
+    ONLINE_STATES = ['DUL', 'REG']
+
+    # seconds until the DMF data of an object is queried again
+    LOCATION_TTL = 600
+
+    # backoff for objects without DMF state (e.g. the rule failed),
+    # the interval doubles with each failed query
+    MIN_RETRY = 10
+    MAX_RETRY = 600
+
+    def __init__(self, logger=logging.getLogger("DmIRodsServer")):
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.locations = {}
+        # remote_file -> (failed queries, time of the next query)
+        self.retries = {}
+
+    def unknown(self, tickets, now=None):
+        """
+        Tickets without (current) DMF data, except objects whose last
+        query returned no DMF state until their retry time.
+        """
+        if now is None:
+            now = time.time()
+        with self.lock:
+            ret = []
+            for t in tickets:
+                loc = self.locations.get(t.remote_file, None)
+                if loc is not None and self._expired(loc, now):
+                    del self.locations[t.remote_file]
+                    loc = None
+                if (loc is None and
+                        self.retries.get(t.remote_file, (0, 0))[1] <= now):
+                    ret.append(t)
+            return ret
+
+    def update(self, items, now=None):
+        """
+        Store the DMF data of items returned by GetDmfObject
+        """
+        if now is None:
+            now = time.time()
+        with self.lock:
+            for item in items:
+                remote_file = item.get('remote_file')
+                if 'DMF_state' not in item:
+                    failures = self.retries.get(remote_file, (0, 0))[0] + 1
+                    interval = min(self.MIN_RETRY * 2 ** (failures - 1),
+                                   self.MAX_RETRY)
+                    self.retries[remote_file] = (failures, now + interval)
+                    continue
+                self.retries.pop(remote_file, None)
+                self.locations[remote_file] = {
+                    'state': item.get('DMF_state'),
+                    'volume': self._first(item, self.VOLUME_FIELDS, ''),
+                    'position': self._to_int(
+                        self._first(item, self.POSITION_FIELDS, 0), 10),
+                    'bfid': self._to_int(item.get('DMF_bfid', 0), 16),
+                    'time': now}
+
+    def forget(self, remote_file):
+        with self.lock:
+            self.locations.pop(remote_file, None)
+            self.retries.pop(remote_file, None)
+
+    def evict_expired(self, now=None):
+        """
+        Drop expired DMF data and retry times of objects that have not
+        been queried again (e.g. deleted tickets)
+        """
+        if now is None:
+            now = time.time()
+        with self.lock:
+            for remote_file in [k for k, loc in self.locations.items()
+                                if self._expired(loc, now)]:
+                del self.locations[remote_file]
+            for remote_file in [k for k, (n, t) in self.retries.items()
+                                if t + self.LOCATION_TTL <= now]:
+                del self.retries[remote_file]
+
+    def is_online(self, remote_file):
+        with self.lock:
+            loc = self.locations.get(remote_file, None)
+        return loc is None or loc['state'] in self.ONLINE_STATES
+
+    def order(self, tickets):
+        """
+        Sort tickets: online objects and uploads first (oldest first),
+        then offline objects grouped by tape.
+        """
+        with self.lock:
+            locations = {t.remote_file: self.locations.get(t.remote_file)
+                         for t in tickets}
+        volume_time = {}
+        for t in tickets:
+            loc = locations[t.remote_file]
+            if loc is not None:
+                volume = loc['volume']
+                volume_time[volume] = min(volume_time.get(volume,
+                                                          t.time_created),
+                                          t.time_created)
+
+        def sort_key(t):
+            loc = locations[t.remote_file]
+            if (t.mode != Ticket.GET or loc is None or
+                    loc['state'] in self.ONLINE_STATES):
+                return (0, t.time_created, '', 0, 0)
+            else:
+                return (1,
+                        volume_time[loc['volume']],
+                        loc['volume'],
+                        loc['position'],
+                        loc['bfid'])
+
+        return sorted(tickets, key=sort_key)
+
+    def _expired(self, loc, now):
+        return loc['time'] + self.LOCATION_TTL <= now
+
+    @staticmethod
+    def _first(item, fields, default):
+        for f in fields:
+            if f in item:
+                return item[f]
+        return default
+
+    @staticmethod
+    def _to_int(value, base):
+        try:
+            return int(str(value), base)
+        except ValueError:
+            return 0
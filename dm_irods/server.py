@@ -2,6 +2,8 @@ import os
 import sys
 import json
 import time
+import itertools
+import threading
 import traceback
 from .irods_session import iRODS
 from .irods_session import GetDmfObject
@@ -12,6 +14,26 @@ from .socket_server.server import Server
 from .socket_server.server_app import ServerApp
 from .socket_server.util import ReturnCode
 from .ticket import Ticket
+from .ticket_store import TicketStore
+from .ticket_index import TicketIndex
+from .listing import TicketQuery
+from .bundle import BundleIndex
+from .bundle import tar_size
+from .bundle import write_bundle
+from .scheduler import RecallScheduler
+from .poller import DmfPoller
+from .dmf_cache import DmfCache
+from .checkpoint import Checkpoint
+from .worker_pool import WorkerPool
+from .walk import walk_tree
+from .walk import batches
+from .session_pool import SessionPool
+from .tuner import TransferTuner
+from .checksum_cache import ChecksumCache
+from .hashing_pool import HashingPool
+from .irods_session import GET_BLOCK_SIZE
+from .irods_session import STRIPE_STREAMS
+from .irods_session import STRIPE_THRESHOLD
 from .cprint import print_error
 
 
@@ -27,14 +49,39 @@ class DmIRodsServer(Server):
     TICK_INTERVAL = 10
     HOUSEKEEPING_INTERVAL = 3600
     # HOUSEKEEPING_INTERVAL = 10
+    # maximal time spent in housekeeping per tick (seconds)
+    HOUSEKEEPING_BUDGET = 1.0
+    # maximal number of tickets checked per tick
+    HOUSEKEEPING_BATCH = 100
+    # maximal interval between two checks of an existing object
+    HOUSEKEEPING_MAX_INTERVAL = 7 * 24 * 3600
+    # minimal time between two housekeeping runs without due tickets
+    HOUSEKEEPING_BACKOFF = 60
 
     LIST_BUFF_SIZE = 10
+    # GenQuery columns of objects without tickets in listings,
+    # the DMF rule adds the other attributes
+    LIST_COLUMNS = ['collection', 'object', 'remote_size',
+                    'remote_modify_time']
+
+    GET_WORKERS = 4
+    PUT_WORKERS = 2
+
+    # tickets registered per lock acquisition
+    REGISTER_BATCH = 1000
+    # finished tickets merged per lock acquisition by load_history
+    HISTORY_BATCH = 1000
 
     @staticmethod
     def get_socket_file():
         return os.path.join(os.path.expanduser("~"),
                             ".DmIRodsServer", "DmIRodsServer.socket")
 
+    @staticmethod
+    def get_bundle_dir():
+        return os.path.join(os.path.expanduser("~"),
+                            ".DmIRodsServer", "Bundles")
+
     def __init__(self, socket_file, **kwargs):
         kwargs['tick_sec'] = DmIRodsServer.TICK_INTERVAL
         super(DmIRodsServer, self).__init__(DmIRodsServer.get_socket_file(),
@@ -43,15 +90,27 @@ class DmIRodsServer(Server):
         config.ensure_configured()
 
         # ticket configuration
-        self.ticket_dir = os.path.join(os.path.expanduser("~"),
-                                       ".DmIRodsServer",
-                                       "Tickets")
+        work_dir = os.path.join(os.path.expanduser("~"), ".DmIRodsServer")
+        # tickets of older versions (one json file per ticket)
+        self.ticket_dir = os.path.join(work_dir, "Tickets")
         self.tickets = {}
         self.active_tickets = {}
+        self.ticket_index = TicketIndex()
+        # protects tickets, active_tickets, ticket_index and
+        # the ticket store
+        self.lock = threading.RLock()
+        # serializes load_history, which reads without holding lock
+        self.history_lock = threading.Lock()
+        # tickets deleted while the history is loaded
+        self.history_deleted = None
 
-        if not os.path.exists(self.ticket_dir):
-            os.makedirs(self.ticket_dir)
+        if not os.path.exists(work_dir):
+            os.makedirs(work_dir)
+        self.ticket_store = TicketStore(os.path.join(work_dir, "tickets.db"),
+                                        logger=self.logger)
         self.read_tickets()
+        self.bundles = BundleIndex(DmIRodsServer.get_bundle_dir(),
+                                   logger=self.logger)
 
         # check if system is configured config
         self.dm_irods_config = DmIRodsConfig(logger=self.logger)
@@ -61,7 +120,8 @@ class DmIRodsServer(Server):
         self.config = self.dm_irods_config.config
 
         # houskeeping
-        self.last_housekeeping = time.time()
+        self.housekeeping_start = (time.time() +
+                                   DmIRodsServer.HOUSEKEEPING_INTERVAL)
         self.housekeeping_interval = DmIRodsServer.HOUSEKEEPING_INTERVAL
 
         # read irods configuiration for irods env
@@ -84,9 +144,67 @@ class DmIRodsServer(Server):
 
         # managing remote completion list
         self.completion_list = []
+        self.completion_list_coll = None
         self.completion_list_updated = 0
         self.completion_list_timeout = 60
 
+        # striped transfer of large objects (threshold in MB)
+        self.stripe_threshold = self.config.get('stripe_threshold', None)
+        if self.stripe_threshold is not None:
+            self.stripe_threshold *= 1024 * 1024
+
+        # adaptive block size and number of streams
+        self.tuning_key = '%s:%s' % (cfg.get('irods_host', ''),
+                                     self.config.get('resource_name', ''))
+        if self.config.get('auto_tune', False):
+            tuning_file = os.path.join(self.dm_irods_config.config_dir,
+                                       'tuning.json')
+            self.tuner = TransferTuner(tuning_file,
+                                       GET_BLOCK_SIZE,
+                                       self.config.get('stripe_streams',
+                                                       STRIPE_STREAMS),
+                                       logger=self.logger)
+        else:
+            self.tuner = None
+
+        # checksums of unchanged local files
+        self.checksum_cache = ChecksumCache(
+            os.path.join(self.dm_irods_config.config_dir, 'checksums.log'),
+            logger=self.logger)
+        hash_workers = self.config.get('hash_workers', None)
+        if hash_workers == 0:
+            self.hashing_pool = None
+        else:
+            self.hashing_pool = HashingPool(self.checksum_cache,
+                                            workers=hash_workers,
+                                            logger=self.logger)
+
+        # authenticated iRODS sessions shared by all requests and workers
+        self.session_pool = SessionPool(
+            lambda: self.irods_connection().create_session(),
+            check=iRODS.check_session,
+            max_size=self.config.get('session_pool_size', None),
+            max_total=self.config.get('max_sessions', None),
+            logger=self.logger)
+
+        # order of recalls from tape
+        self.recall_scheduler = RecallScheduler(logger=self.logger)
+        # DMF state checks of objects that are being staged
+        self.poller = DmfPoller(logger=self.logger)
+        # DMF state shared by listings and the poller
+        self.dmf_cache = DmfCache(self.config.get('dmf_cache_ttl', None),
+                                  logger=self.logger)
+
+        # transfer workers
+        self.get_pool = WorkerPool('get',
+                                   self.config.get('get_workers',
+                                                   DmIRodsServer.GET_WORKERS),
+                                   logger=self.logger)
+        self.put_pool = WorkerPool('put',
+                                   self.config.get('put_workers',
+                                                   DmIRodsServer.PUT_WORKERS),
+                                   logger=self.logger)
+
     def irods_connection(self):
         """
         Create iRODS session object
@@ -99,37 +217,129 @@ class DmIRodsServer(Server):
                                                    None),
                      is_resource_server=self.config.get('is_resource_server',
                                                         None),
+                     stripe_streams=self.config.get('stripe_streams', None),
+                     stripe_threshold=self.stripe_threshold,
+                     tuner=self.tuner,
+                     tuning_key=self.tuning_key,
+                     session_pool=self.session_pool,
+                     checksum_cache=self.checksum_cache,
                      logger=self.logger)
 
     def read_tickets(self):
-        for root, dirs, files in os.walk(self.ticket_dir):
-            for file in files:
-                if file.endswith(".json"):
-                    self.read_ticket_from_file(os.path.join(root, file))
-
-    def read_ticket_from_file(self, ticket_file):
-        self.logger.info("reading ticket from file %s", ticket_file)
-        try:
-            with open(ticket_file, "r") as f:
-                data = json.load(f)
-            ticket = Ticket.from_json(data)
+        """
+        Load the active tickets. The history (finished tickets) is
+        loaded on demand by load_history, the attributes of local
+        files are refreshed in the background.
+        """
+        if os.path.isdir(self.ticket_dir):
+            self.ticket_store.import_ticket_dir(self.ticket_dir)
+        self.history_loaded = False
+        refresh = []
+        for ticket in self.ticket_store.load(Ticket.ACTIVE_CODES):
             if ticket.status in [Ticket.GETTING, Ticket.PUTTING]:
                 ticket.retry()
                 ticket.retries = 3
+                self.ticket_store.save(ticket)
             p = (ticket.local_file, ticket.remote_file)
             self.tickets[p] = ticket
-            if ticket.is_active():
-                self.active_tickets[p] = ticket
-        except Exception as ex:
-            self.logger.error("failed to read from file %s:", ticket_file)
-            self.logger.error("failed to read from file %s:", str(ex))
-            raise
+            self.active_tickets[p] = ticket
+            self.ticket_index.update(ticket)
+            if ticket.mode == Ticket.PUT:
+                refresh.append(p)
+        self.ticket_store.commit()
+        self.logger.info("read %d active tickets", len(self.active_tickets))
+        if refresh:
+            thread = threading.Thread(name='refresh',
+                                      target=self.refresh_local_attributes,
+                                      args=(refresh,))
+            thread.daemon = True
+            thread.start()
 
-        if ticket.mode == Ticket.PUT:
+    def refresh_local_attributes(self, keys):
+        for p in keys:
+            with self.lock:
+                ticket = self.tickets.get(p, None)
+            if ticket is None or ticket.mode != Ticket.PUT:
+                continue
             ticket.update_local_attributes()
-            with open(ticket_file, 'w') as f:
-                f.write(ticket.to_json())
-        self.logger.info(ticket.to_json())
+            with self.lock:
+                if p in self.tickets:
+                    self.update_ticket(p[0], p[1])
+        self.commit_tickets()
+
+    def load_history(self):
+        """
+        Load the finished tickets from the ticket store (once). The
+        tickets are read without holding the lock and merged in
+        batches of HISTORY_BATCH tickets.
+        """
+        if self.history_loaded:
+            return
+        with self.history_lock:
+            if self.history_loaded:
+                return
+            with self.lock:
+                self.history_deleted = set()
+            n = 0
+            batch = []
+            for ticket in self.ticket_store.load(Ticket.INACTIVE_CODES):
+                batch.append(ticket)
+                if len(batch) >= DmIRodsServer.HISTORY_BATCH:
+                    n += self._merge_history(batch)
+                    batch = []
+            with self.lock:
+                n += self._merge_history(batch)
+                self.history_deleted = None
+                self.history_loaded = True
+        self.logger.info("read %d finished tickets", n)
+
+    def _merge_history(self, tickets):
+        """
+        Add stored tickets unless they are in memory (the tickets in
+        memory are newer) or have been deleted in the meantime.
+        """
+        n = 0
+        with self.lock:
+            for ticket in tickets:
+                p = (ticket.local_file, ticket.remote_file)
+                if p not in self.tickets and p not in self.history_deleted:
+                    self._add_stored_ticket(ticket)
+                    n += 1
+        return n
+
+    def lookup_ticket(self, p):
+        """
+        Ticket for (local_file, remote_file) from memory or from the
+        ticket store if the history has not been loaded yet.
+        """
+        with self.lock:
+            ticket = self.tickets.get(p, None)
+            if ticket is None and not self.history_loaded:
+                ticket = self.ticket_store.get(p[0], p[1])
+                if ticket is not None:
+                    self._add_stored_ticket(ticket)
+            return ticket
+
+    def lookup_remote_file(self, remote_file):
+        """
+        Tickets of an object, ordered by status (Ticket.sorted_codes),
+        the latest ticket of a status first
+        """
+        with self.lock:
+            if not self.history_loaded:
+                for ticket in self.ticket_store.by_remote_file(remote_file):
+                    p = (ticket.local_file, ticket.remote_file)
+                    if p not in self.tickets:
+                        self._add_stored_ticket(ticket)
+            rank = {c: i for i, c in enumerate(Ticket.sorted_codes)}
+            return sorted((self.tickets[p] for p in
+                           self.ticket_index.by_remote_file(remote_file)),
+                          key=lambda t: (rank[t.status], -t.time_created))
+
+    def _add_stored_ticket(self, ticket):
+        p = (ticket.local_file, ticket.remote_file)
+        self.tickets[p] = ticket
+        self.ticket_index.update(ticket)
 
     def process(self, code, data):
         self.heartbeat = time.time()
@@ -150,6 +360,20 @@ class DmIRodsServer(Server):
         if "list" in obj:
             for code, item in self.process_list(obj):
                 yield code, item
+        elif "get_many" in obj:
+            for code, item in self.process_register_many(obj['get_many'],
+                                                         Ticket.GET):
+                yield code, item
+        elif "put_many" in obj:
+            for code, item in self.process_register_many(obj['put_many'],
+                                                         Ticket.PUT):
+                yield code, item
+        elif "get" in obj and obj.get('recursive', False):
+            for code, item in self.process_get_recursive(obj):
+                yield code, item
+        elif "put" in obj and obj.get('recursive', False):
+            for code, item in self.process_put_recursive(obj):
+                yield code, item
         elif "completion_list" in obj:
             for code, item in self.process_completion_list(obj):
                 yield code, item
@@ -175,6 +399,11 @@ class DmIRodsServer(Server):
                                        "exception": e.__class__.__name__,
                                        "traceback": traceback.format_exc()})
         if isinstance(remote_file, str):
+            member = self.bundles.lookup(remote_file)
+            if member is not None:
+                return (ReturnCode.OK,
+                        self.register_bundle_member(local_file, remote_file,
+                                                    member[0], member[1]))
             return (ReturnCode.OK,
                     self.register_ticket(local_file, remote_file, Ticket.GET))
         else:
@@ -208,6 +437,15 @@ class DmIRodsServer(Server):
                                        "exception": e.__class__.__name__,
                                        "traceback": traceback.format_exc()})
         if isinstance(local_file, str):
+            if 'bundle' in obj:
+                members = [[str(name), str(f)] for name, f in obj['bundle']]
+                ret = self.register_ticket(local_file, remote_file,
+                                           Ticket.PUT,
+                                           bundle_members=members)
+                if (ret.get('ticket') is not None and
+                        ret.get('code') != DmIRodsServer.ALREADY_REGISTERED):
+                    self.bundles.add(remote_file, members)
+                return ReturnCode.OK, ret
             return (ReturnCode.OK,
                     self.register_ticket(local_file, remote_file, Ticket.PUT))
         else:
@@ -219,6 +457,88 @@ class DmIRodsServer(Server):
                     {"code": DmIRodsServer.FAILED,
                      "msg": "invalid type: %s" % s})
 
+    def process_register_many(self, pairs, mode):
+        """
+        Register a list of [local_file, remote_file] pairs
+        (get_many / put_many).
+        """
+        def items():
+            for local_file, remote_file in pairs:
+                if sys.version_info[0] == 2:
+                    remote_file = remote_file.encode()
+                    local_file = local_file.encode()
+                remote_file = remote_file.format(zone=self.zone,
+                                                 user=self.user)
+                if not os.path.isabs(remote_file):
+                    remote_file = os.path.join(self.default_path,
+                                               remote_file)
+                yield local_file, remote_file
+
+        for code, item in self.register_many(items(), mode):
+            yield code, item
+
+    def process_get_recursive(self, obj):
+        """
+        Register all objects of a collection and its sub-collections.
+        obj['local_file'] is the target directory.
+        """
+        coll = obj["get"]
+        local_dir = obj['local_file']
+        if sys.version_info[0] == 2:
+            coll = coll.encode()
+            local_dir = local_dir.encode()
+        coll = coll.format(zone=self.zone, user=self.user).rstrip('/')
+        if not os.path.isabs(coll):
+            coll = os.path.join(self.default_path, coll)
+
+        def items():
+            last_dir = None
+            with self.irods_connection() as irods:
+                for remote_file in irods.walk_collection(coll):
+                    rel = remote_file[len(coll) + 1:]
+                    local_file = os.path.join(local_dir, *rel.split('/'))
+                    dirname = os.path.dirname(local_file)
+                    if dirname != last_dir:
+                        if not os.path.isdir(dirname):
+                            os.makedirs(dirname)
+                        last_dir = dirname
+                    yield local_file, remote_file
+
+        for code, item in self.register_many(items(), Ticket.GET):
+            yield code, item
+
+    def process_put_recursive(self, obj):
+        """
+        Register all files of a directory and its sub-directories.
+        obj['remote_file'] is the target collection, it is created
+        with its sub-collections during the enumeration.
+        """
+        local_dir = obj['put']
+        coll = obj["remote_file"]
+        if sys.version_info[0] == 2:
+            coll = coll.encode()
+            local_dir = local_dir.encode()
+        coll = coll.format(zone=self.zone, user=self.user).rstrip('/')
+        if not os.path.isdir(local_dir):
+            yield (ReturnCode.ERROR,
+                   {"code": DmIRodsServer.FAILED,
+                    "msg": "%s is not a directory" % local_dir})
+            return
+
+        def items():
+            with self.irods_connection() as irods:
+                irods.create_collection(coll)
+                for local_file, is_dir in walk_tree(local_dir):
+                    rel = os.path.relpath(local_file, local_dir)
+                    remote_file = '/'.join([coll] + rel.split(os.sep))
+                    if is_dir:
+                        irods.create_collection(remote_file)
+                    elif os.path.isfile(local_file):
+                        yield local_file, remote_file
+
+        for code, item in self.register_many(items(), Ticket.PUT):
+            yield code, item
+
     def process_info(self, obj):
         remote_file = obj['info']
         try:
@@ -231,23 +551,37 @@ class DmIRodsServer(Server):
                                        "exception": e.__class__.__name__,
                                        "traceback": traceback.format_exc()})
 
-        filters = {'object': os.path.basename(remote_file),
-                   'collection': os.path.dirname(remote_file)}
-        for code, item in self.process_list_dict({'limit': 1,
-                                                  'filter': filters}):
-            if item.get('remote_file') == remote_file:
+        # the latest ticket of the most relevant status or the object
+        tickets = self.lookup_remote_file(remote_file)
+        with self.irods_connection() as irods:
+            if tickets:
+                item = self.ticket_item(tickets[0])
+            else:
+                filters = {'object': os.path.basename(remote_file),
+                           'collection': os.path.dirname(remote_file)}
+                item = next(irods.list_objects(filters=filters, limit=1),
+                            None)
+                if item is None:
+                    return ReturnCode.OK, {}
+            rule = GetDmfObject(irods)
+            for item in self.dmf_cache.process_all([item], rule.process_all):
+                self.check_locally_deleted(item)
                 return ReturnCode.OK, json.dumps(item)
         return ReturnCode.OK, {}
 
-    def process_list_dict(self, obj):
-        def check_locally_deleted(item):
-            # check if file has been deleted:
-            if (item.get('local_size', None) is None and
-                item.get('local_file', None) is not None):
-                item['local_file'] = 'DELETED:' + item['local_file']
+    @staticmethod
+    def check_locally_deleted(item):
+        # check if file has been deleted:
+        if (item.get('local_size', None) is None and
+            item.get('local_file', None) is not None):
+            item['local_file'] = 'DELETED:' + item['local_file']
 
+    def process_list_dict(self, obj):
         limit = obj.get('limit', None)
         flt = obj.get('filter', {})
+        query = TicketQuery(flt,
+                            sort=obj.get('sort', None),
+                            cursor=obj.get('cursor', None))
         if limit is None:
             limit = 1000000000
             arglimit = -1
@@ -257,24 +591,28 @@ class DmIRodsServer(Server):
         with self.irods_connection() as irods:
             rule = GetDmfObject(irods)
             tickets_done = {}
-            for item in rule.process_all(self.list_tickets(flt)):
+            items = itertools.islice(self.list_tickets(query), limit)
+            for item in self.dmf_cache.process_all(items, rule.process_all):
                 remote_file = item.get('remote_file')
                 tickets_done[remote_file] = True
                 limit -= 1
-                check_locally_deleted(item)
+                self.check_locally_deleted(item)
                 yield ReturnCode.OK, item
                 if limit == 0:
                     break
 
         # then check if there are objects without tickets
-        if limit > 0 and not flt.get('active', False):
+        if limit > 0 and query.with_objects:
             with self.irods_connection() as irods:
                 rule = GetDmfObject(irods)
                 lst_func = self.list_objects
-                for item in rule.process_all(lst_func(tickets_done,
-                                                      limit=arglimit)):
+                for item in self.dmf_cache.process_all(
+                        lst_func(tickets_done,
+                                 limit=arglimit,
+                                 columns=DmIRodsServer.LIST_COLUMNS),
+                        rule.process_all):
                     limit -= 1
-                    check_locally_deleted(item)
+                    self.check_locally_deleted(item)
                     yield ReturnCode.OK, item
                     if limit == 0:
                         break
@@ -283,35 +621,36 @@ class DmIRodsServer(Server):
         for s, item in self.process_list_dict(obj):
             yield s, json.dumps(item)
 
-    def list_tickets(self, flt={}):
-        def sort_key(x):
-            return Ticket.sorted_codes.index(x.status)
+    def list_tickets(self, query):
+        """
+        Generator over the items of the tickets that match a
+        TicketQuery, in its sort order. Each item has a cursor to
+        continue the listing after it.
+        """
+        if query.needs_history():
+            self.load_history()
+        for ticket in query.tickets(self.ticket_index, self.tickets,
+                                    self.lock):
+            item = self.ticket_item(ticket)
+            item['cursor'] = query.cursor(ticket)
+            yield item
 
-        def filter_ticket(x):
-            if flt.get('active', False):
-                return x.is_active()
-            else:
-                return True
-
-        ticket_list = sorted([t for t in self.tickets.values()
-                              if filter_ticket(t)],
-                             key=lambda x: x.time_created)
-        ticket_list = sorted(ticket_list,
-                             key=sort_key, reverse=False)
-        for ticket in ticket_list:
+    def ticket_item(self, ticket):
+        with self.lock:
             item = ticket.to_dict()
-            remote_file = item.get('remote_file')
-            item['collection'] = os.path.dirname(remote_file)
-            item['object'] = os.path.basename(remote_file)
-            yield item
+        item['collection'] = ticket.collection
+        item['object'] = ticket.object
+        return item
 
-    def list_objects(self, tickets_done={}, filters={}, limit=-1):
+    def list_objects(self, tickets_done={}, filters={}, limit=-1,
+                     columns=None):
         """
         Return a generator over all objects of the resource.
         ticket_done is a ignore list
         """
         with self.irods_connection() as irods:
-            for item in irods.list_objects(filters=filters, limit=limit):
+            for item in irods.list_objects(filters=filters, limit=limit,
+                                           columns=columns):
                 if item['remote_file'] not in tickets_done:
                     yield item
 
@@ -319,11 +658,21 @@ class DmIRodsServer(Server):
         now = time.time()
         age = now - self.completion_list_updated
         prefix = obj.get('completion_list', '')
-        if age > self.completion_list_timeout:
+        # objects in the collection of the prefix and its sub-collections
+        coll = os.path.dirname(prefix).rstrip('/')
+        cached = self.completion_list_coll
+        if (age > self.completion_list_timeout or cached is None or
+                not (coll + '/').startswith(cached + '/')):
             self.completion_list = []
+            self.completion_list_coll = coll
             self.completion_list_updated = now
+            if coll:
+                filters = {'collection_prefix': coll}
+            else:
+                filters = {}
             with self.irods_connection() as irods:
-                for obj in irods.list_objects():
+                for obj in irods.list_objects(filters=filters, columns=[],
+                                              ordered=False):
                     filename = "%s/%s" % (obj.get('collection', ''),
                                           obj.get('object'))
                     self.completion_list.append(filename)
@@ -331,9 +680,75 @@ class DmIRodsServer(Server):
             if filename.startswith(prefix):
                 yield ReturnCode.OK, filename
 
-    def register_ticket(self, local_file, remote_file, mode):
+    def register_ticket(self, local_file, remote_file, mode,
+                        bundle_members=[]):
+        with self.lock:
+            ret = self._register_ticket(local_file, remote_file, mode)
+            if (bundle_members and ret.get('ticket') is not None and
+                    ret.get('code') != DmIRodsServer.ALREADY_REGISTERED):
+                ticket = self.tickets[(local_file, remote_file)]
+                ticket.bundle_members = [list(m) for m in bundle_members]
+                if mode == Ticket.PUT:
+                    # the container is streamed from the members
+                    ticket.local_size = tar_size(ticket.bundle_members)
+                self.update_ticket(local_file, remote_file)
+                ret['ticket'] = ticket.to_dict()
+        self.commit_tickets()
+        return ret
+
+    def register_bundle_member(self, local_file, remote_file,
+                               container, name):
+        """
+        Request a member of a bundle. The container is retrieved once
+        for all members that are requested until the download has
+        finished.
+        """
+        cache_file = self.bundles.cache_file(container)
+        p = (cache_file, container)
+        with self.lock:
+            ticket = self.tickets.get(p, None)
+            if ticket is not None and ticket.is_active():
+                if ticket.bundle_members is None:
+                    # container requested as a plain object before
+                    ticket.bundle_members = []
+                if [name, local_file] not in ticket.bundle_members:
+                    ticket.bundle_members.append([name, local_file])
+                    self.update_ticket(cache_file, container)
+                return {"file": '%s <> %s' % (local_file, remote_file),
+                        "ticket": ticket.to_dict(),
+                        "code": DmIRodsServer.OK,
+                        "msg": "scheduled (bundle)"}
+            ret = self.register_ticket(cache_file, container, Ticket.GET,
+                                       bundle_members=[[name, local_file]])
+            ret['file'] = '%s <> %s' % (local_file, remote_file)
+            return ret
+
+    def register_many(self, items, mode):
+        """
+        Register tickets for an iterator over (local_file, remote_file).
+        The items are consumed in batches of REGISTER_BATCH, each batch
+        is registered with a single lock acquisition.
+        Generator of the results of the tickets.
+        """
+        for batch in batches(items, DmIRodsServer.REGISTER_BATCH):
+            with self.lock:
+                results = [self._register_one(local_file, remote_file, mode)
+                           for local_file, remote_file in batch]
+            self.commit_tickets()
+            for res in results:
+                yield ReturnCode.OK, res
+
+    def _register_one(self, local_file, remote_file, mode):
+        if mode == Ticket.GET:
+            member = self.bundles.lookup(remote_file)
+            if member is not None:
+                return self.register_bundle_member(local_file, remote_file,
+                                                   member[0], member[1])
+        return self._register_ticket(local_file, remote_file, mode)
+
+    def _register_ticket(self, local_file, remote_file, mode):
         p = (local_file, remote_file)
-        ticket = self.tickets.get(p, None)
+        ticket = self.lookup_ticket(p)
         if ticket is not None:
             if ticket.is_active():
                 return {"file": '%s <> %s' % (local_file, remote_file),
@@ -371,130 +786,282 @@ class DmIRodsServer(Server):
     def create_ticket(self, local_file, remote_file, mode):
         ticket = Ticket(local_file, remote_file, mode=mode)
         p = (local_file, remote_file)
-        tjson = ticket.to_json()
-        tfile = os.path.join(self.ticket_dir, ticket.ticket_file)
-        self.tickets[p] = ticket
-        self.active_tickets[p] = ticket
-        with open(tfile, "w") as fp:
-            fp.write(tjson)
+        with self.lock:
+            self.tickets[p] = ticket
+            self.active_tickets[p] = ticket
+            self.ticket_index.update(ticket)
+            self.ticket_store.save(ticket)
         return ticket
 
     def update_ticket(self, local_file, remote_file):
-        ticket = self.tickets[(local_file, remote_file)]
-        with open(os.path.join(self.ticket_dir,
-                               ticket.ticket_file), "w") as fp:
-            fp.write(ticket.to_json())
+        with self.lock:
+            ticket = self.tickets[(local_file, remote_file)]
+            self.ticket_index.update(ticket)
+            self.ticket_store.save(ticket)
 
-    def delete_ticket(self,  local_file, remote_file):
-        p = (local_file, remote_file)
-        ticket = self.tickets[p]
-        ticket_file = os.path.join(self.ticket_dir,
-                                   ticket.ticket_file)
-        self.logger.info('remove ticket for %s <->', ticket_file)
-        del self.tickets[p]
-        if p in self.active_tickets:
-            del self.active_tickets[p]
+    def commit_tickets(self):
+        """
+        Write the changed tickets to the ticket store
+        """
         try:
-            os.remove(ticket_file)
+            self.ticket_store.commit()
         except Exception as e:
-            self.logger.warning('cannot remove ticket file %s', ticket_file)
-            self.logger.error(e.__class__.__name__)
-            self.logger.error(str(e))
-            for line in traceback.format_exc().split('\n'):
-                self.logger.error(line)
+            self.logger.error('failed to write tickets')
+            self._log_exception(e, traceback.format_exc())
+
+    def set_ticket_status(self, p, status):
+        """
+        Change the status of a ticket and remove it from the active
+        tickets if the transfer has finished.
+        """
+        with self.lock:
+            ticket = self.tickets[p]
+            ticket.status = status
+            self.ticket_index.update(ticket)
+            if not ticket.is_active():
+                self.active_tickets.pop(p, None)
+                self.recall_scheduler.forget(ticket.remote_file)
+                self.poller.forget(ticket.remote_file)
+
+    def delete_ticket(self,  local_file, remote_file):
+        p = (local_file, remote_file)
+        with self.lock:
+            self.logger.info('remove ticket for %s <-> %s',
+                             local_file, remote_file)
+            self.tickets.pop(p, None)
+            self.active_tickets.pop(p, None)
+            self.ticket_index.remove(p)
+            self.ticket_store.delete(local_file, remote_file)
+            if self.history_deleted is not None:
+                self.history_deleted.add(p)
 
     def tick(self):
         self.housekeeping()
-        keys = list(self.active_tickets.keys())
-        for p in keys:
-            ticket = self.active_tickets[p]
+        self.session_pool.evict_idle()
+        self.dmf_cache.evict_expired()
+        self.recall_scheduler.evict_expired()
+        self.commit_tickets()
+        with self.lock:
+            tickets = list(self.active_tickets.values())
+        tickets = self.poll_dmf_state(tickets)
+        for ticket in self.recall_scheduler.order(tickets):
+            p = (ticket.local_file, ticket.remote_file)
             if not self.active:
                 break
             if ticket.status in [Ticket.UNMIG, Ticket.WAITING, Ticket.RETRY]:
                 self.heartbeat = time.time()
                 if ticket.mode == Ticket.GET:
-                    self._tick_download(p, ticket)
+                    self.get_pool.submit(p, self._tick_download, p, ticket)
                 else:
-                    self._tick_upload(p, ticket)
-        if not self.active_tickets and self.stop_timeout > 0:
+                    self.put_pool.submit(p, self._tick_upload, p, ticket)
+        self.precompute_checksums(tickets)
+        if (not self.active_tickets and self.stop_timeout > 0 and
+                self.get_pool.num_pending() == 0 and
+                self.put_pool.num_pending() == 0):
             last_heartbeat = time.time() - self.heartbeat
             if last_heartbeat > self.stop_timeout:
                 self.logger.info('stop daemon due to inactivity')
                 self.active = False
 
+    def precompute_checksums(self, tickets):
+        """
+        Hash the files of queued uploads in the hashing pool while
+        the put workers are busy with other files.
+        Sequential uploads hash the file while streaming it, only files
+        that will be striped are hashed in advance.
+        """
+        if self.hashing_pool is None:
+            return
+        for ticket in tickets:
+            p = (ticket.local_file, ticket.remote_file)
+            if (ticket.mode == Ticket.PUT and
+                    self.will_stripe(ticket) and
+                    self.put_pool.is_pending(p) and
+                    not self.put_pool.is_running(p)):
+                if not self.hashing_pool.submit(ticket.local_file):
+                    break
+
+    def will_stripe(self, ticket):
+        """
+        True if the upload of the ticket is striped (see iRODS.is_striped).
+        With a tuner, the number of streams is only known when the
+        transfer starts.
+        """
+        if ticket.local_size is None:
+            return False
+        threshold = self.stripe_threshold
+        if threshold is None:
+            threshold = STRIPE_THRESHOLD
+        streams = self.config.get('stripe_streams', STRIPE_STREAMS)
+        if self.tuner is None and streams <= 1:
+            return False
+        return ticket.local_size >= threshold
+
+    def poll_dmf_state(self, tickets):
+        """
+        Query the DMF state of GET tickets that are not known to the
+        recall scheduler and of UNMIG tickets that are due for a check,
+        all in one rule call.
+
+        Returns the tickets that can be dispatched: UNMIG tickets are
+        only dispatched when their object is online.
+        """
+        unmig = [t for t in tickets
+                 if t.mode == Ticket.GET and t.status == Ticket.UNMIG]
+        due = self.poller.due(unmig)
+        unknown = self.recall_scheduler.unknown(
+            [t for t in tickets
+             if t.mode == Ticket.GET and t.status != Ticket.UNMIG])
+        query = unknown + due
+        if not query:
+            return [t for t in tickets if t.status != Ticket.UNMIG]
+        # the state of staging objects must be fresh
+        for t in due:
+            self.dmf_cache.invalidate(t.remote_file)
+        try:
+            with self.irods_connection() as irods:
+                rule = GetDmfObject(irods)
+                items = ({'remote_file': t.remote_file,
+                          'local_file': t.local_file}
+                         for t in query)
+                items = list(self.dmf_cache.process_all(items,
+                                                        rule.process_all))
+        except Exception as e:
+            # the transfer attempt will check the state
+            self.logger.error('failed to get DMF state of requested objects')
+            self._log_exception(e, traceback.format_exc())
+            return [t for t in tickets
+                    if t.status != Ticket.UNMIG or t in due]
+        # items is a list: it is read by the scheduler and the poller
+        self.recall_scheduler.update(items)
+        online = self.poller.check(due, items)
+        return [t for t in tickets
+                if t.status != Ticket.UNMIG or t.remote_file in online]
+
+    def tear_down(self):
+        self.logger.info('waiting for running transfers')
+        self.get_pool.shutdown()
+        self.put_pool.shutdown()
+        self.session_pool.close()
+        self.ticket_store.close()
+        if self.hashing_pool is not None:
+            self.hashing_pool.shutdown()
+
     def _tick_download(self, p, ticket):
+        if not self.active:
+            return
         self.heartbeat = time.time()
         with self.irods_connection() as irods:
             try:
                 self.logger.info('get %s -> %s' % (p[1], p[0]))
-                self.tickets[p].status = Ticket.GETTING
-                irods.get(ticket)
+                self.set_ticket_status(p, Ticket.GETTING)
+                irods.get(ticket, checkpoint=self.checkpoint(p, ticket))
                 self.logger.info('done %s -> %s (%d s)',
                                  p[1],
                                  p[0],
                                  ticket.transfer_time)
-                self.tickets[p].status = Ticket.DONE
-                del self.active_tickets[p]
+                if ticket.bundle_members:
+                    self.extract_bundle(p, ticket)
+                else:
+                    self.set_ticket_status(p, Ticket.DONE)
                 self.update_ticket(p[0], p[1])
             except RULE_FAILED_ERR as e:
                 # state unmigrate
-                self.active_tickets[p].unmig()
+                with self.lock:
+                    ticket.unmig()
+                    self.update_ticket(p[0], p[1])
+                self.poller.start(ticket.remote_file)
                 self.logger.debug('failed rule %s', str(e))
             except NetworkException as e:
+                irods.invalidate()
                 fmt = 'failed to get {remote} -> {local}'
                 self._transfer_network_handling(p, e, fmt)
             except Exception as e:
                 fmt = 'failed to get {remote} -> {local}'
                 self._transfer_exception_handling(p, e, fmt)
+        self.dmf_cache.invalidate(ticket.remote_file)
         self.heartbeat = time.time()
 
     def _tick_upload(self, p, ticket):
+        if not self.active:
+            return
         self.heartbeat = time.time()
         with self.irods_connection() as irods:
             try:
-                if not os.path.isfile(self.tickets[p].local_file):
-                    raise IOError('file %s does not exist' %
-                                  self.tickets[p].local_file)
-                self.tickets[p].update_local_checksum()
-                self.logger.info('chcksum %s:%s',
-                                 self.tickets[p].local_file,
-                                 self.tickets[p].checksum)
-                self.logger.info('put %s -> %s', p[0], p[1])
-                self.tickets[p].status = Ticket.PUTTING
-                irods.put(ticket)
+                if ticket.bundle_members is not None:
+                    self.logger.info('put bundle %s -> %s', p[0], p[1])
+                    self.set_ticket_status(p, Ticket.PUTTING)
+                    members = list(ticket.bundle_members)
+                    irods.put_stream(ticket,
+                                     lambda fileobj, bufsize:
+                                     write_bundle(members, fileobj, bufsize))
+                else:
+                    if not os.path.isfile(ticket.local_file):
+                        raise IOError('file %s does not exist' %
+                                      ticket.local_file)
+                    self.logger.info('put %s -> %s', p[0], p[1])
+                    self.set_ticket_status(p, Ticket.PUTTING)
+                    irods.put(ticket,
+                              checkpoint=self.checkpoint(p, ticket))
                 self.logger.info('done %s -> %s (%f s)',
                                  p[0],
                                  p[1],
                                  ticket.transfer_time)
-                self.tickets[p].status = Ticket.DONE
-                del self.active_tickets[p]
+                self.set_ticket_status(p, Ticket.DONE)
                 self.update_ticket(p[0], p[1])
             except NetworkException as e:
+                irods.invalidate()
                 fmt = 'failed to put {local} -> {remote}'
                 self._transfer_network_handling(p, e, fmt)
             except Exception as e:
                 fmt = 'failed to put {local} -> {remote}'
                 self._transfer_exception_handling(p, e, fmt)
+        self.dmf_cache.invalidate(ticket.remote_file)
         self.heartbeat = time.time()
 
+    def extract_bundle(self, p, ticket):
+        """
+        Extract the requested members from a retrieved container.
+        Members that are requested during the extraction are extracted
+        as well, before the ticket is set to DONE.
+        """
+        extracted = []
+        while True:
+            with self.lock:
+                members = [m for m in ticket.bundle_members
+                           if m not in extracted]
+                if not members:
+                    self.set_ticket_status(p, Ticket.DONE)
+                    break
+            self.bundles.extract(ticket.local_file, members)
+            extracted += members
+        os.remove(ticket.local_file)
+
+    def checkpoint(self, p, ticket):
+        """
+        Checkpoint that writes the ticket file whenever a block
+        has been transferred
+        """
+        return Checkpoint(ticket,
+                          callback=lambda: self.update_ticket(p[0], p[1]))
+
     def _transfer_network_handling(self, p, excep, fmt):
-        self.tickets[p].status == Ticket.RETRY
         errmsg = fmt.format(local=p[1], remote=p[0]) + ':'
         errmsg += '\n' + self._exception2string(excep, traceback.format_exc())
-        if self.tickets[p].retries > 0:
-            self.logger.warning(errmsg)
-            self.logger.warning('remaining %d trials', self.tickets[p].retries)
-            errmsg += '\nremaining %d trials' % self.tickets[p].retries
-            self.tickets[p].retry()
-            self.tickets[p].errmsg = errmsg
-            self.tickets[p].retries -= 1
-            self.update_ticket(p[0], p[1])
-        else:
-            self.logger.error(errmsg)
-            self._log_exception(excep, traceback.format_exc())
-            self.tickets[p].status = Ticket.ERROR
-            self.tickets[p].errmsg = errmsg
-            del self.active_tickets[p]
+        with self.lock:
+            ticket = self.tickets[p]
+            if ticket.retries > 0:
+                self.logger.warning(errmsg)
+                self.logger.warning('remaining %d trials', ticket.retries)
+                errmsg += '\nremaining %d trials' % ticket.retries
+                ticket.retry()
+                ticket.errmsg = errmsg
+                ticket.retries -= 1
+            else:
+                self.logger.error(errmsg)
+                self._log_exception(excep, traceback.format_exc())
+                ticket.errmsg = errmsg
+                self.set_ticket_status(p, Ticket.ERROR)
             self.update_ticket(p[0], p[1])
 
     def _transfer_exception_handling(self, p, excep, fmt):
@@ -502,35 +1069,94 @@ class DmIRodsServer(Server):
         errmsg += '\n' + self._exception2string(excep, traceback.format_exc())
         self.logger.error(errmsg)
         self._log_exception(excep, traceback.format_exc())
-        self.tickets[p].status = Ticket.ERROR
-        self.tickets[p].errmsg = errmsg
-        del self.active_tickets[p]
-        self.update_ticket(p[0], p[1])
+        with self.lock:
+            self.tickets[p].errmsg = errmsg
+            self.set_ticket_status(p, Ticket.ERROR)
+            self.update_ticket(p[0], p[1])
 
     def housekeeping(self):
-        curr = time.time()
-        keep_seconds = self.config.get('housekeeping', 24) * 3600
-        if curr - self.last_housekeeping > self.housekeeping_interval:
-            self.logger.info('housekeeping')
-            try:
-                with self.irods_connection() as irods:
-                    tickets = {}
-                    for ticket in self.tickets.values():
-                        tickets[ticket.remote_file] = ticket
-                    for obj in irods.list_objects():
-                        filename = "%s/%s" % (obj.get('collection', ''),
-                                              obj.get('object'))
-                        if filename in self.tickets:
-                            del tickets[filename]
-                    for ticket in tickets.values():
-                        age = time.time() - ticket.time_created
-                        if age > keep_seconds:
-                            self.delete_ticket(ticket.local_file,
-                                               ticket.remote_file)
-            except Exception as e:
-                self.logger.error('housekeeping failed')
-                self._log_exception(e, traceback.format_exc())
-            self.last_houskeeping = curr
+        """
+        Delete finished tickets that are older than the configured
+        time (housekeeping, hours) if their object does not exist
+        anymore.
+
+        The candidates are selected from the ticket store, the history
+        is not loaded. Each candidate is checked with one query. Tickets
+        of existing objects are checked again after housekeeping_interval,
+        the interval doubles with every check (up to
+        HOUSEKEEPING_MAX_INTERVAL). At most HOUSEKEEPING_BATCH tickets
+        and HOUSEKEEPING_BUDGET seconds are spent per tick. When no more
+        tickets are due, the housekeeping is skipped until the next
+        ticket is due (see schedule_housekeeping).
+        """
+        now = time.time()
+        if now < self.housekeeping_start:
+            return
+        age = self.config.get('housekeeping', 24) * 3600
+        self.commit_tickets()
+        candidates = self.ticket_store.housekeeping_candidates(
+            Ticket.INACTIVE_CODES, now - age, now,
+            DmIRodsServer.HOUSEKEEPING_BATCH)
+        if not candidates:
+            self.schedule_housekeeping(now, age)
+            return
+        deadline = now + DmIRodsServer.HOUSEKEEPING_BUDGET
+        checks = []
+        deleted = 0
+        failed = False
+        try:
+            with self.irods_connection() as irods:
+                for local_file, remote_file, interval in candidates:
+                    if time.time() > deadline:
+                        break
+                    with self.lock:
+                        ticket = self.tickets.get((local_file, remote_file),
+                                                  None)
+                        if ticket is not None and ticket.is_active():
+                            # registered again
+                            continue
+                    if irods.object_exists(remote_file):
+                        if interval is None:
+                            interval = self.housekeeping_interval
+                        else:
+                            interval = min(
+                                interval * 2,
+                                DmIRodsServer.HOUSEKEEPING_MAX_INTERVAL)
+                        checks.append((local_file, remote_file,
+                                       now + interval, interval))
+                    else:
+                        self.delete_ticket(local_file, remote_file)
+                        deleted += 1
+        except Exception as e:
+            failed = True
+            self.logger.error('housekeeping failed')
+            self._log_exception(e, traceback.format_exc())
+        if checks:
+            self.ticket_store.set_next_check(checks)
+        self.commit_tickets()
+        self.logger.info('housekeeping: checked %d tickets, deleted %d',
+                         len(checks) + deleted, deleted)
+        if failed:
+            self.housekeeping_start = (now +
+                                       DmIRodsServer.HOUSEKEEPING_BACKOFF)
+        elif (len(candidates) < DmIRodsServer.HOUSEKEEPING_BATCH and
+              time.time() <= deadline):
+            self.schedule_housekeeping(now, age)
+        # otherwise more tickets are due: continue with the next tick
+
+    def schedule_housekeeping(self, now, age):
+        """
+        Skip the housekeeping until the next ticket is due, at least
+        HOUSEKEEPING_BACKOFF and at most HOUSEKEEPING_INTERVAL seconds
+        (tickets that finish in the meantime)
+        """
+        due = self.ticket_store.next_housekeeping(Ticket.INACTIVE_CODES,
+                                                  age)
+        latest = now + DmIRodsServer.HOUSEKEEPING_INTERVAL
+        if due is None or due > latest:
+            due = latest
+        self.housekeeping_start = max(due,
+                                      now + DmIRodsServer.HOUSEKEEPING_BACKOFF)
 
     def _exception2string(self, e, tb):
         msg = e.__class__.__name__ + ': ' + str(e)
@@ -40,6 +40,9 @@ class iRODSMock(object):
     def __exit__(self, exc_type, exc_value, traceback):
         pass
 
+    def invalidate(self):
+        pass
+
     def sha256_checksum(self, filename, block_size=65536):
         def chunks(f, chunksize=io.DEFAULT_BUFFER_SIZE):
             return iter(lambda: f.read(chunksize), b'')
@@ -50,7 +53,8 @@ class iRODSMock(object):
                 sha256.update(chunk)
         return sha256.hexdigest()
 
-    def list_objects(self):
+    def list_objects(self, filters={}, limit=-1, columns=None,
+                     page_size=None, ordered=True):
         for root, dir, files in os.walk(self.server.mockdir):
             for item in files:
                 if re.match('^__.*.json', item):
@@ -59,12 +63,40 @@ class iRODSMock(object):
                         state = meta_data.get('state', '???')
                         collection = os.path.dirname(meta_data['file'])
                         obj = os.path.basename(meta_data['file'])
-                        yield {'collection': collection,
+                        res = {'collection': collection,
                                'object': obj,
+                               'remote_file': meta_data['file'],
                                'resource_value': self.server.resource,
                                "meta_SURF-DMF": state}
+                    prefix = filters.get('collection_prefix', None)
+                    if (prefix is not None and
+                            not res['remote_file'].startswith(
+                                prefix.rstrip('/') + '/')):
+                        continue
+                    if any(res.get(k) != v for k, v in filters.items()
+                           if k != 'collection_prefix'):
+                        continue
+                    if limit == 0:
+                        return
+                    limit -= 1
+                    yield res
+
+    def walk_collection(self, coll):
+        coll = coll.rstrip('/')
+        for item in self.list_objects():
+            remote_file = item['collection'] + '/' + item['object']
+            if remote_file.startswith(coll + '/'):
+                yield remote_file
+
+    def create_collection(self, coll):
+        pass
 
-    def get(self, ticket):
+    def object_exists(self, remote_file):
+        data_file = os.path.join(self.server.mockdir,
+                                 remote_file.replace('/', '#'))
+        return os.path.isfile(data_file)
+
+    def get(self, ticket, checkpoint=None):
         local_file = ticket.local_file
         remote_file = ticket.remote_file.format(zone=self.server.zone,
                                                 user=self.server.user)
@@ -86,7 +118,7 @@ class iRODSMock(object):
             if meta_data['checksum'] != self.sha256_checksum(local_file):
                 raise ValueError('checksum  test failed')
 
-    def put(self, ticket):
+    def put(self, ticket, checkpoint=None):
         local_file = ticket.local_file
         remote_file = ticket.remote_file.format(zone=self.server.zone,
                                                 user=self.server.user)
@@ -115,6 +147,25 @@ class iRODSMock(object):
         with open(meta_data_file, 'w') as f:
             json.dump(meta_data, f)
 
+    def put_stream(self, ticket, write):
+        remote_file = ticket.remote_file.format(zone=self.server.zone,
+                                                user=self.server.user)
+        data_file = os.path.join(self.server.mockdir,
+                                 remote_file.replace('/', '#'))
+        meta_data_file = os.path.join(self.server.mockdir,
+                                      '__' +
+                                      remote_file.replace('/', '#') +
+                                      '.json')
+        self.logger.info('write %s -> %s', ticket.local_file, data_file)
+        with open(data_file, 'wb') as f:
+            write(f, io.DEFAULT_BUFFER_SIZE)
+        mode = os.stat(data_file)
+        with open(meta_data_file, 'w') as f:
+            json.dump({'state': 'MIG',
+                       'inode': mode.st_ino,
+                       'file': remote_file,
+                       'checksum': self.sha256_checksum(data_file)}, f)
+
 
 class DmIRodsServerMock(DmIRodsServer):
     @classmethod
@@ -0,0 +1,140 @@
+import time
+import logging
+import threading
+
+
+class SessionPool(object):
+    """
+    Pool of authenticated iRODS sessions shared by the daemon.
+
+    Sessions are created with factory() and returned to the pool after
+    use, so that the connection and authentication handshake is not
+    repeated for every operation. Up to max_size idle sessions are kept;
+    sessions released while the pool is full are closed. Idle sessions
+    are closed after idle_timeout seconds. A session that has been idle
+    for more than check_interval seconds is checked with check(session)
+    before it is handed out, and sessions that failed with a network
+    error are released with discard=True, so that the next acquire
+    reconnects.
+
+    At most max_total sessions are borrowed at the same time. acquire
+    waits for a session to be released (up to timeout seconds), threads
+    that help an operation that holds a session already (streams, rule
+    calls) use acquire(block=False) and fall back to fewer threads.
+    """
+    MAX_SIZE = 8
+    MAX_TOTAL = 32
+    IDLE_TIMEOUT = 300
+    CHECK_INTERVAL = 60
+    TIMEOUT = 600
+
+    def __init__(self, factory, check=None,
+                 max_size=None, idle_timeout=None, check_interval=None,
+                 max_total=None, timeout=None,
+                 logger=logging.getLogger("DmIRodsServer")):
+        if max_size is None:
+            max_size = SessionPool.MAX_SIZE
+        if max_total is None:
+            max_total = SessionPool.MAX_TOTAL
+        if idle_timeout is None:
+            idle_timeout = SessionPool.IDLE_TIMEOUT
+        if check_interval is None:
+            check_interval = SessionPool.CHECK_INTERVAL
+        if timeout is None:
+            timeout = SessionPool.TIMEOUT
+        self.factory = factory
+        self.check = check
+        self.max_size = max(0, int(max_size))
+        self.max_total = max(1, int(max_total))
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+        self.timeout = timeout
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.released = threading.Condition(self.lock)
+        # list of (session, last_used), most recently used last
+        self.idle = []
+        self.num_borrowed = 0
+
+    def acquire(self, block=True):
+        """
+        Returns an idle session or a new one. If max_total sessions are
+        borrowed, wait for a release (IOError after timeout seconds) or
+        return None if block is False.
+        """
+        self.evict_idle()
+        while True:
+            with self.lock:
+                deadline = time.time() + self.timeout
+                while self.num_borrowed >= self.max_total:
+                    remaining = deadline - time.time()
+                    if not block:
+                        return None
+                    elif remaining <= 0:
+                        raise IOError('no iRODS session available ' +
+                                      '(%d sessions in use)' %
+                                      self.num_borrowed)
+                    self.released.wait(remaining)
+                self.num_borrowed += 1
+                if not self.idle:
+                    break
+                session, last_used = self.idle.pop()
+            if (self.check is None or
+                    time.time() - last_used < self.check_interval):
+                return session
+            try:
+                self.check(session)
+                return session
+            except Exception as e:
+                self.logger.info('discard broken iRODS session: %s', str(e))
+                self.release(session, discard=True)
+        try:
+            return self.factory()
+        except Exception:
+            with self.lock:
+                self.num_borrowed -= 1
+                self.released.notify()
+            raise
+
+    def release(self, session, discard=False):
+        """
+        Return a session to the pool. Sessions are closed when discard
+        is set or the pool is full.
+        """
+        with self.lock:
+            self.num_borrowed -= 1
+            self.released.notify()
+            if not discard and len(self.idle) < self.max_size:
+                self.idle.append((session, time.time()))
+                return
+        self._close(session)
+
+    def evict_idle(self):
+        """
+        Close sessions that have not been used for idle_timeout seconds
+        """
+        now = time.time()
+        with self.lock:
+            expired = [s for s, t in self.idle
+                       if now - t > self.idle_timeout]
+            self.idle = [(s, t) for s, t in self.idle
+                         if now - t <= self.idle_timeout]
+        for session in expired:
+            self._close(session)
+
+    def num_idle(self):
+        with self.lock:
+            return len(self.idle)
+
+    def close(self):
+        with self.lock:
+            sessions = [s for s, t in self.idle]
+            self.idle = []
+        for session in sessions:
+            self._close(session)
+
+    def _close(self, session):
+        try:
+            session.cleanup()
+        except Exception as e:
+            self.logger.warning('failed to close iRODS session: %s', str(e))
@@ -6,6 +6,11 @@ import hashlib
 import base64
 import logging
 import time
+try:
+    intern = sys.intern
+except AttributeError:
+    # python 2: builtin
+    pass
 
 
 def sha256_checksum(filename, block_size=65536):
@@ -52,6 +57,15 @@ class Ticket(object):
                     ERROR,
                     UNDEF,
                     DONE]
+    ACTIVE_CODES = [WAITING,
+                    GETTING,
+                    PUTTING,
+                    RETRY,
+                    UNMIG]
+    INACTIVE_CODES = [CANCELED,
+                      DONE,
+                      UNDEF,
+                      ERROR]
     mode2string = {0: "",
                    1: "GET",
                    2: "PUT"}
@@ -68,6 +82,17 @@ class Ticket(object):
               'transfer_time',
               'errmsg',
               'DMF_state']
+    # stored in the ticket file but not listed
+    internal_fields = ['block_hashes',
+                       'block_key',
+                       'bundle_members']
+
+    # no per-instance __dict__: the daemon keeps millions of tickets
+    __slots__ = fields + internal_fields + ['status',
+                                            'mode',
+                                            'collection',
+                                            'last_unmig_check',
+                                            'DMF_bfid']
 
     def __init__(self,
                  local_file,
@@ -84,11 +109,19 @@ class Ticket(object):
                  errmsg=None,
                  transferred=0,
                  transfer_time=0,
-                 DMF_state="???"):
+                 DMF_state="???",
+                 block_hashes=None,
+                 block_key=None,
+                 bundle_members=None):
         self.status = status
         self.mode = mode
         self.local_file = local_file
         self.remote_file = remote_file
+        # tickets of a collection share its name
+        collection = os.path.dirname(remote_file)
+        if isinstance(collection, str):
+            collection = intern(collection)
+        self.collection = collection
         self.checksum = checksum
         self.local_atime = local_atime
         self.local_ctime = local_ctime
@@ -96,15 +129,25 @@ class Ticket(object):
         self.remote_size = remote_size
         self.transferred = transferred
         self.transfer_time = transfer_time
-        self.last_unmig_check = time.time()
+        self.last_unmig_check = None
         self.retries = int(retries)
         self.errmsg = ''
         if time_created is None:
             self.time_created = time.time()
         else:
             self.time_created = float(time_created)
-        if mode == Ticket.PUT:
+        # None until the first checkpoint
+        self.block_hashes = block_hashes
+        # identity of the local file the blocks were read from
+        self.block_key = block_key
+        # list of [member_name, file] for bundle containers
+        self.bundle_members = bundle_members
+        if mode == Ticket.PUT and local_size is None:
+            # new ticket (stored tickets are refreshed by the daemon)
             self.update_local_attributes()
+        # few distinct values: shared strings
+        if isinstance(DMF_state, str):
+            DMF_state = intern(DMF_state)
         self.DMF_state = DMF_state
         self.DMF_bfid = 0
 
@@ -118,16 +161,6 @@ class Ticket(object):
     def step(self, logger=logging.getLogger("Daemon")):
         logger.info('check %s' % self.to_json())
 
-    @property
-    def ticket_file(self):
-        return (Ticket.mode_to_string(self.mode) + ":" +
-                self.local_file.replace('/', '#') + ".json" +
-                self.remote_file.replace('/', '#') + ".json")
-
-    @property
-    def collection(self):
-        return os.path.dirname(self.remote_file)
-
     @property
     def object(self):
         return os.path.basename(self.remote_file)
@@ -163,6 +196,7 @@ class Ticket(object):
         return None
 
     def retry(self):
+        # block_hashes is kept, the transfer is resumed
         self.transferred = 0
         self.transfer_time = 0
         self.status = Ticket.RETRY
@@ -173,13 +207,36 @@ class Ticket(object):
         self.last_unmig_check = time.time()
         self.status = Ticket.UNMIG
 
-    def update_local_checksum(self):
+    def update_local_checksum(self, hasher=None, cache=None, key=None):
+        """
+        Set the checksum of the local file. If a hasher is given
+        that has been fed with the contents of the file, the file is
+        not read again. Otherwise the checksum is taken from the
+        checksum cache if the file has not changed.
+        key is the cache key of the file before it has been read.
+        """
+        checksum = None
+        if hasher is not None:
+            checksum = base64.b64encode(hasher.digest())
+        elif cache is not None:
+            checksum = cache.lookup(self.local_file)
+            if checksum is not None:
+                self.checksum = checksum
+                return
+            key = cache.stat(self.local_file)
+        if checksum is None:
+            checksum = sha256_checksum(self.local_file)
         if sys.version_info[0] == 2:
-            self.checksum = sha256_checksum(self.local_file)
+            self.checksum = checksum
         else:
-            self.checksum = sha256_checksum(self.local_file).decode()
+            self.checksum = checksum.decode()
+        if cache is not None:
+            cache.add(self.local_file, self.checksum, key)
 
     def update_local_attributes(self):
+        if self.mode == Ticket.PUT and self.bundle_members is not None:
+            # streamed container: there is no local file
+            return
         fname = self.local_file
         if os.path.isfile(fname):
             self.local_atime = os.path.getatime(fname)
@@ -190,13 +247,23 @@ class Ticket(object):
             self.local_size = None
 
     def to_dict(self):
+        """
+        Listed fields of the ticket (a new dictionary)
+        """
         ret = {f: getattr(self, f) for f in Ticket.fields}
         ret['status'] = Ticket.status_to_string(self.status)
         ret['mode'] = Ticket.mode_to_string(self.mode)
         return ret
 
     def to_json(self):
-        return json.dumps(self.to_dict())
+        """
+        Listed and internal fields as JSON
+        """
+        ret = {f: getattr(self, f)
+               for f in Ticket.fields + Ticket.internal_fields}
+        ret['status'] = Ticket.status_to_string(self.status)
+        ret['mode'] = Ticket.mode_to_string(self.mode)
+        return json.dumps(ret)
 
     @staticmethod
     def from_json(obj):
@@ -204,7 +271,8 @@ class Ticket(object):
                 if sys.version_info[0] == 2 and isinstance(value, unicode)
                 else value
                 for k, value in obj.items()
-                if str(k) in Ticket.fields}
+                if str(k) in Ticket.fields or
+                str(k) in Ticket.internal_fields}
         cobj['status'] = Ticket.string_to_status(obj['status'])
         cobj['mode'] = Ticket.string_to_mode(obj['mode'])
         return Ticket(**cobj)
@@ -0,0 +1,152 @@
+import bisect
+import posixpath
+
+
+class TicketIndex(object):
+    """
+    Secondary indexes of the tickets in memory:
+
+    - per status: keys (local_file, remote_file) ordered by time_created
+    - remote_file -> keys
+    - collection -> keys, with a sorted list of collections for
+      prefix queries
+
+    The index is not thread safe, it is protected by the lock of the
+    ticket dictionary. update(ticket) must be called when a ticket has
+    been added or its status has changed.
+    """
+    def __init__(self):
+        # key -> (status, time_created) as indexed
+        self.entries = {}
+        # status -> sorted list of (time_created, key)
+        self.buckets = {}
+        self.remote = {}
+        self.collections = {}
+        self.sorted_collections = []
+
+    def __len__(self):
+        return len(self.entries)
+
+    def update(self, ticket):
+        p = (ticket.local_file, ticket.remote_file)
+        entry = (ticket.status, ticket.time_created)
+        old = self.entries.get(p, None)
+        if old == entry:
+            return
+        if old is None:
+            self.remote.setdefault(ticket.remote_file, set()).add(p)
+            coll = ticket.collection
+            if coll not in self.collections:
+                self.collections[coll] = set()
+                bisect.insort(self.sorted_collections, coll)
+            self.collections[coll].add(p)
+        else:
+            self._remove_from_bucket(p, old)
+        self.entries[p] = entry
+        bisect.insort(self.buckets.setdefault(entry[0], []),
+                      (entry[1], p))
+
+    def remove(self, p):
+        old = self.entries.pop(p, None)
+        if old is None:
+            return
+        self._remove_from_bucket(p, old)
+        keys = self.remote[p[1]]
+        keys.discard(p)
+        if not keys:
+            del self.remote[p[1]]
+        coll = posixpath.dirname(p[1])
+        keys = self.collections[coll]
+        keys.discard(p)
+        if not keys:
+            del self.collections[coll]
+            i = bisect.bisect_left(self.sorted_collections, coll)
+            del self.sorted_collections[i]
+
+    def _remove_from_bucket(self, p, entry):
+        bucket = self.buckets[entry[0]]
+        i = bisect.bisect_left(bucket, (entry[1], p))
+        del bucket[i]
+
+    def by_status(self, status):
+        """
+        Keys with the given status, oldest first
+        """
+        return [p for t, p in self.buckets.get(status, [])]
+
+    def by_remote_file(self, remote_file):
+        return list(self.remote.get(remote_file, []))
+
+    def by_collection(self, prefix):
+        """
+        Keys of objects in the collection prefix and its
+        sub-collections
+        """
+        prefix = prefix.rstrip('/')
+        ret = []
+        i = bisect.bisect_left(self.sorted_collections, prefix)
+        while i < len(self.sorted_collections):
+            coll = self.sorted_collections[i]
+            if not coll.startswith(prefix):
+                break
+            if len(coll) == len(prefix) or coll[len(prefix)] == '/':
+                ret.extend(self.collections[coll])
+            i += 1
+        return ret
+
+    def count_collection(self, prefix):
+        """
+        Number of keys in the collection prefix and its
+        sub-collections
+        """
+        prefix = prefix.rstrip('/')
+        n = 0
+        i = bisect.bisect_left(self.sorted_collections, prefix)
+        while i < len(self.sorted_collections):
+            coll = self.sorted_collections[i]
+            if not coll.startswith(prefix):
+                break
+            if len(coll) == len(prefix) or coll[len(prefix)] == '/':
+                n += len(self.collections[coll])
+            i += 1
+        return n
+
+    def status_slice(self, status, after=None, n=1000):
+        """
+        Up to n entries (time_created, key) of a status that follow
+        the entry after
+        """
+        bucket = self.buckets.get(status, [])
+        if after is None:
+            i = 0
+        else:
+            i = bisect.bisect_right(bucket, after)
+        return bucket[i:i + n]
+
+    def collection_slice(self, prefix, after=None, n=1000):
+        """
+        Up to n entries ((collection, object, local_file), key) of
+        objects in the collection prefix and its sub-collections,
+        ordered by collection, object and local file, that follow the
+        entry after
+        """
+        prefix = prefix.rstrip('/')
+        if after is not None and after[0][0] > prefix:
+            start = after[0][0]
+        else:
+            start = prefix
+        ret = []
+        i = bisect.bisect_left(self.sorted_collections, start)
+        while i < len(self.sorted_collections) and len(ret) < n:
+            coll = self.sorted_collections[i]
+            if not coll.startswith(prefix):
+                break
+            i += 1
+            if len(coll) != len(prefix) and coll[len(prefix)] != '/':
+                continue
+            entries = sorted(((coll, posixpath.basename(p[1]), p[0]), p)
+                             for p in self.collections[coll])
+            if after is not None and coll == after[0][0]:
+                entries = entries[bisect.bisect_right(entries, after):]
+            ret.extend(entries)
+        return ret[:n]
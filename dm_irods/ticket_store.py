@@ -0,0 +1,263 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from .ticket import Ticket
+
+
+class TicketStore(object):
+    """
+    Persistent ticket store (SQLite).
+
+    Each ticket is a row keyed by (local_file, remote_file) with the
+    json representation of the ticket and indexed columns for status,
+    mode, remote_file and time_created.
+
+    Changes are collected and written in one transaction (group
+    commit): commit() is called when a batch of tickets has been
+    registered, on every tick of the daemon and by save() when
+    the last commit is older than COMMIT_INTERVAL seconds. Several
+    updates of the same ticket between two commits are written once.
+    The database uses a write ahead log, a crash leaves the last
+    committed state.
+
+    next_check and check_interval schedule the housekeeping checks of
+    finished tickets. They are reset when the ticket is saved.
+    """
+    COMMIT_INTERVAL = 1.0
+
+    SCHEMA = ['CREATE TABLE IF NOT EXISTS tickets (' +
+              'local_file TEXT NOT NULL, ' +
+              'remote_file TEXT NOT NULL, ' +
+              'mode INTEGER NOT NULL, ' +
+              'status INTEGER NOT NULL, ' +
+              'time_created REAL NOT NULL, ' +
+              'data TEXT NOT NULL, ' +
+              'next_check REAL, ' +
+              'check_interval REAL, ' +
+              'PRIMARY KEY (local_file, remote_file))',
+              'CREATE INDEX IF NOT EXISTS tickets_status ' +
+              'ON tickets (status, time_created)',
+              'CREATE INDEX IF NOT EXISTS tickets_mode ' +
+              'ON tickets (mode)',
+              'CREATE INDEX IF NOT EXISTS tickets_remote_file ' +
+              'ON tickets (remote_file)',
+              'CREATE INDEX IF NOT EXISTS tickets_time_created ' +
+              'ON tickets (time_created)',
+              'CREATE INDEX IF NOT EXISTS tickets_unchecked ' +
+              'ON tickets (time_created) WHERE next_check IS NULL',
+              'CREATE INDEX IF NOT EXISTS tickets_next_check ' +
+              'ON tickets (next_check)']
+
+    # columns added to existing databases
+    MIGRATIONS = [('next_check', 'ALTER TABLE tickets ' +
+                   'ADD COLUMN next_check REAL'),
+                  ('check_interval', 'ALTER TABLE tickets ' +
+                   'ADD COLUMN check_interval REAL')]
+
+    def __init__(self, db_file, logger=logging.getLogger("DmIRodsServer")):
+        self.db_file = db_file
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(TicketStore.SCHEMA[0])
+        columns = [row[1] for row in
+                   self.conn.execute('PRAGMA table_info(tickets)')]
+        for column, stmt in TicketStore.MIGRATIONS:
+            if column not in columns:
+                self.conn.execute(stmt)
+        for stmt in TicketStore.SCHEMA[1:]:
+            self.conn.execute(stmt)
+        self.conn.commit()
+        # (local_file, remote_file) -> ticket json or None (deleted)
+        self.pending = {}
+        self.last_commit = time.time()
+
+    def save(self, ticket):
+        """
+        Schedule a ticket for the next commit
+        """
+        p = (ticket.local_file, ticket.remote_file)
+        row = (ticket.local_file, ticket.remote_file, ticket.mode,
+               ticket.status, ticket.time_created, ticket.to_json())
+        with self.lock:
+            self.pending[p] = row
+            due = time.time() - self.last_commit > TicketStore.COMMIT_INTERVAL
+        if due:
+            self.commit()
+
+    def delete(self, local_file, remote_file):
+        with self.lock:
+            self.pending[(local_file, remote_file)] = None
+
+    def commit(self):
+        """
+        Write all pending changes in one transaction
+        """
+        with self.lock:
+            pending = self.pending
+            self.pending = {}
+            self.last_commit = time.time()
+            if not pending:
+                return
+            try:
+                with self.conn:
+                    self.conn.executemany(
+                        'INSERT OR REPLACE INTO tickets ' +
+                        '(local_file, remote_file, mode, status, ' +
+                        'time_created, data) VALUES (?, ?, ?, ?, ?, ?)',
+                        [row for row in pending.values() if row is not None])
+                    self.conn.executemany(
+                        'DELETE FROM tickets ' +
+                        'WHERE local_file = ? AND remote_file = ?',
+                        [p for p, row in pending.items() if row is None])
+            except Exception:
+                # keep the changes for the next commit
+                for p, row in pending.items():
+                    self.pending.setdefault(p, row)
+                raise
+
+    def load(self, statuses=None):
+        """
+        Generator over the stored tickets, optionally restricted to a
+        list of status codes.
+        """
+        sql = 'SELECT data FROM tickets'
+        args = []
+        if statuses is not None:
+            sql += ' WHERE status IN (%s)' % ','.join('?' for s in statuses)
+            args = list(statuses)
+        with self.lock:
+            rows = self.conn.execute(sql, args).fetchall()
+        for row in rows:
+            yield Ticket.from_json(json.loads(row[0]))
+
+    def get(self, local_file, remote_file):
+        """
+        Returns a single ticket or None
+        """
+        p = (local_file, remote_file)
+        with self.lock:
+            if p in self.pending:
+                row = self.pending[p]
+                data = row[-1] if row is not None else None
+            else:
+                row = self.conn.execute(
+                    'SELECT data FROM tickets ' +
+                    'WHERE local_file = ? AND remote_file = ?',
+                    p).fetchone()
+                data = row[0] if row is not None else None
+        if data is None:
+            return None
+        return Ticket.from_json(json.loads(data))
+
+    def by_remote_file(self, remote_file):
+        """
+        List of the tickets of an object
+        """
+        with self.lock:
+            pending = {p: row for p, row in self.pending.items()
+                       if p[1] == remote_file}
+            rows = self.conn.execute(
+                'SELECT local_file, data FROM tickets ' +
+                'WHERE remote_file = ?', (remote_file,)).fetchall()
+        data = {(row[0], remote_file): row[1] for row in rows}
+        for p, row in pending.items():
+            if row is None:
+                data.pop(p, None)
+            else:
+                data[p] = row[-1]
+        return [Ticket.from_json(json.loads(d)) for d in data.values()]
+
+    def housekeeping_candidates(self, statuses, cutoff, now, n):
+        """
+        Up to n tickets (local_file, remote_file, check_interval) with
+        one of the statuses to be checked by the housekeeping: tickets
+        created before cutoff that have not been checked yet, then
+        tickets whose next check is due.
+        """
+        marks = ','.join('?' for s in statuses)
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT local_file, remote_file, check_interval ' +
+                'FROM tickets WHERE next_check IS NULL AND ' +
+                'time_created < ? AND status IN (%s) ' % marks +
+                'ORDER BY time_created LIMIT ?',
+                [cutoff] + list(statuses) + [n]).fetchall()
+            if len(rows) < n:
+                rows += self.conn.execute(
+                    'SELECT local_file, remote_file, check_interval ' +
+                    'FROM tickets WHERE next_check <= ? AND ' +
+                    'status IN (%s) ' % marks +
+                    'ORDER BY next_check LIMIT ?',
+                    [now] + list(statuses) + [n - len(rows)]).fetchall()
+        return [tuple(row) for row in rows]
+
+    def next_housekeeping(self, statuses, age):
+        """
+        Time when the next ticket with one of the statuses is due for
+        a housekeeping check: tickets that have not been checked yet
+        are due age seconds after they have been created.
+        None if there are no such tickets.
+        """
+        marks = ','.join('?' for s in statuses)
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT MIN(CASE WHEN next_check IS NULL ' +
+                'THEN time_created + ? ELSE next_check END) ' +
+                'FROM tickets WHERE status IN (%s)' % marks,
+                [age] + list(statuses)).fetchone()
+        return row[0]
+
+    def set_next_check(self, checks):
+        """
+        Schedule the next housekeeping checks,
+        checks: list of (local_file, remote_file, next_check, interval)
+        """
+        with self.lock:
+            with self.conn:
+                self.conn.executemany(
+                    'UPDATE tickets SET next_check = ?, check_interval = ? ' +
+                    'WHERE local_file = ? AND remote_file = ?',
+                    [(c[2], c[3], c[0], c[1]) for c in checks])
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute(
+                'SELECT COUNT(*) FROM tickets').fetchone()[0]
+
+    def import_ticket_dir(self, ticket_dir):
+        """
+        Move tickets from json files (one file per ticket) into the
+        store. The files are removed when the tickets have been
+        committed.
+        """
+        files = []
+        for root, dirs, names in os.walk(ticket_dir):
+            for name in names:
+                if name.endswith('.json'):
+                    ticket_file = os.path.join(root, name)
+                    try:
+                        with open(ticket_file) as f:
+                            ticket = Ticket.from_json(json.load(f))
+                    except Exception as e:
+                        self.logger.error('failed to read ticket %s: %s',
+                                          ticket_file, str(e))
+                        continue
+                    self.save(ticket)
+                    files.append(ticket_file)
+        self.commit()
+        for ticket_file in files:
+            os.remove(ticket_file)
+        if files:
+            self.logger.info('imported %d tickets from %s',
+                             len(files), ticket_dir)
+
+    def close(self):
+        self.commit()
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,130 @@
+import os
+import json
+import logging
+import threading
+
+
+class TransferTuner(object):
+    """
+    Adaptive choice of block size and number of streams.
+
+    After each transfer the throughput is compared with the previous
+    transfer of the same mode to the same host and resource. One
+    parameter is probed at a time: it is increased additively while the
+    throughput improves and decreased multiplicatively when the
+    throughput drops (AIMD). The state and the best settings seen so far
+    are stored in a json file, so that the next daemon starts with the
+    tuned settings.
+    """
+    MIN_BLOCK_SIZE = 1024 * 1024
+    MAX_BLOCK_SIZE = 16 * 1024 * 1024
+    BLOCK_SIZE_STEP = 1024 * 1024
+    MAX_STREAMS = 8
+
+    # transfers smaller than MIN_SAMPLE are dominated by latency
+    MIN_SAMPLE = 64 * 1024 * 1024
+
+    # relative change of throughput that is considered significant
+    GAIN = 0.05
+    LOSS = 0.2
+
+    def __init__(self, tuning_file,
+                 block_size, streams,
+                 logger=logging.getLogger("DmIRodsServer")):
+        self.tuning_file = tuning_file
+        self.default_block_size = block_size
+        self.default_streams = streams
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.state = {}
+        if os.path.isfile(tuning_file):
+            try:
+                with open(tuning_file) as f:
+                    self.state = json.load(f)
+            except Exception as e:
+                self.logger.warning('cannot read tuning file %s: %s',
+                                    tuning_file, str(e))
+
+    def _get_state(self, key, mode):
+        entry = self.state.setdefault(key, {})
+        if mode not in entry:
+            entry[mode] = {'block_size': self.default_block_size,
+                           'streams': self.default_streams,
+                           'throughput': None,
+                           'probe': 'streams',
+                           'best': None}
+        return entry[mode]
+
+    def settings(self, key, mode):
+        """
+        Returns (block_size, streams) for the next transfer
+        """
+        with self.lock:
+            state = self._get_state(key, mode)
+            return state['block_size'], state['streams']
+
+    def report(self, key, mode, block_size, streams, nbytes, seconds):
+        """
+        Update the settings with the throughput of a finished transfer
+        """
+        if nbytes < TransferTuner.MIN_SAMPLE or seconds <= 0:
+            return
+        throughput = nbytes / float(seconds)
+        with self.lock:
+            state = self._get_state(key, mode)
+            if (block_size != state['block_size'] or
+                    streams != state['streams']):
+                # settings have changed during the transfer
+                return
+            best = state['best']
+            if best is None or throughput > best['throughput']:
+                state['best'] = {'block_size': block_size,
+                                 'streams': streams,
+                                 'throughput': throughput}
+            last = state['throughput']
+            if last is None or throughput > last * (1 + TransferTuner.GAIN):
+                self._increase(state)
+            elif throughput < last * (1 - TransferTuner.LOSS):
+                self._decrease(state)
+                state['probe'] = self._other(state['probe'])
+            else:
+                state['probe'] = self._other(state['probe'])
+                self._increase(state)
+            state['throughput'] = throughput
+            self.logger.info('tuning %s %s: %.1f MB/s -> ' +
+                             'block_size=%d streams=%d',
+                             key, mode, throughput / (1024 * 1024),
+                             state['block_size'], state['streams'])
+            self.save()
+
+    def _other(self, probe):
+        if probe == 'streams':
+            return 'block_size'
+        else:
+            return 'streams'
+
+    def _increase(self, state):
+        if state['probe'] == 'streams':
+            state['streams'] = min(state['streams'] + 1,
+                                   TransferTuner.MAX_STREAMS)
+        else:
+            state['block_size'] = min(state['block_size'] +
+                                      TransferTuner.BLOCK_SIZE_STEP,
+                                      TransferTuner.MAX_BLOCK_SIZE)
+
+    def _decrease(self, state):
+        if state['probe'] == 'streams':
+            state['streams'] = max(state['streams'] // 2, 1)
+        else:
+            state['block_size'] = max(state['block_size'] // 2,
+                                      TransferTuner.MIN_BLOCK_SIZE)
+
+    def save(self):
+        tmp_file = self.tuning_file + '.tmp'
+        try:
+            with open(tmp_file, 'w') as f:
+                json.dump(self.state, f, indent=4)
+            os.rename(tmp_file, self.tuning_file)
+        except Exception as e:
+            self.logger.warning('cannot write tuning file %s: %s',
+                                self.tuning_file, str(e))
@@ -0,0 +1,45 @@
+import os
+import itertools
+
+
+def _scandir(path):
+    if hasattr(os, 'scandir'):
+        for entry in os.scandir(path):
+            yield entry.path, entry.is_dir(follow_symlinks=False)
+    else:
+        for name in os.listdir(path):
+            p = os.path.join(path, name)
+            yield p, os.path.isdir(p) and not os.path.islink(p)
+
+
+def walk_tree(top):
+    """
+    Generator of (path, is_dir) for all entries below top
+    (depth first, a directory before its contents).
+
+    Directories are read with os.scandir while they are traversed,
+    only the iterators of the current path are kept in memory.
+    Symbolic links to directories are not followed.
+    """
+    stack = [_scandir(top)]
+    while stack:
+        try:
+            path, is_dir = next(stack[-1])
+        except StopIteration:
+            stack.pop()
+            continue
+        yield path, is_dir
+        if is_dir:
+            stack.append(_scandir(path))
+
+
+def batches(iterable, size):
+    """
+    Split an iterable into lists of up to size items
+    """
+    it = iter(iterable)
+    while True:
+        batch = list(itertools.islice(it, size))
+        if not batch:
+            return
+        yield batch
@@ -0,0 +1,98 @@
+import logging
+import threading
+import traceback
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+class WorkerPool(object):
+    """
+    Fixed size pool of worker threads.
+
+    Jobs are identified by a key. A key can only be submitted once
+    until the corresponding job has finished.
+    """
+    def __init__(self, name, size,
+                 logger=logging.getLogger("DmIRodsServer")):
+        self.name = name
+        self.size = max(1, int(size))
+        self.logger = logger
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.running = set()
+        self.threads = []
+        for i in range(self.size):
+            thread = threading.Thread(name='%s-%d' % (name, i),
+                                      target=self.worker,
+                                      args=())
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, key, func, *args):
+        """
+        Queue func(*args) unless a job with the same key is pending.
+        Returns True if the job has been queued.
+        """
+        with self.lock:
+            if key in self.pending:
+                return False
+            self.pending.add(key)
+        self.queue.put((key, func, args))
+        return True
+
+    def is_pending(self, key):
+        with self.lock:
+            return key in self.pending
+
+    def is_running(self, key):
+        with self.lock:
+            return key in self.running
+
+    def num_pending(self):
+        with self.lock:
+            return len(self.pending)
+
+    def num_running(self):
+        with self.lock:
+            return len(self.running)
+
+    def worker(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+            key, func, args = job
+            with self.lock:
+                self.running.add(key)
+            try:
+                func(*args)
+            except Exception:
+                self.logger.error('%s: job %s failed', self.name, str(key))
+                for line in traceback.format_exc().split('\n'):
+                    self.logger.error(line)
+            finally:
+                with self.lock:
+                    self.running.discard(key)
+                    self.pending.discard(key)
+
+    def shutdown(self, wait=True):
+        """
+        Drop queued jobs and stop the worker threads.
+        Jobs that are already running are finished.
+        """
+        while True:
+            try:
+                key, func, args = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            with self.lock:
+                self.pending.discard(key)
+        for thread in self.threads:
+            self.queue.put(None)
+        if wait:
+            for thread in self.threads:
+                thread.join()
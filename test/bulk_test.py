@@ -0,0 +1,33 @@
+import os
+import unittest
+from .tempdir import Tempdir
+from dm_irods.bulk import read_file_list
+from dm_irods.bulk import file_arguments
+
+
+class TestBulk(unittest.TestCase):
+    def test_read_file_list(self):
+        with Tempdir(prefix="Test_") as td:
+            fname = os.path.join(td, 'files.txt')
+            with open(fname, 'w') as f:
+                f.write('a.dat\n\nsub dir/b.dat\nc.dat')
+            self.assertEqual(list(read_file_list(fname)),
+                             ['a.dat', 'sub dir/b.dat', 'c.dat'])
+
+    def test_file_arguments(self):
+        with Tempdir(prefix="Test_") as td:
+            fname = os.path.join(td, 'files.txt')
+            with open(fname, 'w') as f:
+                f.write('b.dat\nc.dat\n')
+            self.assertEqual(list(file_arguments(['a.dat'], fname)),
+                             ['a.dat', 'b.dat', 'c.dat'])
+            self.assertEqual(list(file_arguments([], fname)),
+                             ['b.dat', 'c.dat'])
+            self.assertIsNone(file_arguments([]))
+            empty = os.path.join(td, 'empty.txt')
+            open(empty, 'w').close()
+            self.assertIsNone(file_arguments([], empty))
+
+
+if __name__ == '__main__':
+    unittest.main()
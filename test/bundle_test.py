@@ -0,0 +1,74 @@
+import unittest
+import os
+import io
+from .tempdir import Tempdir
+from dm_irods.bundle import create_bundles
+from dm_irods.bundle import write_bundle
+from dm_irods.bundle import tar_size
+from dm_irods.bundle import BundleIndex
+
+
+class TestBundle(unittest.TestCase):
+    def test_bundle_and_extract(self):
+        with Tempdir(prefix="Test_") as td:
+            files = []
+            for i in range(10):
+                fname = os.path.join(td, 'f%d.dat' % i)
+                with open(fname, 'wb') as f:
+                    f.write(os.urandom(10000))
+                files.append(fname)
+            bundle_dir = os.path.join(td, 'Bundles')
+            index = BundleIndex(bundle_dir)
+            size = tar_size([[os.path.basename(f), f] for f in files[:4]])
+            bundles = list(create_bundles(files, '/zone/home/user', size))
+            self.assertEqual([len(m) for t, r, m in bundles], [4, 4, 2])
+            for tar_file, remote_file, members in bundles:
+                self.assertEqual(os.path.dirname(tar_file), td)
+                self.assertFalse(os.path.exists(tar_file))
+                index.add(remote_file, members)
+
+            # index is restored from disk
+            index = BundleIndex(bundle_dir)
+            container, name = index.lookup('/zone/home/user/f5.dat')
+            self.assertEqual(container, bundles[1][1])
+            self.assertEqual(name, 'f5.dat')
+            self.assertIsNone(index.lookup('/zone/home/user/f10.dat'))
+
+            tar_file = os.path.join(td, 'container.tar')
+            with open(tar_file, 'wb') as f:
+                write_bundle(bundles[1][2], f)
+            self.assertEqual(os.path.getsize(tar_file),
+                             tar_size(bundles[1][2]))
+            out = os.path.join(td, 'out.dat')
+            index.extract(tar_file, [[name, out]])
+            with open(out, 'rb') as f1, open(files[5], 'rb') as f2:
+                self.assertEqual(f1.read(), f2.read())
+
+    def test_same_basename(self):
+        with Tempdir(prefix="Test_") as td:
+            files = []
+            for d in ['a', 'b', os.path.join('b', 'x' * 120)]:
+                os.makedirs(os.path.join(td, d))
+                fname = os.path.join(td, d, 'f.dat')
+                with open(fname, 'wb') as f:
+                    f.write(os.urandom(700))
+                files.append(fname)
+            bundles = list(create_bundles(files, '/zone/home/user',
+                                          1024 * 1024))
+            self.assertEqual(len(bundles), 1)
+            tar_file, remote_file, members = bundles[0]
+            self.assertEqual([name for name, f in members],
+                             ['a/f.dat', 'b/f.dat',
+                              'b/%s/f.dat' % ('x' * 120)])
+            index = BundleIndex(os.path.join(td, 'Bundles'))
+            index.add(remote_file, members)
+            self.assertEqual(index.lookup('/zone/home/user/b/f.dat'),
+                             (remote_file, 'b/f.dat'))
+            # long names have extended headers
+            buf = io.BytesIO()
+            write_bundle(members, buf)
+            self.assertEqual(len(buf.getvalue()), tar_size(members))
+
+
+if __name__ == '__main__':
+    unittest.main()
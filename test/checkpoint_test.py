@@ -0,0 +1,107 @@
+import unittest
+import os
+import json
+import hashlib
+from .tempdir import Tempdir
+from dm_irods.checkpoint import Checkpoint
+from dm_irods.checksum_cache import ChecksumCache
+from dm_irods.ticket import Ticket
+
+
+class TestCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.block_size = Checkpoint.BLOCK_SIZE
+        Checkpoint.BLOCK_SIZE = 1024
+
+    def tearDown(self):
+        Checkpoint.BLOCK_SIZE = self.block_size
+
+    def _write(self, td, data):
+        fname = os.path.join(td, 'data.dat')
+        with open(fname, 'wb') as f:
+            f.write(data)
+        return fname
+
+    def test_resume(self):
+        with Tempdir(prefix="Test_") as td:
+            data = os.urandom(4500)
+            fname = self._write(td, data)
+            ticket = Ticket(fname, '/zone/home/user/data.dat',
+                            mode=Ticket.GET)
+            checkpoint = Checkpoint(ticket)
+            hasher = checkpoint.block_hasher(0)
+            hasher.update(data[:2500])
+            self.assertEqual(len(ticket.block_hashes), 2)
+
+            # restore ticket from file
+            ticket = Ticket.from_json(json.loads(ticket.to_json()))
+            checkpoint = Checkpoint(ticket)
+            self.assertEqual(checkpoint.verify(fname, len(data)), 2048)
+            self.assertEqual(checkpoint.pending_ranges([(0, 4500)]),
+                             [(2048, 4500)])
+
+            file_hasher = checkpoint.file_hasher([(2048, 4500)], 4500)
+            self.assertEqual(file_hasher.digest(),
+                             hashlib.sha256(data[:2048]).digest())
+            self.assertIsNone(checkpoint.file_hasher([(2048, 3072)], 4500))
+
+            hasher = checkpoint.block_hasher(2048)
+            hasher.update(data[2048:])
+            hasher.finish()
+            self.assertEqual(checkpoint.verify(fname, len(data)), 4500)
+            self.assertEqual(checkpoint.pending_ranges([(0, 4500)]), [])
+
+    def test_modified_file(self):
+        with Tempdir(prefix="Test_") as td:
+            data = os.urandom(3072)
+            fname = self._write(td, data)
+            ticket = Ticket(fname, '/zone/home/user/data.dat',
+                            mode=Ticket.GET)
+            checkpoint = Checkpoint(ticket)
+            hasher = checkpoint.block_hasher(0)
+            hasher.update(data)
+            self._write(td, data[:1024] + b'x' * 1024 + data[2048:])
+            self.assertEqual(checkpoint.verify(fname, len(data)), 2048)
+            self.assertEqual(checkpoint.pending_ranges([(0, 3072)]),
+                             [(1024, 3072)])
+            self.assertEqual(checkpoint.pending_ranges([(0, 2048),
+                                                        (2048, 3072)]),
+                             [(1024, 2048)])
+
+    def test_unchanged_file(self):
+        with Tempdir(prefix="Test_") as td:
+            data = os.urandom(3072)
+            fname = self._write(td, data)
+            key = ChecksumCache.stat(fname)
+            ticket = Ticket(fname, '/zone/home/user/data.dat',
+                            mode=Ticket.PUT)
+            checkpoint = Checkpoint(ticket)
+            self.assertEqual(checkpoint.verify(fname, len(data), key), 0)
+            # blocks of a known file are not hashed
+            hasher = checkpoint.block_hasher(0)
+            hasher.update(data[:2048])
+            self.assertEqual(ticket.block_hashes, [Checkpoint.UNHASHED] * 2)
+
+            # the file is not read while the key is unchanged
+            ticket = Ticket.from_json(json.loads(ticket.to_json()))
+            checkpoint = Checkpoint(ticket)
+
+            def hash_range(*args):
+                self.fail('file has been read')
+
+            checkpoint.hash_range = hash_range
+            self.assertEqual(checkpoint.verify(fname, len(data), key), 2048)
+            self.assertEqual(checkpoint.pending_ranges([(0, 3072)]),
+                             [(2048, 3072)])
+
+            # modified file: the blocks are dropped
+            os.utime(fname, (1000, 1000))
+            self.assertEqual(checkpoint.verify(fname, len(data),
+                                               ChecksumCache.stat(fname)),
+                             0)
+            self.assertEqual(checkpoint.pending_ranges([(0, 3072)]),
+                             [(0, 3072)])
+
+
+if __name__ == '__main__':
+    unittest.main()
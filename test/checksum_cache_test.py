@@ -0,0 +1,72 @@
+import os
+import unittest
+from .tempdir import Tempdir
+from dm_irods.checksum_cache import ChecksumCache
+from dm_irods.ticket import Ticket
+from dm_irods.ticket import sha256_checksum
+
+
+class TestChecksumCache(unittest.TestCase):
+    def _files(self, td):
+        cache_file = os.path.join(td, 'checksums.log')
+        data_file = os.path.join(td, 'data.dat')
+        with open(data_file, 'wb') as f:
+            f.write(b'x' * 1000)
+        return cache_file, data_file
+
+    def test_lookup(self):
+        with Tempdir(prefix="Test_") as td:
+            cache_file, data_file = self._files(td)
+            cache = ChecksumCache(cache_file)
+            self.assertIsNone(cache.lookup(data_file))
+            cache.add(data_file, 'abc')
+            self.assertEqual(cache.lookup(data_file), 'abc')
+            # persistent
+            cache = ChecksumCache(cache_file)
+            self.assertEqual(cache.lookup(data_file), 'abc')
+            # modified file
+            with open(data_file, 'ab') as f:
+                f.write(b'y')
+            self.assertIsNone(cache.lookup(data_file))
+
+    def test_modified_while_hashing(self):
+        with Tempdir(prefix="Test_") as td:
+            cache_file, data_file = self._files(td)
+            cache = ChecksumCache(cache_file)
+            key = cache.stat(data_file)
+            with open(data_file, 'ab') as f:
+                f.write(b'y')
+            cache.add(data_file, 'abc', key)
+            self.assertIsNone(cache.lookup(data_file))
+
+    def test_compact(self):
+        with Tempdir(prefix="Test_") as td:
+            cache_file, data_file = self._files(td)
+            cache = ChecksumCache(cache_file)
+            for i in range(5):
+                cache.add(data_file, 'checksum%d' % i)
+            with open(cache_file) as f:
+                self.assertEqual(len(f.readlines()), 5)
+            cache = ChecksumCache(cache_file)
+            with open(cache_file) as f:
+                self.assertEqual(len(f.readlines()), 1)
+            self.assertEqual(cache.lookup(data_file), 'checksum4')
+
+    def test_ticket(self):
+        with Tempdir(prefix="Test_") as td:
+            cache_file, data_file = self._files(td)
+            cache = ChecksumCache(cache_file)
+            ticket = Ticket(data_file, '/zone/home/user/data.dat',
+                            mode=Ticket.PUT)
+            ticket.update_local_checksum(cache=cache)
+            checksum = sha256_checksum(data_file).decode()
+            self.assertEqual(ticket.checksum, checksum)
+            self.assertEqual(cache.lookup(data_file), checksum)
+            ticket.checksum = None
+            cache.add(data_file, 'cached')
+            ticket.update_local_checksum(cache=cache)
+            self.assertEqual(ticket.checksum, 'cached')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+import time
+import unittest
+import threading
+from dm_irods.dmf_cache import DmfCache
+from dm_irods.rule_batch import process_batches
+from dm_irods.rule_batch import split_batches
+
+
+class RuleMock(object):
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.calls = []
+
+    def process_all(self, items):
+        items = list(items)
+        self.calls.append([item['remote_file'] for item in items])
+        time.sleep(self.delay)
+        for item in items:
+            item['DMF_state'] = 'DUL'
+            yield item
+
+
+class BatchedRuleMock(object):
+    """
+    Rule batches of 2 objects, executed like GetDmfObject.process_all
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = []
+
+    def query(self, batch, session):
+        with self.lock:
+            self.started.append([item['remote_file'] for item in batch])
+        for item in batch:
+            item['DMF_state'] = 'OFL'
+        return batch
+
+    def process_all(self, items):
+        return process_batches(split_batches(items, lambda: 20), self.query,
+                               'session', lambda: 'borrowed',
+                               lambda session, discard: None, 4)
+
+
+class TestDmfCache(unittest.TestCase):
+    def _items(self, *names):
+        return [{'remote_file': '/zone/' + name, 'local_file': '/tmp/' + name}
+                for name in names]
+
+    def test_cached(self):
+        cache = DmfCache(ttl=60)
+        rule = RuleMock()
+        items = list(cache.process_all(self._items('b', 'a', 'b'),
+                                       rule.process_all))
+        self.assertEqual([item['local_file'] for item in items],
+                         ['/tmp/b', '/tmp/a', '/tmp/b'])
+        self.assertEqual(set(item['DMF_state'] for item in items),
+                         set(['DUL']))
+        self.assertEqual(rule.calls, [['/zone/a', '/zone/b']])
+        items = list(cache.process_all(self._items('a', 'c'),
+                                       rule.process_all))
+        self.assertEqual(items[0]['DMF_state'], 'DUL')
+        self.assertEqual(rule.calls[1], ['/zone/c'])
+
+    def test_invalidate(self):
+        cache = DmfCache(ttl=60)
+        rule = RuleMock()
+        list(cache.process_all(self._items('a', 'b'), rule.process_all))
+        cache.invalidate('/zone/a')
+        list(cache.process_all(self._items('a', 'b'), rule.process_all))
+        self.assertEqual(rule.calls[1], ['/zone/a'])
+
+    def test_ttl(self):
+        cache = DmfCache(ttl=60)
+        rule = RuleMock()
+        list(cache.process_all(self._items('a'), rule.process_all))
+        self.assertEqual(cache.evict_expired(time.time() + 30), 0)
+        self.assertEqual(cache.evict_expired(time.time() + 60), 1)
+        self.assertEqual(len(cache), 0)
+
+    def test_single_flight(self):
+        cache = DmfCache(ttl=60)
+        rule = RuleMock(delay=0.2)
+        results = []
+
+        def listing():
+            results.append(list(cache.process_all(self._items('a', 'b'),
+                                                  rule.process_all)))
+
+        threads = [threading.Thread(target=listing) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(rule.calls), 1)
+        for items in results:
+            self.assertEqual([item['DMF_state'] for item in items],
+                             ['DUL', 'DUL'])
+
+    def test_failure(self):
+        cache = DmfCache(ttl=60)
+
+        def failing(items):
+            raise IOError('rule failed')
+            yield
+
+        with self.assertRaises(IOError):
+            list(cache.process_all(self._items('a'), failing))
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.inflight, {})
+
+    def test_pipelined_chunks(self):
+        batch = DmfCache.BATCH
+        DmfCache.BATCH = 2
+        try:
+            cache = DmfCache(ttl=60)
+            rule = BatchedRuleMock()
+            items = cache.process_all(self._items('a', 'b', 'c', 'd', 'e'),
+                                      rule.process_all)
+            item = next(items)
+            self.assertEqual(item['DMF_state'], 'OFL')
+            # the second batch has been requested before the rows of
+            # the first one are consumed
+            self.assertEqual(rule.started[:2],
+                             [['/zone/a', '/zone/b'], ['/zone/c', '/zone/d']])
+            self.assertEqual([i['DMF_state'] for i in items], ['OFL'] * 4)
+            self.assertEqual(len(cache), 5)
+            self.assertEqual(cache.inflight, {})
+        finally:
+            DmfCache.BATCH = batch
+
+    def test_repeated_in_chunks(self):
+        batch = DmfCache.BATCH
+        DmfCache.BATCH = 2
+        try:
+            cache = DmfCache(ttl=60)
+            rule = RuleMock()
+            items = list(cache.process_all(self._items('a', 'b', 'c', 'a'),
+                                           rule.process_all))
+            self.assertEqual([i['DMF_state'] for i in items], ['DUL'] * 4)
+            self.assertEqual(rule.calls, [['/zone/a', '/zone/b',
+                                           '/zone/c']])
+        finally:
+            DmfCache.BATCH = batch
+
+    def test_close(self):
+        batch = DmfCache.BATCH
+        DmfCache.BATCH = 2
+        try:
+            cache = DmfCache(ttl=60)
+            rule = BatchedRuleMock()
+            items = cache.process_all(self._items('a', 'b', 'c', 'd', 'e'),
+                                      rule.process_all)
+            next(items)
+            items.close()
+            self.assertEqual(cache.inflight, {})
+            # results of finished flights are kept
+            self.assertIn('/zone/a', cache.entries)
+        finally:
+            DmfCache.BATCH = batch
+
+
+if __name__ == '__main__':
+    unittest.main()
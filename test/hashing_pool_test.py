@@ -0,0 +1,55 @@
+import os
+import time
+import unittest
+import threading
+from .tempdir import Tempdir
+from dm_irods.checksum_cache import ChecksumCache
+from dm_irods.hashing_pool import HashingPool
+from dm_irods.hashing_pool import _hash_file
+from dm_irods.ticket import sha256_checksum
+
+
+class TestHashingPool(unittest.TestCase):
+    def test_hash_files(self):
+        with Tempdir(prefix="Test_") as td:
+            cache = ChecksumCache(os.path.join(td, 'checksums.log'))
+            files = []
+            for i in range(5):
+                filename = os.path.join(td, 'file%d.dat' % i)
+                with open(filename, 'wb') as f:
+                    f.write(os.urandom(10000))
+                files.append(filename)
+            pool = HashingPool(cache, workers=2, max_queue=3)
+            release = threading.Event()
+
+            def hash_file(filename):
+                release.wait()
+                return _hash_file(filename)
+
+            pool.hash_file = hash_file
+            try:
+                self.assertTrue(pool.submit(files[0]))
+                self.assertTrue(pool.submit(files[1]))
+                self.assertTrue(pool.submit(files[1]))
+                self.assertTrue(pool.submit(files[2]))
+                self.assertEqual(pool.num_pending(), 3)
+                # bounded queue
+                self.assertFalse(pool.submit(files[3]))
+                release.set()
+                for i in range(100):
+                    if pool.num_pending() == 0:
+                        break
+                    time.sleep(0.1)
+                self.assertEqual(pool.num_pending(), 0)
+            finally:
+                release.set()
+                pool.shutdown()
+            for filename in files[:3]:
+                self.assertEqual(cache.lookup(filename),
+                                 sha256_checksum(filename).decode())
+            self.assertIsNone(cache.lookup(files[3]))
+            self.assertIsNone(cache.lookup(files[4]))
+
+
+if __name__ == '__main__':
+    unittest.main()
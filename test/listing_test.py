@@ -0,0 +1,158 @@
+import datetime
+import unittest
+import threading
+from dm_irods.ticket import Ticket
+from dm_irods.ticket_index import TicketIndex
+from dm_irods.listing import TicketQuery
+from dm_irods.listing import object_criteria
+
+
+class TestTicketQuery(unittest.TestCase):
+    def setUp(self):
+        self.index = TicketIndex()
+        self.tickets = {}
+        self.lock = threading.RLock()
+        statuses = [Ticket.WAITING, Ticket.DONE, Ticket.ERROR]
+        for i in range(60):
+            ticket = Ticket('/tmp/f%02d' % i,
+                            '/zone/home/user/c%d/f%02d' % (i % 3, i),
+                            mode=Ticket.GET if i % 2 else Ticket.PUT,
+                            status=statuses[i % 3],
+                            time_created=1000 + (i * 7) % 60,
+                            local_size=i * 100)
+            self._add(ticket)
+
+    def _add(self, ticket):
+        p = (ticket.local_file, ticket.remote_file)
+        self.tickets[p] = ticket
+        self.index.update(ticket)
+
+    def _list(self, flt={}, sort=None, cursor=None):
+        query = TicketQuery(flt, sort=sort, cursor=cursor)
+        return query, list(query.tickets(self.index, self.tickets,
+                                         self.lock))
+
+    def _pages(self, flt={}, sort=None, limit=7):
+        ret = []
+        cursor = None
+        while True:
+            query, page = self._list(flt, sort, cursor)
+            page = page[:limit]
+            ret.extend(page)
+            if len(page) < limit:
+                return ret
+            cursor = query.cursor(page[-1])
+
+    def test_sort(self):
+        query, lst = self._list(sort='status')
+        rank = Ticket.sorted_codes.index
+        self.assertEqual(lst, sorted(lst, key=lambda t: (rank(t.status),
+                                                         t.time_created,
+                                                         t.local_file)))
+        query, lst = self._list(sort='time')
+        self.assertEqual(lst, sorted(lst, key=lambda t: (t.time_created,
+                                                         t.local_file)))
+        query, lst = self._list(sort='path')
+        self.assertEqual(len(lst), 60)
+        self.assertEqual([t.remote_file for t in lst],
+                         sorted(t.remote_file for t in lst))
+
+    def test_pages(self):
+        for sort in TicketQuery.SORT_KEYS:
+            query, lst = self._list(sort=sort)
+            self.assertEqual(self._pages(sort=sort), lst)
+            flt = {'collection_prefix': '/zone/home/user/c1'}
+            query, lst = self._list(flt, sort=sort)
+            self.assertEqual(len(lst), 20)
+            self.assertEqual(self._pages(flt, sort=sort), lst)
+
+    def test_chunks(self):
+        chunk = TicketQuery.CHUNK
+        for sort in TicketQuery.SORT_KEYS:
+            query, lst = self._list(sort=sort)
+            TicketQuery.CHUNK = 4
+            try:
+                self.assertEqual(self._list(sort=sort)[1], lst)
+                self.assertEqual(self._pages(sort=sort), lst)
+            finally:
+                TicketQuery.CHUNK = chunk
+
+    def test_large_prefix(self):
+        flt = {'collection_prefix': '/zone/home/user/c1', 'mode': 'GET'}
+        small = TicketQuery.SMALL_PREFIX
+        chunk = TicketQuery.CHUNK
+        for sort in TicketQuery.SORT_KEYS:
+            query, lst = self._list(flt, sort=sort)
+            self.assertEqual(len(lst), 10)
+            # scan in sort order with the prefix as a filter
+            TicketQuery.SMALL_PREFIX = 5
+            TicketQuery.CHUNK = 4
+            try:
+                self.assertEqual(self._list(flt, sort=sort)[1], lst)
+                self.assertEqual(self._pages(flt, sort=sort), lst)
+            finally:
+                TicketQuery.SMALL_PREFIX = small
+                TicketQuery.CHUNK = chunk
+
+    def test_filters(self):
+        query, lst = self._list({'status': ['error'], 'mode': 'GET'})
+        self.assertEqual(len(lst), 10)
+        for t in lst:
+            self.assertEqual((t.status, t.mode), (Ticket.ERROR, Ticket.GET))
+        query, lst = self._list({'active': True})
+        self.assertEqual(set(t.status for t in lst), set([Ticket.WAITING]))
+        self.assertFalse(query.needs_history())
+        query, lst = self._list({'glob': '*/c2/f1*'})
+        self.assertEqual(sorted(t.local_file for t in lst),
+                         ['/tmp/f11', '/tmp/f14', '/tmp/f17'])
+        query, lst = self._list({'time_range': [1010, 1019]}, sort='time')
+        self.assertEqual([t.time_created for t in lst],
+                         [float(t) for t in range(1010, 1020)])
+        query, lst = self._list({'size_range': [None, 450]})
+        self.assertEqual(len(lst), 5)
+        query, lst = self._list({'collection': '/zone/home/user/c0',
+                                 'object': 'f03'})
+        self.assertEqual([t.local_file for t in lst], ['/tmp/f03'])
+
+    def test_with_objects(self):
+        self.assertTrue(TicketQuery({}).with_objects)
+        # objects without tickets have no cursor
+        self.assertFalse(TicketQuery({'collection_prefix': '/zone'})
+                         .with_objects)
+        self.assertFalse(TicketQuery({'active': True}).with_objects)
+        self.assertFalse(TicketQuery({'status': ['DONE']}).with_objects)
+        self.assertFalse(TicketQuery({}, sort='time').with_objects)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, TicketQuery, {}, 'size')
+        self.assertRaises(ValueError, TicketQuery, {'status': ['NEW']})
+        self.assertRaises(ValueError, TicketQuery, {}, None, 'xyz')
+        query, lst = self._list(sort='time')
+        cursor = query.cursor(lst[0])
+        self.assertRaises(ValueError, TicketQuery, {}, 'path', cursor)
+
+
+class TestObjectCriteria(unittest.TestCase):
+    def test_criteria(self):
+        fields = {'collection': 'COLL_NAME',
+                  'object': 'DATA_NAME',
+                  'remote_modify_time': 'D_MODIFY_TIME'}
+        criteria = object_criteria({'collection_prefix': '/zone/home',
+                                    'object': 'a.dat',
+                                    'modified_since': 86400,
+                                    'modified_before': 86400 * 2},
+                                   fields, lambda *args: args)
+        self.assertEqual(criteria,
+                         [('<', 'D_MODIFY_TIME',
+                           datetime.datetime(1970, 1, 3)),
+                          ('>=', 'D_MODIFY_TIME',
+                           datetime.datetime(1970, 1, 2)),
+                          ('=', 'DATA_NAME', 'a.dat')])
+        self.assertEqual(object_criteria({}, fields, lambda *args: args),
+                         [])
+        self.assertRaises(KeyError, object_criteria, {'unknown': 1},
+                          fields, lambda *args: args)
+
+
+if __name__ == '__main__':
+    unittest.main()
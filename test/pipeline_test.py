@@ -0,0 +1,37 @@
+import unittest
+import io
+import os
+from dm_irods.pipeline import Pipeline
+
+
+class FailingReader(io.BytesIO):
+    def readinto(self, b):
+        if self.tell() > 0:
+            raise IOError('read failed')
+        return super(FailingReader, self).readinto(b)
+
+
+class TestPipeline(unittest.TestCase):
+    def test_copy(self):
+        data = os.urandom(10000)
+        src = io.BytesIO(data + b'tail')
+        dst = io.BytesIO()
+        chunks = []
+        Pipeline(1024, 3).copy(src, dst, len(data),
+                               lambda chunk: chunks.append(bytes(chunk)))
+        self.assertEqual(dst.getvalue(), data)
+        self.assertEqual(b''.join(chunks), data)
+        self.assertEqual(src.tell(), len(data))
+
+    def test_short_source(self):
+        with self.assertRaises(IOError):
+            Pipeline(1024).copy(io.BytesIO(b'x' * 100), io.BytesIO(), 200)
+
+    def test_read_error(self):
+        with self.assertRaises(IOError):
+            Pipeline(1024).copy(FailingReader(b'x' * 4096),
+                                io.BytesIO(), 4096)
+
+
+if __name__ == '__main__':
+    unittest.main()
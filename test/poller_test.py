@@ -0,0 +1,59 @@
+import unittest
+from dm_irods.poller import DmfPoller
+from dm_irods.ticket import Ticket
+
+
+class TestDmfPoller(unittest.TestCase):
+    def _ticket(self, name):
+        return Ticket('/tmp/' + name, '/zone/home/user/' + name,
+                      mode=Ticket.GET, status=Ticket.UNMIG)
+
+    def test_due(self):
+        poller = DmfPoller()
+        a = self._ticket('a')
+        b = self._ticket('b')
+        poller.start(a.remote_file, now=0)
+        # unknown tickets are due immediately
+        self.assertEqual(poller.due([a, b], now=1), [b])
+        self.assertFalse(poller.update(b.remote_file, False, now=1))
+        self.assertEqual(poller.due([a, b], now=DmfPoller.MIN_INTERVAL),
+                         [a])
+
+    def test_backoff(self):
+        poller = DmfPoller()
+        poller.start('/a', now=0)
+        poller.update('/a', False, now=200)
+        self.assertEqual(poller.next_poll['/a'], 250)
+        poller.update('/a', False, now=100000)
+        self.assertEqual(poller.next_poll['/a'],
+                         100000 + DmfPoller.MAX_INTERVAL)
+
+    def test_latency(self):
+        poller = DmfPoller()
+        poller.start('/a', now=0)
+        self.assertTrue(poller.update('/a', True, now=300))
+        self.assertEqual(poller.latency, 300)
+        self.assertNotIn('/a', poller.next_poll)
+        # check halfway to the expected staging time
+        poller.start('/b', now=1000)
+        self.assertEqual(poller.next_poll['/b'], 1150)
+        poller.update('/b', True, now=1400)
+        self.assertAlmostEqual(poller.latency, 320)
+
+    def test_check(self):
+        poller = DmfPoller()
+        a = self._ticket('a')
+        b = self._ticket('b')
+        c = self._ticket('c')
+        for t in [a, b, c]:
+            poller.start(t.remote_file, now=0)
+        items = [{'remote_file': a.remote_file, 'DMF_state': 'OFL'},
+                 {'remote_file': b.remote_file, 'DMF_state': 'DUL'},
+                 {'remote_file': c.remote_file}]
+        self.assertEqual(poller.check([a, b, c], items, now=20),
+                         set([b.remote_file, c.remote_file]))
+        self.assertEqual(poller.due([a], now=20), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
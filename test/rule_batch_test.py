@@ -0,0 +1,204 @@
+import sys
+import time
+import unittest
+import threading
+import traceback
+from dm_irods.rule_batch import RuleBatchSize
+from dm_irods.rule_batch import isolate_failures
+from dm_irods.rule_batch import process_batches
+from dm_irods.rule_batch import split_batches
+
+
+class TestRuleBatchSize(unittest.TestCase):
+    def test_failure(self):
+        batch_size = RuleBatchSize(20000, min_size=1000)
+        batch_size.report(20000, 1.0, failed=True)
+        self.assertEqual(batch_size.size(), 10000)
+        for i in range(10):
+            batch_size.report(batch_size.size(), 1.0, failed=True)
+        self.assertEqual(batch_size.size(), 1000)
+
+    def test_latency(self):
+        batch_size = RuleBatchSize(20000, target_latency=5.0)
+        batch_size.report(20000, 10.0)
+        self.assertEqual(batch_size.size(), 10000)
+        # the last batch of a list is not full
+        batch_size.report(3000, 1.0)
+        self.assertEqual(batch_size.size(), 10000)
+        batch_size.report(10000, 1.0)
+        self.assertEqual(batch_size.size(), 10000 + RuleBatchSize.STEP)
+        for i in range(10):
+            batch_size.report(batch_size.size(), 1.0)
+        self.assertEqual(batch_size.size(), 20000)
+
+
+class RuleMock(object):
+    def __init__(self, bad=(), error=None):
+        self.bad = set(bad)
+        self.error = error
+        self.calls = 0
+
+    def __call__(self, batch):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        for item in batch:
+            if item in self.bad:
+                raise ValueError('bad object %s' % item)
+
+
+class TestIsolateFailures(unittest.TestCase):
+    def test_ok(self):
+        rule = RuleMock()
+        self.assertEqual(isolate_failures(list(range(100)), rule), [])
+        self.assertEqual(rule.calls, 1)
+
+    def test_bad_items(self):
+        rule = RuleMock(bad=[17, 80])
+        failures = isolate_failures(list(range(100)), rule)
+        self.assertEqual([item for item, e in failures], [17, 80])
+        self.assertEqual(str(failures[0][1]), 'bad object 17')
+        self.assertTrue(rule.calls < 30)
+
+    def test_single_item(self):
+        failures = isolate_failures([3], RuleMock(bad=[3]))
+        self.assertEqual([item for item, e in failures], [3])
+
+    def test_systemic(self):
+        rule = RuleMock(error=ValueError('microservice not found'))
+        self.assertRaises(ValueError, isolate_failures,
+                          list(range(1000)), rule)
+        self.assertEqual(rule.calls, 3)
+
+    def test_max_calls(self):
+        rule = RuleMock(bad=range(0, 1000, 7))
+        self.assertRaises(ValueError, isolate_failures,
+                          list(range(1000)), rule, max_calls=20)
+        self.assertEqual(rule.calls, 21)
+
+    def test_fatal(self):
+        rule = RuleMock(error=IOError('connection lost'))
+        self.assertRaises(IOError, isolate_failures, list(range(10)), rule,
+                          fatal=(IOError,))
+        self.assertEqual(rule.calls, 1)
+
+
+class SessionPoolMock(object):
+    def __init__(self, max_total):
+        self.max_total = max_total
+        self.lock = threading.Lock()
+        self.borrowed = 0
+        self.in_use = 0
+        self.released = []
+
+    def acquire(self):
+        with self.lock:
+            if self.in_use >= self.max_total:
+                return None
+            self.borrowed += 1
+            self.in_use += 1
+            return 'session%d' % self.borrowed
+
+    def release(self, session, discard=False):
+        with self.lock:
+            self.in_use -= 1
+            self.released.append((session, discard))
+
+
+class QueryMock(object):
+    def __init__(self, delay=0.01, bad=None):
+        self.delay = delay
+        self.bad = bad
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+        self.sessions = []
+
+    def __call__(self, batch, session):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            self.sessions.append(session)
+        try:
+            time.sleep(self.delay)
+            if self.bad in batch:
+                raise ValueError('bad batch')
+            return [item * 10 for item in batch]
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+class TestProcessBatches(unittest.TestCase):
+    def batches(self, n, size=3):
+        return [list(range(i, i + size)) for i in range(0, n * size, size)]
+
+    def test_split(self):
+        items = [{'remote_file': '/zone/f%d' % i} for i in range(10)]
+        batches = list(split_batches(items, lambda: 20))
+        self.assertEqual([len(b) for b in batches], [2, 2, 2, 2, 2])
+        self.assertEqual(sum(batches, []), items)
+        self.assertEqual(list(split_batches([], lambda: 20)), [])
+
+    def test_single_batch(self):
+        pool = SessionPoolMock(4)
+        query = QueryMock()
+        result = list(process_batches([[1, 2]], query, 'main',
+                                      pool.acquire, pool.release, 4))
+        self.assertEqual(result, [10, 20])
+        self.assertEqual(query.sessions, ['main'])
+        self.assertEqual(pool.borrowed, 0)
+
+    def test_order(self):
+        pool = SessionPoolMock(10)
+        query = QueryMock()
+        result = list(process_batches(self.batches(20), query, 'main',
+                                      pool.acquire, pool.release, 4))
+        self.assertEqual(result, [i * 10 for i in range(60)])
+        self.assertTrue(query.max_running <= 4)
+        self.assertEqual(pool.in_use, 0)
+        self.assertEqual(len(pool.released), 20)
+        self.assertFalse(any(discard for s, discard in pool.released))
+
+    def test_no_session(self):
+        # batches without a borrowed session use the main session
+        pool = SessionPoolMock(0)
+        query = QueryMock()
+        result = list(process_batches(self.batches(6), query, 'main',
+                                      pool.acquire, pool.release, 4))
+        self.assertEqual(result, [i * 10 for i in range(18)])
+        self.assertEqual(query.sessions, ['main'] * 6)
+        self.assertEqual(pool.released, [])
+
+    def test_error(self):
+        pool = SessionPoolMock(10)
+        query = QueryMock(bad=7)
+        gen = process_batches(self.batches(6), query, 'main',
+                              pool.acquire, pool.release, 4)
+        result = []
+        try:
+            for item in gen:
+                result.append(item)
+            self.fail('no error')
+        except ValueError:
+            tb = traceback.extract_tb(sys.exc_info()[2])
+        self.assertEqual(result, [0, 10, 20, 30, 40, 50])
+        # the traceback of the thread is preserved
+        self.assertEqual(tb[-1][2], '__call__')
+        self.assertIn(('session3', True), pool.released)
+
+    def test_close(self):
+        pool = SessionPoolMock(10)
+        query = QueryMock(delay=0.1)
+        gen = process_batches(self.batches(10), query, 'main',
+                              pool.acquire, pool.release, 4)
+        self.assertEqual(next(gen), 0)
+        gen.close()
+        # the running threads are joined
+        self.assertEqual(query.running, 0)
+        self.assertEqual(pool.in_use, 0)
+        self.assertEqual(len(pool.released), pool.borrowed)
+
+
+if __name__ == '__main__':
+    unittest.main()
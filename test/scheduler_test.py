@@ -0,0 +1,88 @@
+import unittest
+from dm_irods.scheduler import RecallScheduler
+from dm_irods.ticket import Ticket
+
+
+class TestRecallScheduler(unittest.TestCase):
+    def _ticket(self, name, time_created, mode=Ticket.GET):
+        return Ticket('/tmp/' + name, '/zone/home/user/' + name,
+                      mode=mode, time_created=time_created)
+
+    def test_order(self):
+        tickets = [self._ticket('a', 1),
+                   self._ticket('b', 2),
+                   self._ticket('c', 3),
+                   self._ticket('d', 4),
+                   self._ticket('e', 5),
+                   self._ticket('f', 6)]
+        scheduler = RecallScheduler()
+        self.assertEqual(len(scheduler.unknown(tickets)), 6)
+        scheduler.update([
+            {'remote_file': '/zone/home/user/a', 'DMF_state': 'OFL',
+             'DMF_vsn': 'T2', 'DMF_position': '30'},
+            {'remote_file': '/zone/home/user/b', 'DMF_state': 'OFL',
+             'DMF_vsn': 'T1', 'DMF_position': '20'},
+            {'remote_file': '/zone/home/user/c', 'DMF_state': 'DUL'},
+            {'remote_file': '/zone/home/user/d', 'DMF_state': 'OFL',
+             'DMF_vsn': 'T2', 'DMF_position': '10'},
+            {'remote_file': '/zone/home/user/e', 'DMF_state': 'OFL',
+             'DMF_vsn': 'T1', 'DMF_position': '5'}])
+        self.assertEqual([t.object for t in scheduler.unknown(tickets)],
+                         ['f'])
+        self.assertEqual([t.object for t in scheduler.order(tickets)],
+                         ['c', 'f', 'd', 'a', 'e', 'b'])
+
+    def test_bfid(self):
+        tickets = [self._ticket('a', 1),
+                   self._ticket('b', 2)]
+        scheduler = RecallScheduler()
+        scheduler.update([
+            {'remote_file': '/zone/home/user/a', 'DMF_state': 'OFL',
+             'DMF_bfid': '5b3b7e1c00000000000000ff'},
+            {'remote_file': '/zone/home/user/b', 'DMF_state': 'OFL',
+             'DMF_bfid': '5b3b7e1c000000000000000a'}])
+        self.assertEqual([t.object for t in scheduler.order(tickets)],
+                         ['b', 'a'])
+        scheduler.forget('/zone/home/user/a')
+        self.assertEqual([t.object for t in scheduler.unknown(tickets)],
+                         ['a'])
+
+    def test_expire(self):
+        tickets = [self._ticket('a', 1)]
+        scheduler = RecallScheduler()
+        scheduler.update([{'remote_file': '/zone/home/user/a',
+                           'DMF_state': 'OFL'}], now=100)
+        self.assertEqual(scheduler.unknown(tickets, now=101), [])
+        self.assertFalse(scheduler.is_online('/zone/home/user/a'))
+        now = 100 + RecallScheduler.LOCATION_TTL
+        self.assertEqual(scheduler.unknown(tickets, now=now), tickets)
+        scheduler.update([{'remote_file': '/zone/home/user/a',
+                           'DMF_state': 'OFL'}], now=100)
+        scheduler.evict_expired(now=now)
+        self.assertEqual(scheduler.locations, {})
+
+    def test_backoff(self):
+        tickets = [self._ticket('a', 1)]
+        scheduler = RecallScheduler()
+        no_state = [{'remote_file': '/zone/home/user/a',
+                     'DMF_error': 'rule failed'}]
+        now = 100
+        for interval in [10, 20, 40]:
+            scheduler.update(no_state, now=now)
+            self.assertEqual(scheduler.unknown(tickets, now=now), [])
+            self.assertEqual(
+                scheduler.unknown(tickets, now=now + interval - 1), [])
+            now += interval
+            self.assertEqual(scheduler.unknown(tickets, now=now), tickets)
+        for i in range(10):
+            scheduler.update(no_state, now=now)
+        self.assertEqual(scheduler.retries['/zone/home/user/a'][1],
+                         now + RecallScheduler.MAX_RETRY)
+        # a state resets the backoff
+        scheduler.update([{'remote_file': '/zone/home/user/a',
+                           'DMF_state': 'DUL'}], now=now)
+        self.assertEqual(scheduler.retries, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+import threading
+from dm_irods.session_pool import SessionPool
+
+
+class FakeSession(object):
+    def __init__(self, index, alive=True):
+        self.index = index
+        self.alive = alive
+        self.closed = False
+
+    def cleanup(self):
+        self.closed = True
+
+
+class TestSessionPool(unittest.TestCase):
+    def setUp(self):
+        self.sessions = []
+
+    def factory(self):
+        session = FakeSession(len(self.sessions))
+        self.sessions.append(session)
+        return session
+
+    def check(self, session):
+        if not session.alive:
+            raise IOError('connection lost')
+
+    def test_reuse(self):
+        pool = SessionPool(self.factory, max_size=1)
+        s1 = pool.acquire()
+        s2 = pool.acquire()
+        self.assertIsNot(s1, s2)
+        pool.release(s1)
+        pool.release(s2)
+        # pool is full: second session is closed
+        self.assertFalse(s1.closed)
+        self.assertTrue(s2.closed)
+        self.assertIs(pool.acquire(), s1)
+        self.assertEqual(len(self.sessions), 2)
+
+    def test_discard(self):
+        pool = SessionPool(self.factory)
+        s1 = pool.acquire()
+        pool.release(s1, discard=True)
+        self.assertTrue(s1.closed)
+        self.assertIsNot(pool.acquire(), s1)
+        self.assertEqual(pool.num_borrowed, 1)
+
+    def test_check(self):
+        pool = SessionPool(self.factory, check=self.check,
+                           check_interval=0)
+        s1 = pool.acquire()
+        pool.release(s1)
+        s1.alive = False
+        s2 = pool.acquire()
+        self.assertIsNot(s1, s2)
+        self.assertTrue(s1.closed)
+
+    def test_evict(self):
+        pool = SessionPool(self.factory, idle_timeout=-1)
+        s1 = pool.acquire()
+        pool.release(s1)
+        pool.evict_idle()
+        self.assertTrue(s1.closed)
+        self.assertEqual(pool.num_idle(), 0)
+
+    def test_max_total(self):
+        pool = SessionPool(self.factory, max_total=2, timeout=0.1)
+        s1 = pool.acquire()
+        s2 = pool.acquire()
+        self.assertIsNone(pool.acquire(block=False))
+        self.assertRaises(IOError, pool.acquire)
+        acquired = []
+        thread = threading.Thread(target=lambda:
+                                  acquired.append(pool.acquire()))
+        pool.timeout = 10
+        thread.start()
+        pool.release(s1)
+        thread.join()
+        self.assertEqual(acquired, [s1])
+        self.assertEqual(pool.num_borrowed, 2)
+        pool.release(s2, discard=True)
+        self.assertIsNotNone(pool.acquire(block=False))
+        self.assertEqual(len(self.sessions), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
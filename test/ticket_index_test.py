@@ -0,0 +1,54 @@
+import unittest
+from dm_irods.ticket import Ticket
+from dm_irods.ticket_index import TicketIndex
+
+
+class TestTicketIndex(unittest.TestCase):
+    def _ticket(self, remote_file, time_created, status=Ticket.WAITING):
+        return Ticket('/tmp' + remote_file, remote_file,
+                      mode=Ticket.GET, status=status,
+                      time_created=time_created)
+
+    def test_status(self):
+        index = TicketIndex()
+        a = self._ticket('/z/a', 3)
+        b = self._ticket('/z/b', 1)
+        c = self._ticket('/z/c', 2, Ticket.DONE)
+        for t in [a, b, c]:
+            index.update(t)
+        self.assertEqual([p[1] for p in index.by_status(Ticket.WAITING)],
+                         ['/z/b', '/z/a'])
+        b.status = Ticket.DONE
+        index.update(b)
+        self.assertEqual([p[1] for p in index.by_status(Ticket.WAITING)],
+                         ['/z/a'])
+        self.assertEqual([p[1] for p in index.by_status(Ticket.DONE)],
+                         ['/z/b', '/z/c'])
+        index.remove(('/tmp/z/c', '/z/c'))
+        self.assertEqual([p[1] for p in index.by_status(Ticket.DONE)],
+                         ['/z/b'])
+        self.assertEqual(len(index), 2)
+
+    def test_remote_file_and_collection(self):
+        index = TicketIndex()
+        for remote_file in ['/z/home/a', '/z/home/sub/b', '/z/home-x/c',
+                            '/z/home/sub/deep/d', '/z/other/e']:
+            index.update(self._ticket(remote_file, 1))
+        self.assertEqual(index.by_remote_file('/z/home/a'),
+                         [('/tmp/z/home/a', '/z/home/a')])
+        self.assertEqual(index.by_remote_file('/z/home/x'), [])
+        self.assertEqual(sorted(p[1] for p in index.by_collection('/z/home')),
+                         ['/z/home/a', '/z/home/sub/b',
+                          '/z/home/sub/deep/d'])
+        self.assertEqual(sorted(p[1]
+                                for p in index.by_collection('/z/home/sub/')),
+                         ['/z/home/sub/b', '/z/home/sub/deep/d'])
+        index.remove(('/tmp/z/home/sub/b', '/z/home/sub/b'))
+        self.assertEqual(sorted(p[1]
+                                for p in index.by_collection('/z/home/sub')),
+                         ['/z/home/sub/deep/d'])
+        self.assertNotIn('/z/home/sub', index.sorted_collections)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import os
+import json
+import sqlite3
+import unittest
+from .tempdir import Tempdir
+from dm_irods.ticket import Ticket
+from dm_irods.ticket_store import TicketStore
+
+
+class TestTicketStore(unittest.TestCase):
+    def _ticket(self, name, status=Ticket.WAITING):
+        return Ticket('/tmp/' + name, '/zone/home/user/' + name,
+                      mode=Ticket.GET, status=status)
+
+    def test_save_load(self):
+        with Tempdir(prefix="Test_") as td:
+            db_file = os.path.join(td, 'tickets.db')
+            store = TicketStore(db_file)
+            a = self._ticket('a')
+            b = self._ticket('b', Ticket.DONE)
+            store.save(a)
+            store.save(b)
+            store.commit()
+            a.status = Ticket.GETTING
+            a.block_hashes = ['x']
+            store.save(a)
+            store.close()
+
+            store = TicketStore(db_file)
+            self.assertEqual(store.count(), 2)
+            tickets = {t.remote_file: t for t in store.load()}
+            self.assertEqual(tickets[a.remote_file].status, Ticket.GETTING)
+            self.assertEqual(tickets[a.remote_file].block_hashes, ['x'])
+            self.assertEqual([t.remote_file
+                              for t in store.load([Ticket.DONE])],
+                             [b.remote_file])
+            store.delete(a.local_file, a.remote_file)
+            store.commit()
+            self.assertEqual(store.count(), 1)
+            store.close()
+
+    def test_get(self):
+        with Tempdir(prefix="Test_") as td:
+            store = TicketStore(os.path.join(td, 'tickets.db'))
+            a = self._ticket('a', Ticket.DONE)
+            store.save(a)
+            self.assertEqual(store.get(a.local_file, a.remote_file).status,
+                             Ticket.DONE)
+            store.commit()
+            self.assertEqual(store.get(a.local_file, a.remote_file).status,
+                             Ticket.DONE)
+            self.assertEqual([t.remote_file
+                              for t in store.load(Ticket.ACTIVE_CODES)],
+                             [])
+            store.delete(a.local_file, a.remote_file)
+            self.assertIsNone(store.get(a.local_file, a.remote_file))
+            store.close()
+
+    def test_by_remote_file(self):
+        with Tempdir(prefix="Test_") as td:
+            store = TicketStore(os.path.join(td, 'tickets.db'))
+            a = self._ticket('a', Ticket.DONE)
+            b = Ticket('/tmp/other/a', a.remote_file,
+                       mode=Ticket.GET, status=Ticket.WAITING)
+            store.save(a)
+            store.save(self._ticket('c'))
+            store.commit()
+            store.save(b)
+            self.assertEqual(sorted(t.local_file for t in
+                                    store.by_remote_file(a.remote_file)),
+                             ['/tmp/a', '/tmp/other/a'])
+            store.delete(a.local_file, a.remote_file)
+            self.assertEqual([t.local_file for t in
+                              store.by_remote_file(a.remote_file)],
+                             ['/tmp/other/a'])
+            store.close()
+
+    def test_housekeeping_candidates(self):
+        with Tempdir(prefix="Test_") as td:
+            store = TicketStore(os.path.join(td, 'tickets.db'))
+            old = Ticket('/tmp/a', '/zone/a', status=Ticket.DONE,
+                         time_created=100)
+            new = Ticket('/tmp/b', '/zone/b', status=Ticket.DONE,
+                         time_created=2000)
+            active = Ticket('/tmp/c', '/zone/c', status=Ticket.WAITING,
+                            time_created=100)
+            for t in [old, new, active]:
+                store.save(t)
+            store.commit()
+            done = Ticket.INACTIVE_CODES
+            self.assertEqual(store.housekeeping_candidates(done, 1000, 1000,
+                                                           10),
+                             [('/tmp/a', '/zone/a', None)])
+            store.set_next_check([('/tmp/a', '/zone/a', 5000, 3600)])
+            self.assertEqual(store.housekeeping_candidates(done, 1000, 1000,
+                                                           10), [])
+            # b is due 900 s after it has been created
+            self.assertEqual(store.next_housekeeping(done, 900), 2900)
+            self.assertEqual(store.next_housekeeping(done, 4000), 5000)
+            self.assertIsNone(store.next_housekeeping([Ticket.ERROR], 900))
+            self.assertEqual(store.housekeeping_candidates(done, 1000, 5000,
+                                                           10),
+                             [('/tmp/a', '/zone/a', 3600)])
+            # saving the ticket resets the schedule
+            store.save(old)
+            store.commit()
+            self.assertEqual(store.housekeeping_candidates(done, 1000, 1000,
+                                                           10),
+                             [('/tmp/a', '/zone/a', None)])
+            store.close()
+
+    def test_migration(self):
+        with Tempdir(prefix="Test_") as td:
+            db_file = os.path.join(td, 'tickets.db')
+            conn = sqlite3.connect(db_file)
+            conn.execute('CREATE TABLE tickets (' +
+                         'local_file TEXT NOT NULL, ' +
+                         'remote_file TEXT NOT NULL, ' +
+                         'mode INTEGER NOT NULL, ' +
+                         'status INTEGER NOT NULL, ' +
+                         'time_created REAL NOT NULL, ' +
+                         'data TEXT NOT NULL, ' +
+                         'PRIMARY KEY (local_file, remote_file))')
+            conn.commit()
+            conn.close()
+            store = TicketStore(db_file)
+            store.save(self._ticket('a', Ticket.DONE))
+            store.commit()
+            self.assertEqual(len(store.housekeeping_candidates(
+                Ticket.INACTIVE_CODES, 1e12, 0, 10)), 1)
+            store.close()
+
+    def test_stored_put_ticket(self):
+        # loading a ticket does not stat the local file
+        ticket = Ticket('/does/not/exist', '/zone/home/user/a',
+                        mode=Ticket.PUT, local_size=100, local_atime=1,
+                        local_ctime=2)
+        ticket = Ticket.from_json(json.loads(ticket.to_json()))
+        self.assertEqual(ticket.local_size, 100)
+
+    def test_import(self):
+        with Tempdir(prefix="Test_") as td:
+            ticket_dir = os.path.join(td, 'Tickets')
+            os.makedirs(ticket_dir)
+            for name in ['a', 'b']:
+                ticket = self._ticket(name)
+                with open(os.path.join(ticket_dir, name + '.json'),
+                          'w') as f:
+                    f.write(ticket.to_json())
+            with open(os.path.join(ticket_dir, 'broken.json'), 'w') as f:
+                json.dump({}, f)
+            store = TicketStore(os.path.join(td, 'tickets.db'))
+            store.import_ticket_dir(ticket_dir)
+            self.assertEqual(store.count(), 2)
+            self.assertEqual(os.listdir(ticket_dir), ['broken.json'])
+            store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import json
+import unittest
+from dm_irods.ticket import Ticket
+
+
+class TestTicket(unittest.TestCase):
+    def test_slots(self):
+        ticket = Ticket('/tmp/a', '/zone/home/user/a', mode=Ticket.GET)
+        self.assertFalse(hasattr(ticket, '__dict__'))
+        with self.assertRaises(AttributeError):
+            ticket.unknown_attribute = 1
+
+    def test_to_dict(self):
+        ticket = Ticket('/tmp/a', '/zone/home/user/a', mode=Ticket.GET)
+        item = ticket.to_dict()
+        self.assertEqual(item['status'], 'WAITING')
+        self.assertEqual(item['mode'], 'GET')
+        # a copy is returned
+        item['collection'] = '/zone/home/user'
+        self.assertNotIn('collection', ticket.to_dict())
+        ticket.transferred = 100
+        self.assertEqual(ticket.to_dict()['transferred'], 100)
+        ticket.status = Ticket.DONE
+        self.assertEqual(ticket.to_dict()['status'], 'DONE')
+
+    def test_json(self):
+        ticket = Ticket('/tmp/a', '/zone/home/user/a', mode=Ticket.GET,
+                        DMF_state='DUL')
+        ticket.block_hashes = ['x', None]
+        copy = Ticket.from_json(json.loads(ticket.to_json()))
+        self.assertEqual(copy.to_dict(), ticket.to_dict())
+        self.assertEqual(copy.block_hashes, ['x', None])
+        self.assertIsNone(copy.bundle_members)
+        self.assertIs(copy.DMF_state, ticket.DMF_state)
+
+    def test_collection(self):
+        ticket = Ticket('/tmp/a', '/zone/home/user/a', mode=Ticket.GET)
+        copy = Ticket.from_json(json.loads(
+            Ticket('/tmp/b', '/zone/home/user/b').to_json()))
+        self.assertEqual(ticket.collection, '/zone/home/user')
+        self.assertEqual(ticket.object, 'a')
+        # tickets of a collection share the string
+        self.assertIs(ticket.collection, copy.collection)
+
+
+if __name__ == '__main__':
+    unittest.main()
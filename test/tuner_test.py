@@ -0,0 +1,42 @@
+import unittest
+import os
+from .tempdir import Tempdir
+from dm_irods.tuner import TransferTuner
+
+MB = 1024 * 1024
+
+
+class TestTransferTuner(unittest.TestCase):
+    def test_aimd(self):
+        with Tempdir(prefix="Test_") as td:
+            tuning_file = os.path.join(td, 'tuning.json')
+            tuner = TransferTuner(tuning_file, 8 * MB, 4)
+            self.assertEqual(tuner.settings('host:resc', 'GET'), (8 * MB, 4))
+
+            # first sample: probe more streams
+            tuner.report('host:resc', 'GET', 8 * MB, 4, 1024 * MB, 10)
+            self.assertEqual(tuner.settings('host:resc', 'GET'), (8 * MB, 5))
+
+            # throughput collapses: halve streams, probe block size next
+            tuner.report('host:resc', 'GET', 8 * MB, 5, 1024 * MB, 20)
+            self.assertEqual(tuner.settings('host:resc', 'GET'), (8 * MB, 2))
+
+            # samples with other settings are ignored
+            tuner.report('host:resc', 'GET', 8 * MB, 1, 1024 * MB, 1)
+            self.assertEqual(tuner.settings('host:resc', 'GET'), (8 * MB, 2))
+
+            # settings are restored from the tuning file
+            tuner = TransferTuner(tuning_file, 8 * MB, 4)
+            self.assertEqual(tuner.settings('host:resc', 'GET'), (8 * MB, 2))
+            self.assertEqual(tuner.settings('host:resc', 'PUT'), (8 * MB, 4))
+
+    def test_small_transfer(self):
+        with Tempdir(prefix="Test_") as td:
+            tuner = TransferTuner(os.path.join(td, 'tuning.json'),
+                                  8 * MB, 4)
+            tuner.report('host:resc', 'PUT', 8 * MB, 4, MB, 1)
+            self.assertEqual(tuner.settings('host:resc', 'PUT'), (8 * MB, 4))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import os
+import unittest
+from .tempdir import Tempdir
+from dm_irods.walk import walk_tree
+from dm_irods.walk import batches
+
+
+class TestWalk(unittest.TestCase):
+    def test_walk_tree(self):
+        with Tempdir(prefix="Test_") as td:
+            os.makedirs(os.path.join(td, 'a', 'b'))
+            os.makedirs(os.path.join(td, 'c'))
+            for f in [['f1'], ['a', 'f2'], ['a', 'b', 'f3']]:
+                with open(os.path.join(td, *f), 'w') as fp:
+                    fp.write('x')
+            os.symlink(os.path.join(td, 'a'), os.path.join(td, 'link'))
+            entries = list(walk_tree(td))
+            paths = [os.path.relpath(p, td) for p, is_dir in entries]
+            self.assertEqual(sorted(paths),
+                             sorted(['f1', 'a', 'a/f2', 'a/b', 'a/b/f3',
+                                     'c', 'link']))
+            dirs = sorted(os.path.relpath(p, td)
+                          for p, is_dir in entries if is_dir)
+            self.assertEqual(dirs, ['a', 'a/b', 'c'])
+            # a directory comes before its contents
+            self.assertLess(paths.index('a'), paths.index('a/b/f3'))
+            self.assertLess(paths.index('a/b'), paths.index('a/b/f3'))
+
+    def test_batches(self):
+        self.assertEqual(list(batches(range(7), 3)),
+                         [[0, 1, 2], [3, 4, 5], [6]])
+        self.assertEqual(list(batches([], 3)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
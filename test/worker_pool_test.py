@@ -0,0 +1,46 @@
+import unittest
+import threading
+import time
+from dm_irods.worker_pool import WorkerPool
+
+
+class TestWorkerPool(unittest.TestCase):
+    def test_concurrent_jobs(self):
+        pool = WorkerPool('test', 3)
+        lock = threading.Lock()
+        state = {'running': 0, 'max_running': 0, 'done': 0}
+
+        def job():
+            with lock:
+                state['running'] += 1
+                state['max_running'] = max(state['max_running'],
+                                           state['running'])
+            time.sleep(0.1)
+            with lock:
+                state['running'] -= 1
+                state['done'] += 1
+
+        for i in range(9):
+            self.assertTrue(pool.submit(i, job))
+        while pool.num_pending() > 0:
+            time.sleep(0.01)
+        pool.shutdown()
+        self.assertEqual(state['done'], 9)
+        self.assertEqual(state['max_running'], 3)
+
+    def test_duplicate_key(self):
+        pool = WorkerPool('test', 1)
+        event = threading.Event()
+        self.assertTrue(pool.submit('a', event.wait))
+        self.assertFalse(pool.submit('a', event.wait))
+        self.assertTrue(pool.is_pending('a'))
+        event.set()
+        while pool.num_pending() > 0:
+            time.sleep(0.01)
+        self.assertFalse(pool.is_pending('a'))
+        self.assertTrue(pool.submit('a', event.wait))
+        pool.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()